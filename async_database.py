@@ -0,0 +1,63 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from database import Database
+from metrics import DB_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Методы с такими префиксами только читают и могут выполняться параллельно (WAL)
+READ_PREFIXES = ("get_", "count_")
+# Синхронные низкоуровневые методы, которые нельзя вызывать через фасад
+SYNC_ONLY = ("transaction", "get_connection", "init_db")
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database.
+
+    Повторяет публичные методы Database, но выполняет их вне event loop:
+    запись — в единственном потоке-писателе, чтение — в небольшом пуле потоков.
+    Каждый поток работает со своим долгоживущим соединением из ConnectionPool.
+    """
+
+    def __init__(self, database: Database, readers: int = 4):
+        self.sync = database
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or name in SYNC_ONLY:
+            raise AttributeError(f"{type(self).__name__} не предоставляет '{name}', используйте .sync")
+        method = getattr(self.sync, name)
+        if not callable(method):
+            return method
+        executor = self._readers if name.startswith(READ_PREFIXES) else self._writer
+
+        def timed(*args, **kwargs):
+            # Время в потоке БД, без ожидания свободного потока
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                DB_CALL_SECONDS.observe(name, time.perf_counter() - started)
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            # Переносим contextvars в поток, чтобы логирование/метрики видели текущий апдейт
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(executor, functools.partial(ctx.run, timed, *args, **kwargs))
+
+        # Кэшируем обёртку, чтобы __getattr__ не вызывался повторно
+        setattr(self, name, call)
+        return call
+
+    def close(self):
+        """Дождаться завершения запросов и закрыть соединения"""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.sync.close()
+        logger.info("Соединения с базой данных закрыты")
@@ -0,0 +1,4 @@
+"""Бенчмарки методов Database на синтетических базах (1k / 10k / 100k задач).
+
+Запуск: python -m bench [--tasks 1000 10000] [--baseline bench_results/<прошлый>.json]
+"""
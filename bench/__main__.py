@@ -0,0 +1,60 @@
+"""Запуск бенчмарков: python -m bench --tasks 1000 10000 --baseline bench_results/previous.json"""
+import argparse
+import logging
+import os
+import sys
+from bench import cases, dataset, report
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Замеры методов Database на синтетических базах")
+    parser.add_argument("--tasks", type=int, nargs="+", default=list(DEFAULT_SIZES), help="размеры баз (задач)")
+    parser.add_argument("--data-dir", default="bench_data", help="где хранить сгенерированные базы")
+    parser.add_argument("--out", default="bench_results", help="куда писать отчёт")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--threshold", type=float, default=report.REGRESSION_THRESHOLD,
+                        help="допустимый рост медианы (0.2 — на 20%%)")
+    parser.add_argument("--only", nargs="+", help="выполнить только замеры, в имени которых есть эти подстроки")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    # Database и миграции пишут в журнал на каждую базу и некоторые вызовы — в замерах это только шум
+    logging.getLogger("database").setLevel(logging.WARNING)
+    logging.getLogger("migrations").setLevel(logging.WARNING)
+
+    uncovered = cases.uncovered_methods()
+    if uncovered:
+        print(f"Нет замеров для методов: {', '.join(uncovered)}", file=sys.stderr)
+
+    env = report.environment(args.seed)
+    results = []
+    for tasks in args.tasks:
+        data = dataset.prepare(args.data_dir, tasks, args.seed)
+        print(f"База на {tasks} задач: {len(data.user_ids)} пользователей, {len(data.photo_paths)} фото")
+        results.extend(cases.run_cases(data, args.seed, args.only))
+
+    os.makedirs(args.out, exist_ok=True)
+    stamp = env['date'].replace(':', '').replace('-', '')
+    json_path = os.path.join(args.out, f"bench_{stamp}.json")
+    md_path = os.path.join(args.out, f"bench_{stamp}.md")
+    baseline = report.load_json(args.baseline) if args.baseline else None
+    report.save_json(json_path, env, results, uncovered)
+    with open(md_path, 'w', encoding='utf-8') as f:
+        f.write(report.render_markdown(env, results, uncovered, baseline, args.threshold))
+    print(f"Отчёт: {md_path}, данные: {json_path}")
+
+    if baseline:
+        found = report.regressions(results, baseline, args.threshold)
+        for r in found:
+            print(f"Регрессия: {r['case']} на {r['tasks']} задач — медиана {r['median'] * 1000:.3f} мс "
+                  f"(было {r['baseline'] * 1000:.3f} мс)", file=sys.stderr)
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
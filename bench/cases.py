@@ -0,0 +1,239 @@
+"""Замеры публичных методов Database: что вызывать, с какими аргументами и сколько раз."""
+import inspect
+import random
+import statistics
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from async_database import READ_PREFIXES
+from config import STATUS_NEW, STATUS_COMPLETED, STATUS_APPROVED
+from database import Database
+from bench.dataset import CATEGORIES, Dataset
+
+# Каждый замер повторяется, пока не наберётся MIN_ROUNDS повторов и TIME_BUDGET секунд (не больше MAX_ROUNDS)
+MIN_ROUNDS = 5
+MAX_ROUNDS = 200
+TIME_BUDGET = 0.5
+PAGE_SIZE = 10
+# Служебные методы Database, которые не замеряются
+NOT_BENCHMARKED = frozenset(("get_connection", "transaction", "close", "init_db"))
+
+
+class Case(NamedTuple):
+    """Один замер: setup готовит аргумент (не входит во время), run вызывает метод"""
+    name: str
+    method: str
+    run: Callable[[Database, Any], Any]
+    setup: Optional[Callable[[Database, "Context"], Any]] = None
+
+    @property
+    def writes(self) -> bool:
+        """Метод меняет данные: замер идёт на отдельной копии базы (как в AsyncDatabase — по префиксу)"""
+        return not self.method.startswith(READ_PREFIXES)
+
+
+class Context:
+    """Данные набора и генератор случайных чисел для подготовки аргументов"""
+
+    def __init__(self, dataset: Dataset, seed: int):
+        self.dataset = dataset
+        self.rng = random.Random(seed)
+        self._counter = 0
+
+    def task_id(self) -> int:
+        return self.rng.choice(self.dataset.task_ids)
+
+    def task_ids(self, n: int) -> List[int]:
+        return self.rng.sample(self.dataset.task_ids, min(n, len(self.dataset.task_ids)))
+
+    def user_id(self) -> int:
+        return self.rng.choice(self.dataset.user_ids)
+
+    def photo_paths(self, n: int) -> List[str]:
+        return self.rng.sample(self.dataset.photo_paths, min(n, len(self.dataset.photo_paths)))
+
+    def new_path(self) -> str:
+        self._counter += 1
+        return f"photos/bench/new_{self._counter}.jpg"
+
+    def new_task(self, db: Database, photos: int = 2) -> int:
+        """Создать задачу с фото для методов, которые её меняют или удаляют"""
+        path = self.new_path()
+        task_id = db.create_task(self.user_id(), "bench_new", path, "Задача для замера", self.rng.choice(CATEGORIES))
+        db.add_task_photos_bulk([(task_id, 'before', "bench_new", self.new_path()) for _ in range(photos)])
+        return task_id
+
+    def new_tasks_in_status(self, db: Database, n: int, status: str) -> str:
+        """Создать n задач в статусе status, которого нет у задач набора"""
+        task_ids = [self.new_task(db) for _ in range(n)]
+        with db.transaction() as cursor:
+            cursor.executemany("UPDATE tasks SET status = ? WHERE task_id = ?", [(status, t) for t in task_ids])
+        return status
+
+
+def _cold(prepare: Callable[[Database, Context], Any]) -> Callable[[Database, Context], Any]:
+    """Сбросить кэши Database перед вызовом: замер пути с запросом в базу"""
+    def setup(db: Database, ctx: Context):
+        db.users.clear()
+        db._task_counters_changed()
+        return prepare(db, ctx)
+    return setup
+
+
+def _warm(prepare: Callable[[Database, Context], int]) -> Callable[[Database, Context], int]:
+    """Загрузить пользователя в кэш перед вызовом: замер пути без запроса в базу"""
+    def setup(db: Database, ctx: Context):
+        user_id = prepare(db, ctx)
+        db.users.get(user_id)
+        return user_id
+    return setup
+
+
+CASES: List[Case] = [
+    # Пользователи
+    Case("get_user_role", "get_user_role", lambda db, a: db.get_user_role(a), _warm(lambda db, c: c.user_id())),
+    Case("get_user_role (без кэша)", "get_user_role", lambda db, a: db.get_user_role(a), _cold(lambda db, c: c.user_id())),
+    Case("get_username", "get_username", lambda db, a: db.get_username(a), _warm(lambda db, c: c.user_id())),
+    Case("get_usernames (50, без кэша)", "get_usernames", lambda db, a: db.get_usernames(a),
+         _cold(lambda db, c: [c.user_id() for _ in range(50)])),
+    Case("get_last_active", "get_last_active", lambda db, a: db.get_last_active(a), lambda db, c: c.user_id()),
+    Case("get_user_category", "get_user_category", lambda db, a: db.get_user_category(a),
+         _warm(lambda db, c: c.user_id())),
+    Case("get_users_by_category", "get_users_by_category", lambda db, a: db.get_users_by_category(a),
+         lambda db, c: c.rng.choice(CATEGORIES)),
+    Case("get_all_executors", "get_all_executors", lambda db, a: db.get_all_executors()),
+    Case("get_all_users", "get_all_users", lambda db, a: db.get_all_users()),
+    Case("get_all_managers", "get_all_managers", lambda db, a: db.get_all_managers()),
+    Case("set_user_role", "set_user_role", lambda db, a: db.set_user_role(a, f"user{a}", "executor", "Зал"),
+         lambda db, c: c.user_id()),
+    Case("set_user_category", "set_user_category", lambda db, a: db.set_user_category(a, f"user{a}", "Касса"),
+         lambda db, c: c.user_id()),
+    Case("update_last_active", "update_last_active", lambda db, a: db.update_last_active(a), lambda db, c: c.user_id()),
+    Case("mark_user_inactive", "mark_user_inactive", lambda db, a: db.mark_user_inactive(a), lambda db, c: c.user_id()),
+
+    # Задачи
+    Case("create_task", "create_task",
+         lambda db, a: db.create_task(a, "bench_new", "photos/bench/create.jpg", "Новая задача", "Зал"),
+         lambda db, c: c.user_id()),
+    Case("count_open_tasks_by_category", "count_open_tasks_by_category", lambda db, a: db.count_open_tasks_by_category()),
+    Case("count_open_tasks_by_category (без кэша)", "count_open_tasks_by_category",
+         lambda db, a: db.count_open_tasks_by_category(), _cold(lambda db, c: None)),
+    Case("count_tasks_by_status", "count_tasks_by_status", lambda db, a: db.count_tasks_by_status()),
+    Case("get_tasks (все)", "get_tasks", lambda db, a: db.get_tasks()),
+    Case("get_tasks (статус)", "get_tasks", lambda db, a: db.get_tasks(status=STATUS_COMPLETED)),
+    Case("get_tasks (статус и категория)", "get_tasks", lambda db, a: db.get_tasks(status=STATUS_NEW, category=a),
+         lambda db, c: c.rng.choice(CATEGORIES)),
+    Case("get_tasks_page (первая)", "get_tasks_page", lambda db, a: db.get_tasks_page(0, PAGE_SIZE)),
+    Case("get_tasks_page (первая, без кэша)", "get_tasks_page", lambda db, a: db.get_tasks_page(0, PAGE_SIZE),
+         _cold(lambda db, c: None)),
+    Case("get_tasks_page (стр. 50, OFFSET)", "get_tasks_page", lambda db, a: db.get_tasks_page(50, PAGE_SIZE)),
+    Case("get_tasks_page (стр. 50, курсор)", "get_tasks_page", lambda db, a: db.get_tasks_page(50, PAGE_SIZE, after=a),
+         lambda db, c: db.get_tasks_page(49, PAGE_SIZE)['cursor']),
+    Case("get_tasks_page (статус и категория)", "get_tasks_page",
+         lambda db, a: db.get_tasks_page(0, PAGE_SIZE, {'status': STATUS_NEW, 'category': a}),
+         lambda db, c: c.rng.choice(CATEGORIES)),
+    Case("get_task", "get_task", lambda db, a: db.get_task(a), lambda db, c: c.task_id()),
+    Case("update_task_status", "update_task_status",
+         lambda db, a: db.update_task_status(a[0], STATUS_COMPLETED, a[1], "bench_after", "photos/bench/after.jpg"),
+         lambda db, c: (c.task_id(), c.user_id())),
+    Case("update_task_comment", "update_task_comment", lambda db, a: db.update_task_comment(a, "Изменённый комментарий"),
+         lambda db, c: c.task_id()),
+    Case("update_task_photo", "update_task_photo", lambda db, a: db.update_task_photo(a[0], "bench_edit", a[1]),
+         lambda db, c: (c.task_id(), c.new_path())),
+    Case("reset_task_to_new", "reset_task_to_new", lambda db, a: db.reset_task_to_new(a), lambda db, c: c.task_id()),
+    Case("delete_task", "delete_task", lambda db, a: db.delete_task(a), lambda db, c: c.new_task(db)),
+    Case("delete_tasks (10)", "delete_tasks", lambda db, a: db.delete_tasks(a),
+         lambda db, c: [c.new_task(db) for _ in range(10)]),
+    Case("delete_tasks_by_status (10)", "delete_tasks_by_status", lambda db, a: db.delete_tasks_by_status(a),
+         lambda db, c: c.new_tasks_in_status(db, 10, "bench_purge")),
+
+    # Фото
+    Case("add_task_photo", "add_task_photo", lambda db, a: db.add_task_photo(a[0], 'after', "bench_photo", a[1]),
+         lambda db, c: (c.task_id(), c.new_path())),
+    Case("add_task_photos_bulk (10)", "add_task_photos_bulk", lambda db, a: db.add_task_photos_bulk(a),
+         lambda db, c: [(c.task_id(), 'after', "bench_photo", c.new_path()) for _ in range(10)]),
+    Case("update_task_photo_file_ids (10)", "update_task_photo_file_ids",
+         lambda db, a: db.update_task_photo_file_ids(a),
+         lambda db, c: [("bench_reuploaded", c.rng.randint(1, len(c.dataset.photo_paths))) for _ in range(10)]),
+    Case("update_task_photo_file_stats (50)", "update_task_photo_file_stats",
+         lambda db, a: db.update_task_photo_file_stats(a),
+         lambda db, c: [(c.rng.randint(50_000, 400_000), 1700000000, c.rng.randint(1, len(c.dataset.photo_paths)))
+                        for _ in range(50)]),
+    Case("get_task_photos", "get_task_photos", lambda db, a: db.get_task_photos(a), lambda db, c: c.task_id()),
+    Case("get_task_photos_bulk (страница)", "get_task_photos_bulk", lambda db, a: db.get_task_photos_bulk(a),
+         lambda db, c: c.task_ids(PAGE_SIZE)),
+    Case("get_photos_by_task_status", "get_photos_by_task_status",
+         lambda db, a: db.get_photos_by_task_status(STATUS_APPROVED, 'after')),
+    Case("delete_all_task_photos", "delete_all_task_photos", lambda db, a: db.delete_all_task_photos(a),
+         lambda db, c: c.new_task(db)),
+    Case("add_photo_variants", "add_photo_variants", lambda db, a: db.add_photo_variants(a),
+         lambda db, c: [(p, v, "bench_variant", c.new_path(), 800, 600)
+                        for p in c.photo_paths(1) for v in ('preview', 'report')]),
+    Case("get_photo_variants (50)", "get_photo_variants", lambda db, a: db.get_photo_variants(a, 'report'),
+         lambda db, c: c.photo_paths(50)),
+    Case("pin_photo_file", "pin_photo_file", lambda db, a: db.pin_photo_file(a), lambda db, c: c.new_path()),
+    Case("unpin_photo_files (10)", "unpin_photo_files", lambda db, a: db.unpin_photo_files(a),
+         lambda db, c: c.photo_paths(10)),
+    Case("get_orphan_photo_files", "get_orphan_photo_files", lambda db, a: db.get_orphan_photo_files()),
+    Case("claim_unreferenced_files (10, есть ссылки)", "claim_unreferenced_files",
+         lambda db, a: db.claim_unreferenced_files(a), lambda db, c: c.photo_paths(10)),
+    Case("get_tracked_photo_files (50)", "get_tracked_photo_files", lambda db, a: db.get_tracked_photo_files(a),
+         lambda db, c: c.photo_paths(50)),
+
+    # Состояние диалогов
+    Case("save_conversation_states (20)", "save_conversation_states", lambda db, a: db.save_conversation_states(a),
+         lambda db, c: [(c.user_id(), '{"task_step":"photo","task_category":"Зал"}') for _ in range(20)]),
+    Case("get_conversation_states", "get_conversation_states", lambda db, a: db.get_conversation_states()),
+    Case("delete_conversation_state", "delete_conversation_state", lambda db, a: db.delete_conversation_state(a),
+         lambda db, c: c.user_id()),
+]
+
+
+def uncovered_methods() -> List[str]:
+    """Публичные методы Database, для которых нет замера (появились после написания CASES)"""
+    public = {name for name, member in inspect.getmembers(Database, inspect.isfunction)
+              if not name.startswith("_") and name not in NOT_BENCHMARKED}
+    return sorted(public - {case.method for case in CASES})
+
+
+def measure(db: Database, case: Case, ctx: Context) -> Dict:
+    """Повторять вызов, пока не набран бюджет времени; время — только самого вызова"""
+    timings: List[float] = []
+    spent = 0.0
+    while len(timings) < MAX_ROUNDS and (len(timings) < MIN_ROUNDS or spent < TIME_BUDGET):
+        arg = case.setup(db, ctx) if case.setup else None
+        started = time.perf_counter()
+        case.run(db, arg)
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed)
+        spent += elapsed
+    timings.sort()
+    return {
+        'case': case.name,
+        'method': case.method,
+        'rounds': len(timings),
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'p95': timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        'mean': statistics.mean(timings),
+    }
+
+
+def run_cases(dataset: Dataset, seed: int = 1, only: Optional[List[str]] = None) -> List[Dict]:
+    """Выполнить замеры на наборе: чтение и запись — на разных копиях базы.
+
+    only — подстроки имён замеров, которые нужно выполнить.
+    """
+    read_db = Database(dataset.path)
+    write_db = Database(dataset.write_path)
+    ctx = Context(dataset, seed)
+    results = []
+    try:
+        for case in CASES:
+            if only and not any(part in case.name for part in only):
+                continue
+            db = write_db if case.writes else read_db
+            results.append({'tasks': dataset.tasks, **measure(db, case, ctx)})
+    finally:
+        read_db.close()
+        write_db.close()
+    return results
@@ -0,0 +1,142 @@
+"""Синтетические базы для бенчмарков: пользователи, задачи во всех статусах, фото до/после."""
+import logging
+import os
+import random
+import shutil
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple
+from config import STATUS_NEW, STATUS_COMPLETED, STATUS_APPROVED, STATUS_REDO
+from database import Database
+from migrations import SCHEMA_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Категории, как в стартовом меню бота
+CATEGORIES = ("Касса", "Саладет", "Панировка", "Улица", "Зал", "Прочее")
+# Доли статусов среди задач: большая часть открытых и завершённых, как в рабочей базе
+STATUS_WEIGHTS = ((STATUS_NEW, 40), (STATUS_REDO, 10), (STATUS_COMPLETED, 20), (STATUS_APPROVED, 30))
+# Сколько пользователей приходится на задачи (не меньше MIN_USERS)
+TASKS_PER_USER = 50
+MIN_USERS = 200
+MANAGER_SHARE = 0.05
+# Задачи равномерно распределены по этому периоду
+HISTORY_DAYS = 90
+# Меняется при изменении генератора: готовые шаблоны со старой версией пересоздаются
+GENERATOR_VERSION = 1
+
+
+class Dataset(NamedTuple):
+    """Сгенерированная база и то, что о ней нужно знать бенчмаркам.
+
+    path — копия для замеров чтения, write_path — такая же копия для замеров, которые меняют данные.
+    """
+    path: str
+    write_path: str
+    tasks: int
+    task_ids: List[int]
+    user_ids: List[int]
+    photo_paths: List[str]
+
+
+def _template_path(data_dir: str, tasks: int, seed: int) -> str:
+    return os.path.join(data_dir, f"dataset_{tasks}_s{seed}_v{SCHEMA_VERSION}.{GENERATOR_VERSION}.db")
+
+
+def _fill(db: Database, tasks: int, rng: random.Random):
+    users = max(MIN_USERS, tasks // TASKS_PER_USER)
+    now = datetime.utcnow()
+    user_rows = []
+    for user_id in range(1, users + 1):
+        role = "manager" if rng.random() < MANAGER_SHARE else "executor"
+        active = now - timedelta(minutes=rng.randrange(HISTORY_DAYS * 24 * 60))
+        user_rows.append((user_id, f"user{user_id}", role, rng.choice(CATEGORIES), active.isoformat(" ", "seconds")))
+
+    statuses = [status for status, _ in STATUS_WEIGHTS]
+    weights = [weight for _, weight in STATUS_WEIGHTS]
+    task_rows, photo_rows = [], []
+    for task_id in range(1, tasks + 1):
+        status = rng.choices(statuses, weights)[0]
+        created = now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 24 * 3600))
+        before = [f"photos/bench/{task_id}_b{i}.jpg" for i in range(rng.randint(1, 3))]
+        after = []
+        completed_by = completed_at = None
+        if status in (STATUS_COMPLETED, STATUS_APPROVED):
+            after = [f"photos/bench/{task_id}_a{i}.jpg" for i in range(rng.randint(1, 3))]
+            completed_by = rng.randint(1, users)
+            completed_at = (created + timedelta(hours=rng.randint(1, 48))).isoformat(" ", "seconds")
+        task_rows.append((
+            task_id, rng.randint(1, users), f"bench_{task_id}_b0", before[0], f"Синтетическая задача {task_id}",
+            status, rng.choice(CATEGORIES), completed_by, f"bench_{task_id}_a0" if after else None,
+            after[0] if after else None, created.isoformat(" ", "seconds"), completed_at,
+            "high" if rng.random() < 0.1 else "normal",
+        ))
+        for kind, paths in (("before", before), ("after", after)):
+            for path in paths:
+                photo_rows.append((task_id, kind, f"bench_{os.path.basename(path)}", path,
+                                   rng.randint(50_000, 400_000), int(created.timestamp())))
+
+    with db.transaction() as cursor:
+        cursor.executemany("""
+            INSERT INTO users (user_id, username, role, category, last_active) VALUES (?, ?, ?, ?, ?)
+        """, user_rows)
+        cursor.executemany("""
+            INSERT INTO tasks (task_id, created_by, photo_before_id, photo_before_path, comment, status, category,
+                               completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, task_rows)
+        cursor.executemany("""
+            INSERT INTO task_photos (task_id, kind, file_id, file_path, file_size, file_mtime)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, photo_rows)
+        cursor.execute("ANALYZE")
+    logger.info(f"Сгенерировано: {tasks} задач, {users} пользователей, {len(photo_rows)} фото")
+
+
+def _describe(db: Database) -> Dict[str, List]:
+    with db.transaction(readonly=True) as cursor:
+        cursor.execute("SELECT task_id FROM tasks ORDER BY task_id")
+        task_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT user_id FROM users ORDER BY user_id")
+        user_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT file_path FROM task_photos ORDER BY id")
+        photo_paths = [row[0] for row in cursor.fetchall()]
+    return {'task_ids': task_ids, 'user_ids': user_ids, 'photo_paths': photo_paths}
+
+
+def prepare(data_dir: str, tasks: int, seed: int = 1) -> Dataset:
+    """Рабочая копия синтетической базы на tasks задач.
+
+    Шаблон генерируется один раз и переиспользуется; бенчмарки пишут в копии,
+    поэтому каждый запуск начинается с одинаковых данных. Замеры записи получают свою копию,
+    чтобы созданные и удалённые ими строки не меняли то, что измеряют замеры чтения.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    template = _template_path(data_dir, tasks, seed)
+    if not os.path.exists(template):
+        logger.info(f"Генерирую базу на {tasks} задач: {template}")
+        tmp_path = template + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        db = Database(tmp_path)
+        try:
+            _fill(db, tasks, random.Random(seed))
+            # Переносим WAL в основной файл, чтобы шаблон копировался одним файлом
+            db.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            db.close()
+        os.replace(tmp_path, template)
+
+    work_path = os.path.join(data_dir, f"work_{tasks}.db")
+    write_path = os.path.join(data_dir, f"work_{tasks}_writes.db")
+    for path in (work_path, write_path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        shutil.copyfile(template, path)
+
+    db = Database(work_path)
+    try:
+        info = _describe(db)
+    finally:
+        db.close()
+    return Dataset(work_path, write_path, tasks, info['task_ids'], info['user_ids'], info['photo_paths'])
@@ -0,0 +1,105 @@
+"""Отчёт бенчмарков: JSON для сравнения запусков и Markdown для чтения."""
+import json
+import platform
+import sqlite3
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Насколько медиана может вырасти относительно прошлого запуска, прежде чем считаться регрессией
+REGRESSION_THRESHOLD = 0.20
+# Изменения меньше этого (в секундах) — шум, а не регрессия
+NOISE_FLOOR = 0.00005
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(seed: int) -> Dict:
+    return {
+        'date': datetime.utcnow().isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'seed': seed,
+    }
+
+
+def save_json(path: str, env: Dict, results: List[Dict], uncovered: List[str]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'environment': env, 'results': results, 'uncovered': uncovered}, f, ensure_ascii=False, indent=2)
+
+
+def load_json(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(results: List[Dict], baseline: Dict) -> Dict[Tuple[int, str], float]:
+    """Относительное изменение медианы к прошлому запуску: {(задач, замер): +0.35, ...}"""
+    previous = {(r['tasks'], r['case']): r['median'] for r in baseline.get('results', [])}
+    changes = {}
+    for r in results:
+        old = previous.get((r['tasks'], r['case']))
+        if old:
+            changes[(r['tasks'], r['case'])] = (r['median'] - old) / old
+    return changes
+
+
+def regressions(results: List[Dict], baseline: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[Dict]:
+    """Замеры, медиана которых выросла больше порога (и больше уровня шума)"""
+    previous = {(r['tasks'], r['case']): r['median'] for r in baseline.get('results', [])}
+    found = []
+    for r in results:
+        old = previous.get((r['tasks'], r['case']))
+        if old and r['median'] - old > NOISE_FLOOR and (r['median'] - old) / old > threshold:
+            found.append({**r, 'baseline': old})
+    return found
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.3f}"
+
+
+def render_markdown(env: Dict, results: List[Dict], uncovered: List[str], baseline: Optional[Dict] = None,
+                    threshold: float = REGRESSION_THRESHOLD) -> str:
+    changes = compare(results, baseline) if baseline else {}
+    flagged = {(r['tasks'], r['case']) for r in regressions(results, baseline, threshold)} if baseline else set()
+    lines = [
+        "# Бенчмарки Database",
+        "",
+        f"Дата: {env['date']}, ревизия: {env['revision'] or '—'}, Python {env['python']}, SQLite {env['sqlite']}",
+    ]
+    if baseline:
+        base_env = baseline.get('environment', {})
+        lines.append(f"Сравнение с запуском {base_env.get('date', '?')} (ревизия {base_env.get('revision') or '—'}), "
+                     f"порог регрессии {threshold:.0%}")
+    for tasks in sorted({r['tasks'] for r in results}):
+        lines += ["", f"## {tasks} задач", ""]
+        header = "| Замер | Повторов | Медиана, мс | p95, мс | Мин., мс |"
+        divider = "|---|---:|---:|---:|---:|"
+        if baseline:
+            header += " Изменение |"
+            divider += "---:|"
+        lines += [header, divider]
+        for r in results:
+            if r['tasks'] != tasks:
+                continue
+            row = f"| {r['case']} | {r['rounds']} | {_ms(r['median'])} | {_ms(r['p95'])} | {_ms(r['min'])} |"
+            if baseline:
+                change = changes.get((tasks, r['case']))
+                if change is None:
+                    row += " — |"
+                else:
+                    mark = " ⚠️" if (tasks, r['case']) in flagged else ""
+                    row += f" {change:+.0%}{mark} |"
+            lines.append(row)
+    if uncovered:
+        lines += ["", f"Методы без замеров: {', '.join(uncovered)}"]
+    return "\n".join(lines) + "\n"
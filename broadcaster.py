@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Optional
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram: ~30 сообщений в секунду на бота и ~1 сообщение в секунду в один чат
+GLOBAL_RATE = 25  # сообщений в секунду (с запасом)
+GLOBAL_BURST = 5  # сколько сообщений можно отправить разом сверх равномерного темпа
+PER_CHAT_INTERVAL = 1.0  # секунд между сообщениями в один чат
+MAX_CONCURRENCY = 8
+MAX_ATTEMPTS = 3
+PROGRESS_EVERY = 25  # как часто сообщать о прогрессе (в сообщениях)
+
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+class BroadcastResult(NamedTuple):
+    sent: int
+    failed: int
+    total: int
+
+
+class TokenBucket:
+    """Ведро токенов: не больше rate операций в секунду, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Broadcaster:
+    """Рассылка сообщений многим пользователям с ограничением параллельности и частоты.
+
+    Соблюдает общий лимит бота и лимит на один чат, при RetryAfter приостанавливает все
+    отправки на указанное Telegram время и повторяет сообщение, а не теряет его.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, per_chat_interval: float = PER_CHAT_INTERVAL,
+                 max_concurrency: int = MAX_CONCURRENCY):
+        self._bucket = TokenBucket(global_rate, capacity=GLOBAL_BURST)
+        self._per_chat_interval = per_chat_interval
+        self._max_concurrency = max_concurrency
+        self._next_chat_slot: Dict[int, float] = {}
+        self._paused_until = 0.0
+
+    async def _wait_chat_slot(self, chat_id: int):
+        now = time.monotonic()
+        slot = max(now, self._next_chat_slot.get(chat_id, 0.0))
+        self._next_chat_slot[chat_id] = slot + self._per_chat_interval
+        if len(self._next_chat_slot) > 10000:
+            # Забываем чаты, для которых ограничение уже не действует
+            self._next_chat_slot = {c: t for c, t in self._next_chat_slot.items() if t > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _wait_pause(self):
+        delay = self._paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._paused_until - time.monotonic()
+
+    async def _send_one(self, bot, chat_id: int, text: str, kwargs: Dict) -> bool:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self._wait_pause()
+            await self._wait_chat_slot(chat_id)
+            await self._bucket.acquire()
+            try:
+                await bot.send_message(chat_id, text, **kwargs)
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+                logger.warning(f"Флуд-контроль Telegram: пауза {retry_after} с (чат {chat_id}, попытка {attempt})")
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            except Exception as e:
+                logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                return False
+        logger.error(f"Сообщение пользователю {chat_id} не отправлено после {MAX_ATTEMPTS} попыток")
+        return False
+
+    async def send(self, bot, chat_ids: Iterable[int], text: str,
+                   progress: Optional[ProgressCallback] = None, **kwargs) -> BroadcastResult:
+        """Отправить одно сообщение всем chat_ids и дождаться окончания"""
+        chat_ids = list(dict.fromkeys(chat_ids))
+        total = len(chat_ids)
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+        done = sent = 0
+
+        async def worker(chat_id: int):
+            nonlocal done, sent
+            async with semaphore:
+                ok = await self._send_one(bot, chat_id, text, kwargs)
+            done += 1
+            sent += ok
+            if progress and done < total and done % PROGRESS_EVERY == 0:
+                try:
+                    await progress(done, total)
+                except Exception:
+                    logger.debug("Не удалось сообщить о прогрессе рассылки", exc_info=True)
+
+        await asyncio.gather(*(worker(chat_id) for chat_id in chat_ids))
+        return BroadcastResult(sent=sent, failed=total - sent, total=total)
+
+    def start(self, application, bot, chat_ids: Iterable[int], text: str,
+              progress: Optional[ProgressCallback] = None,
+              on_done: Optional[Callable[[BroadcastResult], Awaitable[None]]] = None, **kwargs) -> asyncio.Task:
+        """Запустить рассылку в фоне (задача приложения: при остановке бот дождётся её окончания)"""
+
+        async def run():
+            result = await self.send(bot, chat_ids, text, progress=progress, **kwargs)
+            logger.info(f"Рассылка завершена: отправлено {result.sent} из {result.total}")
+            if on_done:
+                await on_done(result)
+            return result
+
+        return application.create_task(run())
@@ -5,6 +5,30 @@ MANAGER_CODE = "1272"  # Код доступа для менеджера
 DEV_ID = 680176506  # например: 123456789
 # Список VIP ID, которые автоматически получают роль менеджера без ввода кода
 VIP_IDS = [680176506,1047674669]  # заполните списком целых чисел [11111111, 22222222]
+# Сколько обновлений обрабатывать одновременно (обновления одного пользователя всё равно идут по очереди)
+CONCURRENT_UPDATES = 16
+
+# Какие уменьшенные копии фото отправлять при проверке задач и в отчёте: "" — оригиналы (по умолчанию),
+# "preview" (~320 px) или "report" (~800 px). Скачиваются только копии, указанные здесь
+REVIEW_PHOTO_VARIANT = ""
+REPORT_PHOTO_VARIANT = ""
+
+# Режим webhook (python main.py --webhook): Telegram сам присылает обновления на наш HTTP-сервер
+WEBHOOK_LISTEN = "0.0.0.0"  # адрес, на котором слушает встроенный сервер
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "telegram"  # путь на сервере: http://<host>:<port>/telegram
+WEBHOOK_URL = ""  # обязателен для --webhook: публичный HTTPS-адрес, например https://bot.example.com/telegram
+WEBHOOK_SECRET_TOKEN = ""  # заголовок X-Telegram-Bot-Api-Secret-Token; пустая строка — без проверки
+
+# Метрики Prometheus (http://<адрес>:<порт>/metrics); 0 — не запускать
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT = 0
+
+# Журнал медленных SQL-запросов с планом EXPLAIN QUERY PLAN (команда /slowlog для DEV_ID); 0 — не записывать
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG = "slow_queries.log"
+SLOW_QUERY_LOG_MAX_BYTES = 1_000_000
+SLOW_QUERY_LOG_BACKUPS = 3
 
 # Статусы задач
 STATUS_NEW = "Новая"
@@ -1,330 +1,428 @@
 import sqlite3
 import os
+import sys
+import time
 import logging
-from typing import Optional, List, Dict, Tuple
+import threading
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Tuple, Iterator
 from datetime import datetime
+from migrations import apply_migrations
+from instrumentation import count_connection, count_rows, count_sql
+from config import STATUS_NEW, STATUS_REDO, SLOW_QUERY_THRESHOLD_MS
+from user_directory import UserDirectory, UserInfo
+import slow_queries
 
 logger = logging.getLogger(__name__)
 
 DB_NAME = "restaurant_cleaner.db"
+# Сколько значений подставлять в один запрос вида IN (...)
+PARAMS_CHUNK = 500
+# Сколько новый файл фото защищён от удаления до появления ссылки на него (секунд)
+PHOTO_PIN_SECONDS = 600
+
+# Настройки, которые применяются к каждому соединению один раз при открытии
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16384",  # ~16 МБ кэша страниц
+    "PRAGMA mmap_size=134217728",  # 128 МБ memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+# Запросы дольше этого (выполнение вместе с чтением строк) попадают в журнал медленных запросов
+SLOW_QUERY_SECONDS = SLOW_QUERY_THRESHOLD_MS / 1000 if SLOW_QUERY_THRESHOLD_MS else float("inf")
+
+
+def _calling_method() -> str:
+    """Метод Database, из которого выполнен запрос (ищем по стеку только для медленных запросов)"""
+    frame = sys._getframe(2)
+    outside = None
+    while frame is not None:
+        if isinstance(frame.f_locals.get('self'), Database):
+            return frame.f_code.co_name
+        if outside is None and frame.f_code.co_filename != __file__:
+            outside = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return outside or "?"
+
+
+class CountingCursor(sqlite3.Cursor):
+    """Курсор, который засчитывает запросы и прочитанные строки текущему обновлению (instrumentation).
+
+    Время запроса копится от execute до последнего чтения строк: SQLite выполняет SELECT по мере
+    чтения. Как только оно превышает SLOW_QUERY_SECONDS, запрос один раз уходит в slow_queries.
+    """
+    _statement = None
+    _elapsed = 0.0
+
+    def _timed(self, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+            if self._statement is not None and self._elapsed >= SLOW_QUERY_SECONDS:
+                statement, self._statement = self._statement, None
+                try:
+                    slow_queries.record(self.connection, _calling_method(), *statement, self._elapsed)
+                except Exception as e:
+                    logger.error(f"Не удалось записать медленный запрос: {e}")
+
+    def execute(self, sql, parameters=()):
+        count_sql()
+        self._statement, self._elapsed = (sql, parameters, False), 0.0
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        count_sql()
+        # Генератор параметров был бы исчерпан к моменту записи в журнал
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        self._statement, self._elapsed = (sql, seq_of_parameters, True), 0.0
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is not None:
+            count_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size if size is not None else self.arraysize)
+        count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        count_rows(len(rows))
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+class ConnectionPool:
+    """Долгоживущие соединения с SQLite: одно соединение на поток на всё время работы процесса"""
+
+    def __init__(self, db_name: str = DB_NAME):
+        self.db_name = db_name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def _open(self) -> sqlite3.Connection:
+        # isolation_level=None — транзакциями управляем сами через transaction()
+        conn = sqlite3.connect(self.db_name, isolation_level=None, check_same_thread=False,
+                               factory=CountingConnection)
+        count_connection()
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._connections.append(conn)
+        logger.debug(f"Открыто соединение с {self.db_name} для потока {threading.get_ident()}")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (открывается при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self, readonly: bool = False) -> Iterator[sqlite3.Cursor]:
+        """Транзакция на соединении текущего потока.
+
+        Запись открывается через BEGIN IMMEDIATE, чтобы сразу взять блокировку записи.
+        Вложенные вызовы выполняются внутри внешней транзакции.
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield cursor
+            finally:
+                self._local.depth -= 1
+                cursor.close()
+            return
+        conn.execute("BEGIN" if readonly else "BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield cursor
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.depth = 0
+            cursor.close()
+
+    def close_all(self):
+        """Закрыть все открытые соединения (при остановке бота)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка при закрытии соединения: {e}")
+        self._local = threading.local()
 
 
 class Database:
-    def __init__(self):
+    def __init__(self, db_name: str = DB_NAME):
+        self.pool = ConnectionPool(db_name)
+        # Кэш счётчиков открытых задач по категориям для стартового меню
+        self._open_counts: Optional[Dict[str, int]] = None
+        # Число задач для постраничного списка по фильтру (status, category); сбрасывается с _open_counts
+        self._page_totals: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+        self._counts_generation = 0
+        self._counts_lock = threading.Lock()
+        # Кэш пользователей: username, роль и категория по user_id
+        self.users = UserDirectory(self._load_users)
         self.init_db()
 
     def get_connection(self):
-        return sqlite3.connect(DB_NAME)
+        return self.pool.connection()
 
-    def init_db(self):
-        """Инициализация базы данных"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def transaction(self, readonly: bool = False):
+        return self.pool.transaction(readonly=readonly)
 
-        # Таблица пользователей
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                role TEXT DEFAULT 'executor',
-                category TEXT,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Таблица задач
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS tasks (
-                task_id INTEGER PRIMARY KEY,
-                created_by INTEGER,
-                photo_before_id TEXT,
-                photo_before_path TEXT,
-                comment TEXT,
-                status TEXT DEFAULT 'Новая',
-                category TEXT,
-                completed_by INTEGER,
-                photo_after_id TEXT,
-                photo_after_path TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                FOREIGN KEY (created_by) REFERENCES users(user_id),
-                FOREIGN KEY (completed_by) REFERENCES users(user_id)
-            )
-        """)
-
-        # Добавляем поле category в tasks, если его нет
-        try:
-            cursor.execute("ALTER TABLE tasks ADD COLUMN category TEXT")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        # Добавляем поле priority в tasks, если его нет
-        try:
-            cursor.execute("ALTER TABLE tasks ADD COLUMN priority TEXT DEFAULT 'normal'")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
+    def close(self):
+        self.pool.close_all()
 
-        # Добавляем поле category в users, если его нет
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN category TEXT")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        # Добавляем поле last_active в users, если его нет
-        try:
-            # Проверяем, существует ли колонка
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [row[1] for row in cursor.fetchall()]
-            if 'last_active' not in columns:
-                # SQLite не позволяет добавлять колонку с DEFAULT CURRENT_TIMESTAMP
-                # Добавляем колонку без DEFAULT, затем обновляем существующие записи
-                cursor.execute("ALTER TABLE users ADD COLUMN last_active TIMESTAMP")
-                cursor.execute("UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE last_active IS NULL")
-                conn.commit()
-        except sqlite3.OperationalError as e:
-            # Поле уже существует или другая ошибка
-            pass
-
-        conn.commit()
-        conn.close()
-
-    def _ensure_task_photos_table(self):
-        """Вспомогательно: создать таблицу для нескольких фото, если ее нет"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS task_photos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                task_id INTEGER NOT NULL,
-                kind TEXT CHECK(kind IN ('before','after')) NOT NULL,
-                file_id TEXT,
-                file_path TEXT,
-                FOREIGN KEY (task_id) REFERENCES tasks(task_id) ON DELETE CASCADE
-            )
-        """)
-        conn.commit()
-        conn.close()
+    def init_db(self):
+        """Инициализация базы данных: один раз при старте доводим схему до актуальной версии"""
+        version = apply_migrations(self.pool)
+        logger.info(f"Схема базы данных: версия {version}")
+
+    @staticmethod
+    def _photo_from_row(r) -> Dict:
+        return {'id': r[0], 'task_id': r[1], 'kind': r[2], 'file_id': r[3], 'file_path': r[4],
+                'file_size': r[5], 'file_mtime': r[6]}
+
+    @staticmethod
+    def _file_stats(file_path: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+        if file_path:
+            try:
+                st = os.stat(file_path)
+                return st.st_size, int(st.st_mtime)
+            except OSError:
+                pass
+        return None, None
 
     def add_task_photo(self, task_id: int, kind: str, file_id: str, file_path: str):
         """Добавить фотографию к задаче (много фотографий)"""
-        self._ensure_task_photos_table()
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO task_photos (task_id, kind, file_id, file_path)
-            VALUES (?, ?, ?, ?)
-        """, (task_id, kind, file_id, file_path))
-        conn.commit()
-        conn.close()
+        self.add_task_photos_bulk([(task_id, kind, file_id, file_path)])
+
+    def add_task_photos_bulk(self, photos: List[Tuple[int, str, str, str]]):
+        """Добавить сразу несколько фото одной вставкой: [(task_id, kind, file_id, file_path), ...]"""
+        if not photos:
+            return
+        rows = [(task_id, kind, file_id, file_path, *self._file_stats(file_path))
+                for task_id, kind, file_id, file_path in photos]
+        with self.transaction() as cursor:
+            cursor.executemany("""
+                INSERT INTO task_photos (task_id, kind, file_id, file_path, file_size, file_mtime)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def update_task_photo_file_ids(self, file_ids: List[Tuple[str, int]]):
+        """Сохранить новые file_id фото после повторной загрузки файлов в Telegram: [(file_id, photo_id), ...]"""
+        if not file_ids:
+            return
+        with self.transaction() as cursor:
+            cursor.executemany("UPDATE task_photos SET file_id = ? WHERE id = ?", file_ids)
+
+    def update_task_photo_file_stats(self, stats: List[Tuple[Optional[int], Optional[int], int]]):
+        """Сохранить размер и время изменения файлов фото: [(file_size, file_mtime, photo_id), ...]"""
+        if not stats:
+            return
+        with self.transaction() as cursor:
+            cursor.executemany("UPDATE task_photos SET file_size = ?, file_mtime = ? WHERE id = ?", stats)
 
     def get_task_photos(self, task_id: int) -> List[Dict]:
         """Получить список всех фотографий задачи"""
-        self._ensure_task_photos_table()
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, task_id, kind, file_id, file_path
-            FROM task_photos WHERE task_id = ?
-        """, (task_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [{'id': r[0], 'task_id': r[1], 'kind': r[2], 'file_id': r[3], 'file_path': r[4]} for r in rows]
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("""
+                SELECT id, task_id, kind, file_id, file_path, file_size, file_mtime
+                FROM task_photos WHERE task_id = ?
+            """, (task_id,))
+            rows = cursor.fetchall()
+        return [self._photo_from_row(r) for r in rows]
+
+    def get_task_photos_bulk(self, task_ids: List[int], kind: Optional[str] = None) -> Dict[int, Dict[str, List[Dict]]]:
+        """Получить фотографии сразу для многих задач: {task_id: {kind: [фото, ...]}}"""
+        result: Dict[int, Dict[str, List[Dict]]] = {task_id: {} for task_id in task_ids}
+        ids = list(result)
+        with self.transaction(readonly=True) as cursor:
+            # Разбиваем на части, чтобы не упереться в лимит параметров SQLite
+            for i in range(0, len(ids), PARAMS_CHUNK):
+                chunk = ids[i:i + PARAMS_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                if kind:
+                    cursor.execute(f"""
+                        SELECT id, task_id, kind, file_id, file_path, file_size, file_mtime
+                        FROM task_photos WHERE task_id IN ({placeholders}) AND kind = ?
+                        ORDER BY task_id, id
+                    """, (*chunk, kind))
+                else:
+                    cursor.execute(f"""
+                        SELECT id, task_id, kind, file_id, file_path, file_size, file_mtime
+                        FROM task_photos WHERE task_id IN ({placeholders})
+                        ORDER BY task_id, id
+                    """, chunk)
+                for r in cursor.fetchall():
+                    photo = self._photo_from_row(r)
+                    result[r[1]].setdefault(r[2], []).append(photo)
+        return result
+
+    def get_photos_by_task_status(self, status: str, kind: str) -> List[Dict]:
+        """Фото вида kind всех задач со статусом status одним запросом (новые задачи первыми)"""
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("""
+                SELECT p.id, p.task_id, p.kind, p.file_id, p.file_path, p.file_size, p.file_mtime
+                FROM tasks t
+                JOIN task_photos p ON p.task_id = t.task_id AND p.kind = ?
+                WHERE t.status = ?
+                ORDER BY t.created_at DESC, t.task_id DESC, p.id
+            """, (kind, status))
+            rows = cursor.fetchall()
+        return [self._photo_from_row(r) for r in rows]
+
+    def add_photo_variants(self, variants: List[Tuple[str, str, str, str, int, int]]):
+        """Сохранить уменьшенные копии фото: [(source_path, variant, file_id, file_path, width, height), ...]"""
+        if not variants:
+            return
+        with self.transaction() as cursor:
+            cursor.executemany("""
+                INSERT INTO photo_variants (source_path, variant, file_id, file_path, width, height)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source_path, variant) DO UPDATE SET
+                    file_id = excluded.file_id, file_path = excluded.file_path,
+                    width = excluded.width, height = excluded.height
+            """, variants)
+
+    def get_photo_variants(self, source_paths: List[str], variant: Optional[str] = None) -> Dict[str, Dict[str, Dict]]:
+        """Уменьшенные копии фото: {source_path: {variant: {'file_id', 'file_path', 'width', 'height'}}}"""
+        result: Dict[str, Dict[str, Dict]] = {}
+        paths = list(dict.fromkeys(p for p in source_paths if p))
+        with self.transaction(readonly=True) as cursor:
+            for i in range(0, len(paths), PARAMS_CHUNK):
+                chunk = paths[i:i + PARAMS_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                params = list(chunk)
+                where = f"source_path IN ({placeholders})"
+                if variant:
+                    where += " AND variant = ?"
+                    params.append(variant)
+                cursor.execute(f"""
+                    SELECT source_path, variant, file_id, file_path, width, height
+                    FROM photo_variants WHERE {where}
+                """, params)
+                for r in cursor.fetchall():
+                    result.setdefault(r[0], {})[r[1]] = {'file_id': r[2], 'file_path': r[3],
+                                                         'width': r[4], 'height': r[5]}
+        return result
 
     def delete_all_task_photos(self, task_id: int):
         """Удалить все фото задачи"""
-        self._ensure_task_photos_table()
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM task_photos WHERE task_id = ?", (task_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM task_photos WHERE task_id = ?", (task_id,))
+
+    def _load_users(self, user_ids: List[int]) -> Dict[int, UserInfo]:
+        """Загрузить пользователей из БД одним запросом (для UserDirectory)"""
+        ids = list(user_ids)
+        users: Dict[int, UserInfo] = {}
+        with self.transaction(readonly=True) as cursor:
+            for i in range(0, len(ids), PARAMS_CHUNK):
+                chunk = ids[i:i + PARAMS_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"SELECT user_id, username, role, category FROM users WHERE user_id IN ({placeholders})", chunk)
+                for row in cursor.fetchall():
+                    users[row[0]] = UserInfo(row[1], row[2], row[3])
+        return users
 
     def get_user_role(self, user_id: int) -> str:
         """Получить роль пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT role FROM users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else "executor"
+        info = self.users.get(user_id)
+        return info.role if info else "executor"
 
     def get_username(self, user_id: int) -> Optional[str]:
         """Получить username пользователя по user_id"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT username FROM users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        info = self.users.get(user_id)
+        return info.username if info else None
+
+    def get_usernames(self, user_ids: List[int]) -> Dict[int, Optional[str]]:
+        """Получить username сразу для многих пользователей"""
+        return {user_id: (info.username if info else None) for user_id, info in self.users.get_many(user_ids).items()}
 
     def get_last_active(self, user_id: int) -> Optional[datetime]:
         """Получить время последней активности пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
+        with self.transaction(readonly=True) as cursor:
             cursor.execute("SELECT last_active FROM users WHERE user_id = ?", (user_id,))
             result = cursor.fetchone()
-            conn.close()
-            if result and result[0]:
-                try:
-                    return datetime.fromisoformat(result[0])
-                except ValueError:
-                    return None
-            return None
-        except sqlite3.OperationalError as e:
-            # Если колонки нет, добавляем её
-            if "no such column: last_active" in str(e):
-                try:
-                    # SQLite не позволяет добавлять колонку с DEFAULT CURRENT_TIMESTAMP
-                    # Добавляем колонку без DEFAULT, затем обновляем существующие записи
-                    cursor.execute("ALTER TABLE users ADD COLUMN last_active TIMESTAMP")
-                    cursor.execute("UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE last_active IS NULL")
-                    conn.commit()
-                    conn.close()
-                    # Повторяем запрос
-                    conn = self.get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT last_active FROM users WHERE user_id = ?", (user_id,))
-                    result = cursor.fetchone()
-                    conn.close()
-                    if result and result[0]:
-                        try:
-                            return datetime.fromisoformat(result[0])
-                        except ValueError:
-                            return None
-                except Exception as ex:
-                    logger.error(f"Ошибка при добавлении колонки last_active: {ex}")
-                    conn.close()
-                    return None
-            else:
-                conn.close()
+        if result and result[0]:
+            try:
+                return datetime.fromisoformat(result[0])
+            except ValueError:
                 return None
+        return None
 
     def set_user_role(self, user_id: int, username: str, role: str, category: Optional[str] = None):
         """Установить роль пользователя"""
         logger.debug(f"set_user_role вызван, user_id={user_id}, role={role}, category={category}")
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            if category:
-                logger.debug("Выполняю INSERT OR REPLACE с категорией")
-                cursor.execute("""
-                    INSERT OR REPLACE INTO users (user_id, username, role, category, last_active)
-                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                """, (user_id, username, role, category))
-            else:
-                logger.debug("Выполняю INSERT OR REPLACE без категории")
-                cursor.execute("""
-                    INSERT OR REPLACE INTO users (user_id, username, role, last_active)
-                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                """, (user_id, username, role))
-            conn.commit()
+            with self.transaction() as cursor:
+                if category:
+                    logger.debug("Выполняю INSERT OR REPLACE с категорией")
+                    cursor.execute("""
+                        INSERT OR REPLACE INTO users (user_id, username, role, category, last_active)
+                        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    """, (user_id, username, role, category))
+                else:
+                    logger.debug("Выполняю INSERT OR REPLACE без категории")
+                    cursor.execute("""
+                        INSERT OR REPLACE INTO users (user_id, username, role, last_active)
+                        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                    """, (user_id, username, role))
             logger.debug("Коммит выполнен")
-            # Проверяем, что сохранилось
-            cursor.execute("SELECT category FROM users WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-            logger.debug(f"Проверка после set_user_role: category={result[0] if result else None}")
-            conn.close()
-        except sqlite3.OperationalError as e:
-            logger.error(f"OperationalError в set_user_role: {e}")
-            # Если колонки нет, добавляем её
-            if "no such column: last_active" in str(e):
-                try:
-                    # SQLite не позволяет добавлять колонку с DEFAULT CURRENT_TIMESTAMP
-                    # Добавляем колонку без DEFAULT, затем обновляем существующие записи
-                    cursor.execute("ALTER TABLE users ADD COLUMN last_active TIMESTAMP")
-                    cursor.execute("UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE last_active IS NULL")
-                    conn.commit()
-                    # Теперь повторяем операцию
-                    if category:
-                        cursor.execute("""
-                            INSERT OR REPLACE INTO users (user_id, username, role, category, last_active)
-                            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-                        """, (user_id, username, role, category))
-                    else:
-                        cursor.execute("""
-                            INSERT OR REPLACE INTO users (user_id, username, role, last_active)
-                            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                        """, (user_id, username, role))
-                    conn.commit()
-                    logger.debug("Колонка last_active добавлена и данные обновлены")
-                except Exception as ex:
-                    logger.error(f"Исключение при обработке ошибки: {ex}", exc_info=True)
-            conn.close()
         except Exception as e:
-            logger.error(f"Общая ошибка в set_user_role: {e}", exc_info=True)
-            conn.close()
+            logger.error(f"Ошибка в set_user_role: {e}", exc_info=True)
+        self.users.invalidate(user_id)
 
     def set_user_category(self, user_id: int, username: str, category: str):
         """Установить категорию пользователя"""
         logger.debug(f"set_user_category вызван, user_id={user_id}, category={category}")
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            # Пытаемся обновить только категорию, не затирая роль
-            logger.debug(f"Выполняю UPDATE для user_id={user_id}")
-            cursor.execute("UPDATE users SET username = ?, category = ?, last_active = CURRENT_TIMESTAMP WHERE user_id = ?", (username, category, user_id))
-            logger.debug(f"rowcount={cursor.rowcount}")
-            if cursor.rowcount == 0:
-                # Если пользователя нет, создаем как исполнителя по умолчанию
-                logger.debug("Пользователь не найден, создаю нового")
-                cursor.execute("INSERT INTO users (user_id, username, role, category, last_active) VALUES (?, ?, 'executor', ?, CURRENT_TIMESTAMP)", (user_id, username, category))
-            conn.commit()
+            with self.transaction() as cursor:
+                # Пытаемся обновить только категорию, не затирая роль
+                cursor.execute("UPDATE users SET username = ?, category = ?, last_active = CURRENT_TIMESTAMP WHERE user_id = ?", (username, category, user_id))
+                logger.debug(f"rowcount={cursor.rowcount}")
+                if cursor.rowcount == 0:
+                    # Если пользователя нет, создаем как исполнителя по умолчанию
+                    logger.debug("Пользователь не найден, создаю нового")
+                    cursor.execute("INSERT INTO users (user_id, username, role, category, last_active) VALUES (?, ?, 'executor', ?, CURRENT_TIMESTAMP)", (user_id, username, category))
             logger.debug("Коммит выполнен в set_user_category")
-            # Проверяем, что сохранилось
-            cursor.execute("SELECT category FROM users WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-            logger.debug(f"Проверка после set_user_category: category={result[0] if result else None}")
-            conn.close()
-        except sqlite3.OperationalError as e:
-            logger.error(f"OperationalError в set_user_category: {e}")
-            # Если колонки нет, добавляем её
-            if "no such column: last_active" in str(e):
-                try:
-                    # SQLite не позволяет добавлять колонку с DEFAULT CURRENT_TIMESTAMP
-                    # Добавляем колонку без DEFAULT, затем обновляем существующие записи
-                    cursor.execute("ALTER TABLE users ADD COLUMN last_active TIMESTAMP")
-                    cursor.execute("UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE last_active IS NULL")
-                    conn.commit()
-                    # Теперь повторяем операцию
-                    cursor.execute("UPDATE users SET username = ?, category = ?, last_active = CURRENT_TIMESTAMP WHERE user_id = ?", (username, category, user_id))
-                    if cursor.rowcount == 0:
-                        cursor.execute("INSERT INTO users (user_id, username, role, category, last_active) VALUES (?, ?, 'executor', ?, CURRENT_TIMESTAMP)", (user_id, username, category))
-                    conn.commit()
-                    logger.debug("Колонка last_active добавлена и данные обновлены в set_user_category")
-                except Exception as ex:
-                    logger.error(f"Исключение при обработке ошибки в set_user_category: {ex}", exc_info=True)
-            conn.close()
         except Exception as e:
-            logger.error(f"Общая ошибка в set_user_category: {e}", exc_info=True)
-            conn.close()
+            logger.error(f"Ошибка в set_user_category: {e}", exc_info=True)
+        self.users.invalidate(user_id)
 
     def update_last_active(self, user_id: int):
         """Обновить время последней активности"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
+        with self.transaction() as cursor:
             cursor.execute("UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE user_id = ?", (user_id,))
-            conn.commit()
-            conn.close()
-        except sqlite3.OperationalError as e:
-            # Если колонки нет, добавляем её
-            if "no such column: last_active" in str(e):
-                try:
-                    cursor.execute("ALTER TABLE users ADD COLUMN last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                    conn.commit()
-                    cursor.execute("UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE user_id = ?", (user_id,))
-                    conn.commit()
-                except Exception:
-                    pass
-            conn.close()
 
     def mark_user_inactive(self, user_id: int):
         """Перевести пользователя в статус неактивного"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
+        with self.transaction() as cursor:
             cursor.execute("""
                 UPDATE users
                 SET role = 'inactive',
@@ -332,241 +430,419 @@ class Database:
                     last_active = CURRENT_TIMESTAMP
                 WHERE user_id = ?
             """, (user_id,))
-            conn.commit()
-            conn.close()
-        except sqlite3.OperationalError as e:
-            # Если колонки нет, добавляем её
-            if "no such column: last_active" in str(e):
-                try:
-                    cursor.execute("ALTER TABLE users ADD COLUMN last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-                    conn.commit()
-                    cursor.execute("""
-                        UPDATE users
-                        SET role = 'inactive',
-                            category = NULL,
-                            last_active = CURRENT_TIMESTAMP
-                        WHERE user_id = ?
-                    """, (user_id,))
-                    conn.commit()
-                except Exception:
-                    pass
-            conn.close()
+        self.users.invalidate(user_id)
 
     def get_user_category(self, user_id: int) -> Optional[str]:
         """Получить категорию пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT category FROM users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result and result[0] else None
+        info = self.users.get(user_id)
+        return info.category if info and info.category else None
 
     def get_users_by_category(self, category: str) -> List[Dict]:
         """Получить список пользователей по категории"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, username FROM users WHERE category = ?", (category,))
-        rows = cursor.fetchall()
-        conn.close()
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("SELECT user_id, username FROM users WHERE category = ?", (category,))
+            rows = cursor.fetchall()
         return [{'user_id': row[0], 'username': row[1]} for row in rows]
 
     def create_task(self, created_by: int, photo_id: str, photo_path: str, comment: str, category: str, priority: str = 'normal') -> int:
         """Создать новую задачу с минимальным доступным ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Находим минимальный свободный ID
-        cursor.execute("SELECT task_id FROM tasks ORDER BY task_id")
-        existing_ids = {row[0] for row in cursor.fetchall()}
-        
-        # Ищем минимальный свободный ID
-        task_id = 1
-        while task_id in existing_ids:
-            task_id += 1
-        
-        # Вставляем задачу с найденным ID
-        cursor.execute("""
-            INSERT INTO tasks (task_id, created_by, photo_before_id, photo_before_path, comment, status, category, priority)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (task_id, created_by, photo_id, photo_path, comment, "Новая", category, priority))
-        
-        conn.commit()
-        conn.close()
+        # BEGIN IMMEDIATE в transaction() держит блокировку записи между выбором ID и вставкой,
+        # поэтому два менеджера не получат один и тот же номер
+        with self.transaction() as cursor:
+            # Минимальный освободившийся номер, иначе следующий после максимального
+            cursor.execute("""
+                SELECT COALESCE(
+                    (SELECT MIN(task_id) FROM free_task_ids),
+                    (SELECT IFNULL(MAX(task_id), 0) + 1 FROM tasks)
+                )
+            """)
+            task_id = cursor.fetchone()[0]
+
+            # Вставляем задачу с найденным ID (триггер уберёт номер из free_task_ids)
+            cursor.execute("""
+                INSERT INTO tasks (task_id, created_by, photo_before_id, photo_before_path, comment, status, category, priority)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (task_id, created_by, photo_id, photo_path, comment, "Новая", category, priority))
+        self._task_counters_changed(new_category=category)
         return task_id
 
+    def _task_counters_changed(self, new_category: Optional[str] = None):
+        """Сообщить кэшу счётчиков об изменении задач (вызывается после коммита).
+
+        Новая задача учитывается на месте, остальные изменения сбрасывают кэш; число задач
+        для постраничного списка сбрасывается всегда. Смена поколения не даёт сохранить
+        результат запроса, начатого до изменения.
+        """
+        with self._counts_lock:
+            self._counts_generation += 1
+            self._page_totals.clear()
+            if new_category is not None and self._open_counts is not None:
+                self._open_counts[new_category] = self._open_counts.get(new_category, 0) + 1
+            else:
+                self._open_counts = None
+
+    def count_open_tasks_by_category(self) -> Dict[str, int]:
+        """Количество открытых задач (новые и на переделку) по категориям"""
+        with self._counts_lock:
+            if self._open_counts is not None:
+                return dict(self._open_counts)
+            generation = self._counts_generation
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("""
+                SELECT category, COUNT(*) FROM tasks
+                WHERE status IN (?, ?)
+                GROUP BY category
+            """, (STATUS_NEW, STATUS_REDO))
+            counts = {row[0]: row[1] for row in cursor.fetchall()}
+        with self._counts_lock:
+            if generation == self._counts_generation:
+                self._open_counts = counts
+        return dict(counts)
+
+    def count_tasks_by_status(self) -> Dict[str, int]:
+        """Количество задач по статусам одним запросом (по индексу, без чтения самих задач)"""
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
+    @staticmethod
+    def _task_from_row(row: Tuple) -> Dict:
+        return {
+            'task_id': row[0],
+            'created_by': row[1],
+            'photo_before_id': row[2],
+            'photo_before_path': row[3],
+            'comment': row[4],
+            'status': row[5],
+            'category': row[6] if len(row) > 6 else None,
+            'completed_by': row[7] if len(row) > 7 else None,
+            'photo_after_id': row[8] if len(row) > 8 else None,
+            'photo_after_path': row[9] if len(row) > 9 else None,
+            'created_at': row[10] if len(row) > 10 else None,
+            'completed_at': row[11] if len(row) > 11 else None,
+            'priority': row[12] if len(row) > 12 else 'normal'
+        }
+
     def get_tasks(self, status: Optional[str] = None, category: Optional[str] = None) -> List[Dict]:
         """Получить список задач"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if status and category:
-            cursor.execute("""
-                SELECT task_id, created_by, photo_before_id, photo_before_path, comment, 
-                       status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
-                FROM tasks WHERE status = ? AND category = ? ORDER BY created_at DESC
-            """, (status, category))
-        elif status:
-            cursor.execute("""
-                SELECT task_id, created_by, photo_before_id, photo_before_path, comment, 
-                       status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
-                FROM tasks WHERE status = ? ORDER BY created_at DESC
-            """, (status,))
-        elif category:
-            cursor.execute("""
-                SELECT task_id, created_by, photo_before_id, photo_before_path, comment, 
-                       status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
-                FROM tasks WHERE category = ? ORDER BY created_at DESC
-            """, (category,))
-        else:
-            cursor.execute("""
-                SELECT task_id, created_by, photo_before_id, photo_before_path, comment, 
-                       status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
-                FROM tasks ORDER BY created_at DESC
-            """)
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
+        with self.transaction(readonly=True) as cursor:
+            if status and category:
+                cursor.execute("""
+                    SELECT task_id, created_by, photo_before_id, photo_before_path, comment,
+                           status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
+                    FROM tasks WHERE status = ? AND category = ? ORDER BY created_at DESC
+                """, (status, category))
+            elif status:
+                cursor.execute("""
+                    SELECT task_id, created_by, photo_before_id, photo_before_path, comment,
+                           status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
+                    FROM tasks WHERE status = ? ORDER BY created_at DESC
+                """, (status,))
+            elif category:
+                cursor.execute("""
+                    SELECT task_id, created_by, photo_before_id, photo_before_path, comment,
+                           status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
+                    FROM tasks WHERE category = ? ORDER BY created_at DESC
+                """, (category,))
+            else:
+                cursor.execute("""
+                    SELECT task_id, created_by, photo_before_id, photo_before_path, comment,
+                           status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
+                    FROM tasks ORDER BY created_at DESC
+                """)
+            rows = cursor.fetchall()
+
+        return [self._task_from_row(row) for row in rows]
+
+    def get_tasks_page(self, page: int, page_size: int, filters: Optional[Dict] = None,
+                       after: Optional[Tuple[str, int]] = None) -> Dict:
+        """Получить одну страницу задач (новые сверху) вместе с username создателя и общим числом задач.
+
+        after — курсор (created_at, task_id) последней задачи предыдущей страницы: с ним страница
+        читается по индексу без OFFSET. Без курсора используется OFFSET. Общее число задач
+        кэшируется по фильтру до следующего изменения задач, как count_open_tasks_by_category.
+        """
+        filters = filters or {}
+        conditions = []
+        params: List = []
+        for column in ('status', 'category'):
+            if filters.get(column):
+                conditions.append(f"t.{column} = ?")
+                params.append(filters[column])
+        totals_key = (filters.get('status') or None, filters.get('category') or None)
+        with self._counts_lock:
+            total = self._page_totals.get(totals_key)
+            generation = self._counts_generation
+
+        with self.transaction(readonly=True) as cursor:
+            if total is None:
+                where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                cursor.execute(f"SELECT COUNT(*) FROM tasks t {where}", params)
+                total = cursor.fetchone()[0]
+                with self._counts_lock:
+                    if generation == self._counts_generation:
+                        self._page_totals[totals_key] = total
+            pages = max(1, (total + page_size - 1) // page_size)
+            requested_page = page
+            page = min(max(page, 0), pages - 1)
+
+            # Курсор подходит только для той страницы, которую запросили
+            if after and page == requested_page:
+                conditions.append("(t.created_at, t.task_id) < (?, ?)")
+                params.extend(after)
+                offset = 0
+            else:
+                offset = page * page_size
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            cursor.execute(f"""
+                SELECT t.task_id, t.created_by, t.photo_before_id, t.photo_before_path, t.comment,
+                       t.status, t.category, t.completed_by, t.photo_after_id, t.photo_after_path,
+                       t.created_at, t.completed_at, t.priority, u.username
+                FROM tasks t
+                LEFT JOIN users u ON u.user_id = t.created_by
+                {where}
+                ORDER BY t.created_at DESC, t.task_id DESC
+                LIMIT ? OFFSET ?
+            """, (*params, page_size, offset))
+            rows = cursor.fetchall()
+
         tasks = []
         for row in rows:
-            tasks.append({
-                'task_id': row[0],
-                'created_by': row[1],
-                'photo_before_id': row[2],
-                'photo_before_path': row[3],
-                'comment': row[4],
-                'status': row[5],
-                'category': row[6] if len(row) > 6 else None,
-                'completed_by': row[7] if len(row) > 7 else None,
-                'photo_after_id': row[8] if len(row) > 8 else None,
-                'photo_after_path': row[9] if len(row) > 9 else None,
-                'created_at': row[10] if len(row) > 10 else None,
-                'completed_at': row[11] if len(row) > 11 else None,
-                'priority': row[12] if len(row) > 12 else 'normal'
-            })
-        return tasks
+            task = self._task_from_row(row[:13])
+            task['creator_username'] = row[13]
+            tasks.append(task)
+        last = tasks[-1] if tasks else None
+        return {
+            'tasks': tasks,
+            'total': total,
+            'page': page,
+            'pages': pages,
+            'cursor': (last['created_at'], last['task_id']) if last else None,
+        }
 
     def get_task(self, task_id: int) -> Optional[Dict]:
         """Получить задачу по ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT task_id, created_by, photo_before_id, photo_before_path, comment, 
-                   status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
-            FROM tasks WHERE task_id = ?
-        """, (task_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("""
+                SELECT task_id, created_by, photo_before_id, photo_before_path, comment,
+                       status, category, completed_by, photo_after_id, photo_after_path, created_at, completed_at, priority
+                FROM tasks WHERE task_id = ?
+            """, (task_id,))
+            row = cursor.fetchone()
+
         if row:
-            return {
-                'task_id': row[0],
-                'created_by': row[1],
-                'photo_before_id': row[2],
-                'photo_before_path': row[3],
-                'comment': row[4],
-                'status': row[5],
-                'category': row[6] if len(row) > 6 else None,
-                'completed_by': row[7] if len(row) > 7 else None,
-                'photo_after_id': row[8] if len(row) > 8 else None,
-                'photo_after_path': row[9] if len(row) > 9 else None,
-                'created_at': row[10] if len(row) > 10 else None,
-                'completed_at': row[11] if len(row) > 11 else None,
-                'priority': row[12] if len(row) > 12 else 'normal'
-            }
+            return self._task_from_row(row)
         return None
 
     def update_task_status(self, task_id: int, status: str, completed_by: Optional[int] = None,
                           photo_after_id: Optional[str] = None, photo_after_path: Optional[str] = None):
         """Обновить статус задачи"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if status == "Выполнено":
-            cursor.execute("""
-                UPDATE tasks 
-                SET status = ?, completed_by = ?, photo_after_id = ?, photo_after_path = ?, completed_at = CURRENT_TIMESTAMP
-                WHERE task_id = ?
-            """, (status, completed_by, photo_after_id, photo_after_path, task_id))
-        else:
-            cursor.execute("""
-                UPDATE tasks SET status = ? WHERE task_id = ?
-            """, (status, task_id))
-        
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            if status == "Выполнено":
+                cursor.execute("""
+                    UPDATE tasks
+                    SET status = ?, completed_by = ?, photo_after_id = ?, photo_after_path = ?, completed_at = CURRENT_TIMESTAMP
+                    WHERE task_id = ?
+                """, (status, completed_by, photo_after_id, photo_after_path, task_id))
+            else:
+                cursor.execute("""
+                    UPDATE tasks SET status = ? WHERE task_id = ?
+                """, (status, task_id))
+        self._task_counters_changed()
 
     def get_all_executors(self) -> List[int]:
         """Получить список всех исполнителей (user_id)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users WHERE role = 'executor'")
-        rows = cursor.fetchall()
-        conn.close()
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("SELECT user_id FROM users WHERE role = 'executor'")
+            rows = cursor.fetchall()
         return [row[0] for row in rows]
 
     def get_all_users(self) -> List[int]:
         """Получить список всех пользователей, зарегистрированных в БД (user_id)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users")
-        rows = cursor.fetchall()
-        conn.close()
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("SELECT user_id FROM users")
+            rows = cursor.fetchall()
         return [row[0] for row in rows]
 
     def get_all_managers(self) -> List[int]:
         """Получить список всех менеджеров (user_id)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users WHERE role = 'manager'")
-        rows = cursor.fetchall()
-        conn.close()
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("SELECT user_id FROM users WHERE role = 'manager'")
+            rows = cursor.fetchall()
         return [row[0] for row in rows]
 
     def update_task_comment(self, task_id: int, comment: str):
         """Обновить комментарий задачи"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE tasks SET comment = ? WHERE task_id = ?", (comment, task_id))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("UPDATE tasks SET comment = ? WHERE task_id = ?", (comment, task_id))
 
     def update_task_photo(self, task_id: int, photo_id: str, photo_path: str):
         """Обновить фотографию задачи"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE tasks 
-            SET photo_before_id = ?, photo_before_path = ? 
-            WHERE task_id = ?
-        """, (photo_id, photo_path, task_id))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("""
+                UPDATE tasks
+                SET photo_before_id = ?, photo_before_path = ?
+                WHERE task_id = ?
+            """, (photo_id, photo_path, task_id))
 
     def reset_task_to_new(self, task_id: int):
         """Сбросить задачу в статус 'Новая' и удалить данные о выполнении"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE tasks 
-            SET status = 'Новая', 
-                completed_by = NULL, 
-                photo_after_id = NULL, 
-                photo_after_path = NULL, 
-                completed_at = NULL
-            WHERE task_id = ?
-        """, (task_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("""
+                UPDATE tasks
+                SET status = 'Новая',
+                    completed_by = NULL,
+                    photo_after_id = NULL,
+                    photo_after_path = NULL,
+                    completed_at = NULL
+                WHERE task_id = ?
+            """, (task_id,))
+        self._task_counters_changed()
 
     def delete_task(self, task_id: int):
         """Удалить задачу и все связанные фото"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        # Сначала удаляем все фото задачи (на всякий случай, хотя CASCADE тоже работает)
-        self.delete_all_task_photos(task_id)
-        # Затем удаляем саму задачу (CASCADE автоматически удалит оставшиеся фото, если они есть)
-        cursor.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
-        conn.commit()
-        conn.close()
-
+        with self.transaction() as cursor:
+            # Сначала удаляем все фото задачи (на всякий случай, хотя CASCADE тоже работает)
+            self.delete_all_task_photos(task_id)
+            # Затем удаляем саму задачу (CASCADE автоматически удалит оставшиеся фото, если они есть)
+            cursor.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        self._task_counters_changed()
+
+    def get_conversation_states(self) -> Dict[int, str]:
+        """Сохранённое состояние диалогов: {user_id: JSON}"""
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("SELECT user_id, state FROM conversation_state")
+            rows = cursor.fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def save_conversation_states(self, states: List[Tuple[int, str]]):
+        """Сохранить состояние диалогов пачкой: [(user_id, JSON), ...]"""
+        if not states:
+            return
+        with self.transaction() as cursor:
+            cursor.executemany("""
+                INSERT INTO conversation_state (user_id, state, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+            """, states)
+
+    def delete_conversation_state(self, user_id: int):
+        """Удалить сохранённое состояние диалога пользователя"""
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM conversation_state WHERE user_id = ?", (user_id,))
+
+    def delete_tasks(self, task_ids: List[int]) -> Dict:
+        """Удалить задачи и их фото одной транзакцией.
+
+        Возвращает {'tasks': удалено задач, 'photos': удалено строк task_photos, 'paths': [...]},
+        где paths — файлы удалённых задач (удалять их — PhotoStore.release).
+        """
+        ids = list(dict.fromkeys(task_ids))
+        deleted_tasks = deleted_photos = 0
+        paths = set()
+        with self.transaction() as cursor:
+            for i in range(0, len(ids), PARAMS_CHUNK):
+                chunk = ids[i:i + PARAMS_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"""
+                    SELECT photo_before_path, photo_after_path FROM tasks WHERE task_id IN ({placeholders})
+                """, chunk)
+                for before_path, after_path in cursor.fetchall():
+                    paths.update(p for p in (before_path, after_path) if p)
+                cursor.execute(f"SELECT file_path FROM task_photos WHERE task_id IN ({placeholders})", chunk)
+                paths.update(row[0] for row in cursor.fetchall() if row[0])
+                cursor.execute(f"DELETE FROM task_photos WHERE task_id IN ({placeholders})", chunk)
+                deleted_photos += cursor.rowcount
+                cursor.execute(f"DELETE FROM tasks WHERE task_id IN ({placeholders})", chunk)
+                deleted_tasks += cursor.rowcount
+        if deleted_tasks:
+            self._task_counters_changed()
+        return {'tasks': deleted_tasks, 'photos': deleted_photos, 'paths': sorted(paths)}
+
+    def delete_tasks_by_status(self, status: str) -> Dict:
+        """Удалить все задачи в статусе status и их фото одной транзакцией.
+
+        Статус проверяется в той же транзакции, что и удаление: задача, которую успели
+        перевести в другой статус, не удаляется. Возвращает то же, что delete_tasks.
+        """
+        paths = set()
+        with self.transaction() as cursor:
+            cursor.execute("SELECT photo_before_path, photo_after_path FROM tasks WHERE status = ?", (status,))
+            for before_path, after_path in cursor.fetchall():
+                paths.update(p for p in (before_path, after_path) if p)
+            cursor.execute("""
+                SELECT tp.file_path FROM task_photos tp
+                JOIN tasks t ON t.task_id = tp.task_id
+                WHERE t.status = ?
+            """, (status,))
+            paths.update(row[0] for row in cursor.fetchall() if row[0])
+            cursor.execute("DELETE FROM task_photos WHERE task_id IN (SELECT task_id FROM tasks WHERE status = ?)",
+                           (status,))
+            deleted_photos = cursor.rowcount
+            cursor.execute("DELETE FROM tasks WHERE status = ?", (status,))
+            deleted_tasks = cursor.rowcount
+        if deleted_tasks:
+            self._task_counters_changed()
+        return {'tasks': deleted_tasks, 'photos': deleted_photos, 'paths': sorted(paths)}
+
+    def pin_photo_file(self, path: str, seconds: int = PHOTO_PIN_SECONDS):
+        """Защитить файл от удаления, пока на него ещё не сослалась новая запись"""
+        with self.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO photo_files (path, refcount, pinned_until)
+                VALUES (?, 0, datetime('now', ?))
+                ON CONFLICT(path) DO UPDATE SET pinned_until = excluded.pinned_until
+            """, (path, f"+{seconds} seconds"))
+
+    def unpin_photo_files(self, paths: List[str]):
+        """Снять защиту с файлов, ссылка на которые так и не появилась (запись в БД не удалась)"""
+        with self.transaction() as cursor:
+            cursor.executemany("UPDATE photo_files SET pinned_until = NULL WHERE path = ?",
+                               [(path,) for path in paths])
+
+    def get_orphan_photo_files(self) -> List[str]:
+        """Файлы без ссылок, защита которых истекла: загрузка не дошла до записи в БД"""
+        with self.transaction(readonly=True) as cursor:
+            cursor.execute("""
+                SELECT path FROM photo_files
+                WHERE refcount <= 0 AND (pinned_until IS NULL OR pinned_until <= datetime('now'))
+            """)
+            return [row[0] for row in cursor.fetchall()]
+
+    def claim_unreferenced_files(self, paths: List[str]) -> List[str]:
+        """Снять с учёта файлы из paths, на которые не осталось ссылок, и вернуть их пути.
+
+        Проверка и удаление строк photo_files идут в одной транзакции записи, поэтому новая ссылка
+        на тот же файл не может появиться между ними. Сами файлы удаляет вызывающий — после фиксации
+        транзакции и вне потока записи (PhotoStore.release).
+        """
+        claimed = []
+        queue = list(dict.fromkeys(paths))
+        with self.transaction() as cursor:
+            for path in queue:
+                cursor.execute("""
+                    SELECT refcount, pinned_until > datetime('now') FROM photo_files WHERE path = ?
+                """, (path,))
+                row = cursor.fetchone()
+                # Путь без строки photo_files хранилищу не принадлежит (или уже снят с учёта) — не трогаем
+                if row is None or row[0] > 0 or row[1]:
+                    continue
+                cursor.execute("DELETE FROM photo_files WHERE path = ?", (path,))
+                claimed.append(path)
+                # Уменьшенные копии удалённого фото больше не нужны: проверяем их следующими
+                cursor.execute("SELECT file_path FROM photo_variants WHERE source_path = ?", (path,))
+                variant_paths = [row[0] for row in cursor.fetchall()]
+                if variant_paths:
+                    cursor.execute("DELETE FROM photo_variants WHERE source_path = ?", (path,))
+                    queue.extend(p for p in variant_paths if p not in queue)
+        return claimed
+
+    def get_tracked_photo_files(self, paths: List[str]) -> List[str]:
+        """Пути из paths, для которых есть строка photo_files (файл снова кому-то нужен)"""
+        tracked = []
+        with self.transaction(readonly=True) as cursor:
+            for i in range(0, len(paths), PARAMS_CHUNK):
+                chunk = paths[i:i + PARAMS_CHUNK]
+                cursor.execute(f"SELECT path FROM photo_files WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+                tracked.extend(row[0] for row in cursor.fetchall())
+        return tracked
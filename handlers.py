@@ -1,16 +1,36 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import os
+import asyncio
 import logging
 from datetime import datetime
 from typing import Optional
 from database import Database
+from async_database import AsyncDatabase
+from media import MediaSender, available_photos, refresh_file_stats, with_variant
+from broadcaster import Broadcaster
+from report_export import ReportExporter
+from photo_downloads import PhotoDownloader
+from router import CallbackRouter, CallbackCall
+from photo_store import PhotoStore
 from config import MANAGER_CODE, STATUS_NEW, STATUS_COMPLETED, STATUS_APPROVED, STATUS_REDO, DEV_ID, VIP_IDS
-import zipfile
+from config import REVIEW_PHOTO_VARIANT, REPORT_PHOTO_VARIANT, SLOW_QUERY_THRESHOLD_MS
+import slow_queries
 
 logger = logging.getLogger(__name__)
-db = Database()
+db = AsyncDatabase(Database())
+media_sender = MediaSender(db)
+broadcaster = Broadcaster()
 PHOTOS_DIR = "photos"
+photo_store = PhotoStore(db, PHOTOS_DIR)
+photo_downloader = PhotoDownloader(db, photo_store, variants=(REVIEW_PHOTO_VARIANT, REPORT_PHOTO_VARIANT))
+callback_router = CallbackRouter(db.get_user_role)
+report_exporter = ReportExporter(os.path.join(PHOTOS_DIR, "exports"))
+
+
+def is_developer(user_id: int, role: str) -> bool:
+    """Доступ только для разработчика (DEV_ID)"""
+    return DEV_ID is not None and user_id == DEV_ID
 
 
 def ensure_photos_dir():
@@ -27,7 +47,7 @@ def format_tasks_word(n: int) -> str:
     return f"{n} задач"
 
 
-def build_category_keyboard():  
+async def build_category_keyboard():  
     categories = [
         ("Касса", "💰"),
         ("Саладет", "🥗"),
@@ -37,16 +57,17 @@ def build_category_keyboard():
         ("Прочее", "📦"),
     ]
     keyboard = [[InlineKeyboardButton("👔 Меню менеджера", callback_data="become_manager")]]
+    counts = await db.count_open_tasks_by_category()
     for name, emoji in categories:
-        count = len(db.get_tasks(status=STATUS_NEW, category=name)) + len(db.get_tasks(status=STATUS_REDO, category=name))
+        count = counts.get(name, 0)
         keyboard.append([InlineKeyboardButton(f"{emoji} {name} - {format_tasks_word(count)}", callback_data=f"set_category_{name}")])
     return keyboard
 
 
-def format_task_details(task: dict) -> str:
+async def format_task_details(task: dict) -> str:
     creator = "неизвестно"
     if task.get('created_by'):
-        username = db.get_username(task['created_by'])
+        username = await db.get_username(task['created_by'])
         creator = f"@{username}" if username else f"ID {task['created_by']}"
     lines = [
         f"📋 Задача #{task['task_id']}",
@@ -84,7 +105,7 @@ async def render_executor_tasks_list(context: ContextTypes.DEFAULT_TYPE, user_id
         logger.error("chat_id is None")
         return
 
-    category = db.get_user_category(user_id)
+    category = await db.get_user_category(user_id)
     logger.debug(f"category={category}")
 
     # Если категория не установлена — попросим выбрать её
@@ -100,8 +121,8 @@ async def render_executor_tasks_list(context: ContextTypes.DEFAULT_TYPE, user_id
         return
 
         # Собираем задачи для исполнителя в этой категории
-    tasks_new = db.get_tasks(status=STATUS_NEW, category=category) or []
-    tasks_redo = db.get_tasks(status=STATUS_REDO, category=category) or []
+    tasks_new = await db.get_tasks(status=STATUS_NEW, category=category) or []
+    tasks_redo = await db.get_tasks(status=STATUS_REDO, category=category) or []
     tasks = tasks_new + tasks_redo
     
     # Сортируем задачи: сначала высокий приоритет, потом обычный
@@ -184,7 +205,7 @@ async def cleanup_executor_task_messages(context: ContextTypes.DEFAULT_TYPE, cha
 
 
 async def send_category_selection(message_target, username: str):
-    keyboard = build_category_keyboard()
+    keyboard = await build_category_keyboard()
     reply_markup = InlineKeyboardMarkup(keyboard)
     await message_target.reply_text(
         f"👋 Добро пожаловать, {username}!\n\nВыберите, где делать отмывки:",
@@ -193,29 +214,27 @@ async def send_category_selection(message_target, username: str):
 
 
 async def render_manager_tasks_list(update: Update, context: ContextTypes.DEFAULT_TYPE, base_message=None, page: int = 0):
-    tasks = db.get_tasks()
     context.user_data['return_to'] = 'manager_menu'
-    
+
     TASKS_PER_PAGE = 10
-    total_tasks = len(tasks)
-    total_pages = (total_tasks + TASKS_PER_PAGE - 1) // TASKS_PER_PAGE if total_tasks > 0 else 1
-    
-    # Ограничиваем номер страницы
-    if page < 0:
-        page = 0
-    if page >= total_pages:
-        page = total_pages - 1
-    
-    if not tasks:
+    # Курсоры (created_at, task_id) последней задачи каждой показанной страницы:
+    # по ним соседняя страница читается по индексу, без OFFSET
+    cursors = context.user_data.get('manager_page_cursors', {})
+    if page <= 0:
+        cursors = {}
+    result = await db.get_tasks_page(page, TASKS_PER_PAGE, after=cursors.get(page - 1))
+    page = result['page']
+    total_pages = result['pages']
+    page_tasks = result['tasks']
+    if result['cursor']:
+        cursors[page] = result['cursor']
+    context.user_data['manager_page_cursors'] = cursors
+
+    if not page_tasks:
         # Нет задач — покажем только текст, общие кнопки добавляем ниже (чтобы не дублировать)
         keyboard = []
         text = "📭 Нет задач."
     else:
-        # Вычисляем диапазон задач для текущей страницы
-        start_idx = page * TASKS_PER_PAGE
-        end_idx = min(start_idx + TASKS_PER_PAGE, total_tasks)
-        page_tasks = tasks[start_idx:end_idx]
-        
         text = f"📊 Все задачи (страница {page + 1} из {total_pages}):\n\n"
         keyboard = []
         for task in page_tasks:
@@ -224,7 +243,7 @@ async def render_manager_tasks_list(update: Update, context: ContextTypes.DEFAUL
             priority_text = " 🔴 Высокий приоритет" if priority == 'high' else " 🟢 Обычный приоритет"
             text += f"{status_emoji} Задача #{task['task_id']}{priority_text}\n"
             text += f"   Статус: {task['status']}\n"
-            creator_username = db.get_username(task['created_by']) if task.get('created_by') else None
+            creator_username = task.get('creator_username')
             if creator_username:
                 text += f"   Создал: @{creator_username}\n"
             elif task.get('created_by'):
@@ -236,7 +255,7 @@ async def render_manager_tasks_list(update: Update, context: ContextTypes.DEFAUL
                 f"📷 Задача #{task['task_id']} - {task['status']}",
                 callback_data=f"view_task_photo_{task['task_id']}"
             )])
-        
+
         # Кнопки навигации по страницам (после кнопок задач, перед служебными кнопками)
         if total_pages > 1:
             nav_row = []
@@ -309,30 +328,6 @@ async def cleanup_review_task_messages(context: ContextTypes.DEFAULT_TYPE, chat_
         context.user_data.pop('last_review_task_id', None)
 
 
-def purge_task_files(task_id: int, task: Optional[dict] = None):
-    if task is None:
-        task = db.get_task(task_id)
-    if not task:
-        return
-    if task.get('photo_before_path') and os.path.exists(task['photo_before_path']):
-        try:
-            os.remove(task['photo_before_path'])
-        except OSError as e:
-            logger.error(f"Ошибка при удалении фото до: {e}")
-    if task.get('photo_after_path') and os.path.exists(task['photo_after_path']):
-        try:
-            os.remove(task['photo_after_path'])
-        except OSError as e:
-            logger.error(f"Ошибка при удалении фото после: {e}")
-    for p in db.get_task_photos(task_id):
-        if p.get('file_path') and os.path.exists(p['file_path']):
-            try:
-                os.remove(p['file_path'])
-            except OSError as e:
-                logger.error(f"Ошибка при удалении фото задачи: {e}")
-    db.delete_all_task_photos(task_id)
-
-
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user_id = update.effective_user.id
@@ -340,1312 +335,1181 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Очищаем данные пользователя
     context.user_data.clear()
     # Автоматически устанавливаем роль "исполнитель" и очищаем категорию
-    db.set_user_role(user_id, username, "executor", None)
+    await db.set_user_role(user_id, username, "executor", None)
     # Выводим начальное меню выбора категории
     await send_category_selection(update.message, username)
 
 
+async def slowlog(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /slowlog: самые медленные SQL-запросы с момента запуска (только DEV_ID)"""
+    if not is_developer(update.effective_user.id, ""):
+        return
+    await update.message.reply_text(slow_queries.format_summary(threshold_ms=SLOW_QUERY_THRESHOLD_MS))
+
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий на кнопки"""
-    query = update.callback_query
-    if not query:
-        return
-    
-    user_id = query.from_user.id
-    username = query.from_user.username or "Пользователь"
-    data = query.data
-    
-    # Логируем для отладки
-    logger.debug(f"button_handler вызван, callback_data={data}, user_id={user_id}")
-    
-    if not data:
-        logger.error("пустой callback_data")
+    await callback_router.dispatch(update, context)
+
+
+@callback_router.prefix("set_category_")
+async def cb_set_category(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query, user_id, username, data = call.query, call.user_id, call.username, call.data
+    logger.debug(f"Обработка set_category_, data={data}")
+    try:
+        category = call.arg
+        logger.debug(f"category={category}")
+        # Всегда устанавливаем роль исполнителя при выборе категории
+        # set_user_role уже сохраняет категорию, если она передана
+        await db.set_user_role(user_id, username, "executor", category)
+        logger.debug("Роль и категория установлены через set_user_role")
+        # Проверяем, что категория сохранилась
+        saved_category = await db.get_user_category(user_id)
+        logger.debug(f"Проверка сохраненной категории: {saved_category}")
+        if saved_category != category:
+            logger.error(f"Категория не сохранилась! Ожидалось: {category}, получено: {saved_category}")
+            # Пытаемся сохранить еще раз через set_user_category
+            await db.set_user_category(user_id, username, category)
+            saved_category = await db.get_user_category(user_id)
+            logger.debug(f"После set_user_category: {saved_category}")
+        # Показываем список задач исполнителя
+        chat_id = query.message.chat_id if query.message else update.effective_chat.id
+        logger.debug(f"chat_id={chat_id}, вызываю render_executor_tasks_list")
+        await render_executor_tasks_list(context, user_id, chat_id, base_message=query.message)
+        logger.debug("render_executor_tasks_list завершен")
+    except Exception as e:
+        logger.error(f"Ошибка в set_category_: {e}", exc_info=True)
         try:
-            await query.answer("❌ Ошибка: пустой callback_data")
+            await query.message.reply_text(f"❌ Ошибка при выборе категории: {str(e)}")
         except:
             pass
+
+
+@callback_router.exact("become_manager")
+async def cb_become_manager(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query, user_id, username = call.query, call.user_id, call.username
+    # Быстрый доступ для VIP и разработчика
+    if user_id in (VIP_IDS or [] ) or (DEV_ID is not None and user_id == DEV_ID):
+        await db.set_user_role(user_id, username, "manager")
+        context.user_data['waiting_for_code'] = False
+        keyboard = [
+            [InlineKeyboardButton("📋 Создать задачу", callback_data="select_category")],
+            [InlineKeyboardButton("📊 Просмотреть задачи", callback_data="view_tasks_manager")],
+            [InlineKeyboardButton("✅ Проверить выполненные", callback_data="review_tasks")],
+            [InlineKeyboardButton("📨 Меню рассылок", callback_data="mail_menu")],
+            [InlineKeyboardButton("🏠 В начало", callback_data="restart")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        try:
+            await query.edit_message_text("✅ Вы были определены разработчиком, как менеджер. Пароль вводить не нужно.", reply_markup=reply_markup)
+        except:
+            await query.message.reply_text("✅ Вы были определены разработчиком, как менеджер. Пароль вводить не нужно.", reply_markup=reply_markup)
         return
-    
-    # Получаем роль пользователя из базы данных
-    role = db.get_user_role(user_id)
-    if not role:
-        role = "executor"  # По умолчанию исполнитель
-    logger.debug(f"button_handler - user_id={user_id}, role={role}, callback_data={data}")
-    
-    # Отвечаем на callback сразу
+
+    # Обычная ветка: запрашиваем код менеджера
+    keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="restart")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
     try:
-        await query.answer()
-    except Exception as e:
-        logger.error(f"Не удалось ответить на callback: {e}")
+        await query.edit_message_text(
+            "🔐 Введите код доступа для менеджера:",
+            reply_markup=reply_markup
+        )
+    except:
+        await query.message.reply_text(
+            "🔐 Введите код доступа для менеджера:",
+            reply_markup=reply_markup
+        )
+    context.user_data['waiting_for_code'] = True
+
+
+@callback_router.exact("broadcast_start", role="manager")
+async def cb_broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Включаем режим ввода текста для рассылки
+    context.user_data['broadcasting'] = True
+    # Возврат должен вести в меню менеджера
+    context.user_data['return_to'] = 'manager_menu'
+    keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data="back_to_menu")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    try:
+        await query.edit_message_text("✉️ Введите текст для рассылки всем исполнителям:", reply_markup=reply_markup)
+    except:
+        await query.message.reply_text("✉️ Введите текст для рассылки всем исполнителям:", reply_markup=reply_markup)
+
+
+@callback_router.exact("mail_menu", role="manager")
+async def cb_mail_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Меню рассылок — возврат в менеджерское меню
+    context.user_data['return_to'] = 'manager_menu'
+    keyboard = [
+        [InlineKeyboardButton("📨 Обычная рассылка", callback_data="broadcast_start")],
+        [InlineKeyboardButton("🚀 Рассылка от разработчика", callback_data="dev_broadcast")],
+        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    try:
+        await query.edit_message_text("✉️ Меню рассылок — выберите действие:", reply_markup=reply_markup)
+    except:
+        await query.message.reply_text("✉️ Меню рассылок — выберите действие:", reply_markup=reply_markup)
+
 
-    if data.startswith("set_category_"):
-        logger.debug(f"Обработка set_category_, data={data}")
+@callback_router.exact("dev_broadcast", access=is_developer)
+async def cb_dev_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    context.user_data['dev_broadcasting'] = True
+    context.user_data['return_to'] = 'manager_menu'
+    keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data="back_to_menu")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    try:
+        await query.edit_message_text("✉️ Введите текст для рассылки от разработчика (будет отправлено всем пользователям):", reply_markup=reply_markup)
+    except:
+        await query.message.reply_text("✉️ Введите текст для рассылки от разработчика (будет отправлено всем пользователям):", reply_markup=reply_markup)
+
+
+@callback_router.exact("select_category", role="manager")
+async def cb_select_category(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Сбрасываем приоритет при выборе новой категории
+    context.user_data['task_priority'] = 'normal'
+    keyboard = [
+        [InlineKeyboardButton("💰 Касса", callback_data="create_task_Касса")],
+        [InlineKeyboardButton("🥗 Саладет", callback_data="create_task_Саладет")],
+        [InlineKeyboardButton("🍞 Панировка", callback_data="create_task_Панировка")],
+        [InlineKeyboardButton("🚶 Улица", callback_data="create_task_Улица")],
+        [InlineKeyboardButton("🪑 Зал", callback_data="create_task_Зал")],
+        [InlineKeyboardButton("📦 Прочее", callback_data="create_task_Прочее")],
+        [InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    try:
+        await query.edit_message_text(
+            "📂 Выберите категорию для задачи:",
+            reply_markup=reply_markup
+        )
+    except:
         try:
-            category = data.replace("set_category_", "")
-            logger.debug(f"category={category}")
-            # Всегда устанавливаем роль исполнителя при выборе категории
-            # set_user_role уже сохраняет категорию, если она передана
-            db.set_user_role(user_id, username, "executor", category)
-            logger.debug("Роль и категория установлены через set_user_role")
-            # Проверяем, что категория сохранилась
-            saved_category = db.get_user_category(user_id)
-            logger.debug(f"Проверка сохраненной категории: {saved_category}")
-            if saved_category != category:
-                logger.error(f"Категория не сохранилась! Ожидалось: {category}, получено: {saved_category}")
-                # Пытаемся сохранить еще раз через set_user_category
-                db.set_user_category(user_id, username, category)
-                saved_category = db.get_user_category(user_id)
-                logger.debug(f"После set_user_category: {saved_category}")
-            # Показываем список задач исполнителя
-            chat_id = query.message.chat_id if query.message else update.effective_chat.id
-            logger.debug(f"chat_id={chat_id}, вызываю render_executor_tasks_list")
-            await render_executor_tasks_list(context, user_id, chat_id, base_message=query.message)
-            logger.debug("render_executor_tasks_list завершен")
-        except Exception as e:
-            logger.error(f"Ошибка в set_category_: {e}", exc_info=True)
-            try:
-                await query.message.reply_text(f"❌ Ошибка при выборе категории: {str(e)}")
-            except:
-                pass
-        return
+            await query.message.edit_text(
+                "📂 Выберите категорию для задачи:",
+                reply_markup=reply_markup
+            )
+        except:
+            await query.message.reply_text(
+                "📂 Выберите категорию для задачи:",
+                reply_markup=reply_markup
+            )
 
-    if data == "become_manager":
-        # Быстрый доступ для VIP и разработчика
-        if user_id in (VIP_IDS or [] ) or (DEV_ID is not None and user_id == DEV_ID):
-            db.set_user_role(user_id, username, "manager")
-            context.user_data['waiting_for_code'] = False
-            keyboard = [
-                [InlineKeyboardButton("📋 Создать задачу", callback_data="select_category")],
-                [InlineKeyboardButton("📊 Просмотреть задачи", callback_data="view_tasks_manager")],
-                [InlineKeyboardButton("✅ Проверить выполненные", callback_data="review_tasks")],
-                [InlineKeyboardButton("📨 Меню рассылок", callback_data="mail_menu")],
-                [InlineKeyboardButton("🏠 В начало", callback_data="restart")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            try:
-                await query.edit_message_text("✅ Вы были определены разработчиком, как менеджер. Пароль вводить не нужно.", reply_markup=reply_markup)
-            except:
-                await query.message.reply_text("✅ Вы были определены разработчиком, как менеджер. Пароль вводить не нужно.", reply_markup=reply_markup)
-            return
 
-        # Обычная ветка: запрашиваем код менеджера
-        keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="restart")]]
+@callback_router.prefix("create_task_", role="manager")
+async def cb_create_task(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    category = call.arg
+    # Инициализируем приоритет как "normal" если его еще нет
+    if 'task_priority' not in context.user_data:
+        context.user_data['task_priority'] = 'normal'
+    priority = context.user_data.get('task_priority', 'normal')
+    
+    # Создаем кнопку приоритета (зеленая для normal, красная для high)
+    if priority == 'normal':
+        priority_button_text = "🟢 Обычный"
+    else:
+        priority_button_text = "🔴 Высокий"
+    priority_button = InlineKeyboardButton(
+        priority_button_text,
+        callback_data=f"toggle_priority_{category}"
+    )
+    
+    keyboard = [
+        [InlineKeyboardButton("🔄 Изменить категорию", callback_data="select_category")],
+        [priority_button]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    priority_text = "🟢 Обычный" if priority == 'normal' else "🔴 Высокий"
+    await query.message.reply_text(
+        f"📸 Отправьте фотографию места, которое нужно почистить.\n"
+        f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
+        f"⚠️ Укажите приоритет задачи (🟢 Обычный (не требует срочного выполнения) / 🔴 Высокий (выполнить в первую очередь))\n"
+        f"‼️ Не злоупотребляйте высоким приоритетом. Указывайте его по необходимости.\n\n"
+
+        f"Категория: {category}\n"
+        f"Приоритет: {priority_text}",
+        reply_markup=reply_markup
+    )
+    context.user_data['creating_task'] = True
+    context.user_data['task_step'] = "photo"
+    context.user_data['task_category'] = category
+    # Для альбомов фиксируем текущий альбом (сбрасываем)
+    context.user_data.pop('album_id', None)
+    context.user_data.pop('album_task_id', None)
+
+
+@callback_router.prefix("toggle_priority_", role="manager")
+async def cb_toggle_priority(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    category = call.arg
+    # Переключаем приоритет
+    current_priority = context.user_data.get('task_priority', 'normal')
+    new_priority = 'high' if current_priority == 'normal' else 'normal'
+    context.user_data['task_priority'] = new_priority
+    
+    # Обновляем сообщение с новым приоритетом
+    if new_priority == 'normal':
+        priority_button_text = "🟢 Обычный"
+    else:
+        priority_button_text = "🔴 Высокий"
+    priority_button = InlineKeyboardButton(
+        priority_button_text,
+        callback_data=f"toggle_priority_{category}"
+    )
+    
+    priority_text = "🟢 Обычный" if new_priority == 'normal' else "🔴 Высокий"
+    
+    # Определяем, какое сообщение нужно обновить (начало создания или следующая задача)
+    message_text = query.message.text or ""
+    if "следующей задачи" in message_text:
+        # Это сообщение о следующей задаче
+        keyboard = [
+            [priority_button],
+            [InlineKeyboardButton("🏠 В главное меню", callback_data="back_to_menu")]
+        ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         try:
             await query.edit_message_text(
-                "🔐 Введите код доступа для менеджера:",
+                f"📸 Отправьте фотографию для следующей задачи.\n"
+                f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
+                f"Категория: {category}\n"
+                f"Приоритет: {priority_text}",
                 reply_markup=reply_markup
             )
         except:
-            await query.message.reply_text(
-                "🔐 Введите код доступа для менеджера:",
+            await query.message.edit_text(
+                f"📸 Отправьте фотографию для следующей задачи.\n"
+                f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
+                f"Категория: {category}\n"
+                f"Приоритет: {priority_text}",
+                reply_markup=reply_markup
+            )
+    else:
+        # Это сообщение о начале создания задачи
+        keyboard = [
+            [InlineKeyboardButton("🔄 Изменить категорию", callback_data="select_category")],
+            [priority_button]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        try:
+            await query.edit_message_text(
+                f"📸 Отправьте фотографию места, которое нужно почистить.\n"
+                f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
+                f"Категория: {category}\n"
+                f"Приоритет: {priority_text}",
+                reply_markup=reply_markup
+            )
+        except:
+            await query.message.edit_text(
+                f"📸 Отправьте фотографию места, которое нужно почистить.\n"
+                f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
+                f"Категория: {category}\n"
+                f"Приоритет: {priority_text}",
                 reply_markup=reply_markup
             )
-        context.user_data['waiting_for_code'] = True
+    await query.answer()
+
+
+@callback_router.exact("export_report_photos", role="manager")
+async def cb_export_report_photos(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Выгрузить все фото 'after' только с задач со статусом "Задача завершена" для отчета
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    # Фото 'after' задач со статусом "Задача завершена" — одним запросом
+    photos = await db.get_photos_by_task_status(STATUS_APPROVED, 'after')
+    # Наличие файлов проверяем одним проходом в рабочем потоке, изменения сохраняем пачкой
+    changed = await asyncio.to_thread(refresh_file_stats, photos)
+    await db.update_task_photo_file_stats(changed)
+    photos = [p for p in photos if p.get('file_id') or p['file_size'] is not None]
+
+    if not photos:
+        msg = (
+            "Нет фотографий для отчета. Чтобы они появились - проверьте все выполненные задачи и не удаляйте их - отчет появится здесь!"
+        )
+        keyboard = [[InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        try:
+            await query.message.reply_text(msg, reply_markup=reply_markup)
+        except:
+            await query.message.reply_text(msg, reply_markup=reply_markup)
         return
 
-    if data == "broadcast_start":
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        # Включаем режим ввода текста для рассылки
-        context.user_data['broadcasting'] = True
-        # Возврат должен вести в меню менеджера
-        context.user_data['return_to'] = 'manager_menu'
-        keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    if REPORT_PHOTO_VARIANT:
+        # В альбомы и архив идут уменьшенные копии там, где они уже скачаны
+        variants = await db.get_photo_variants([p['file_path'] for p in photos], REPORT_PHOTO_VARIANT)
+        photos = with_variant(photos, variants, REPORT_PHOTO_VARIANT)
+
+    total = len(photos)
+    try:
+        for i in range(0, total, 10):
+            batch = photos[i:i+10]
+            caption = f"📸 Фото для отчета — часть {i//10 + 1}. Всего фото: {total}"
+            await media_sender.send_album(context.bot, chat_id, batch, caption)
+    except Exception as e:
+        logger.error(f"Ошибка при отправке фото для отчета менеджеру {chat_id}: {e}")
         try:
-            await query.edit_message_text("✉️ Введите текст для рассылки всем исполнителям:", reply_markup=reply_markup)
+            await query.message.reply_text(f"❌ Ошибка при отправке фото: {e}")
         except:
-            await query.message.reply_text("✉️ Введите текст для рассылки всем исполнителям:", reply_markup=reply_markup)
+            pass
         return
 
-    if data == "mail_menu":
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        # Меню рассылок — возврат в менеджерское меню
-        context.user_data['return_to'] = 'manager_menu'
-        keyboard = [
-            [InlineKeyboardButton("📨 Обычная рассылка", callback_data="broadcast_start")],
-            [InlineKeyboardButton("🚀 Рассылка от разработчика", callback_data="dev_broadcast")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="back_to_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    # Архив собирается в рабочем потоке; при повторной выгрузке без новых фото берётся из кэша
+    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    try:
+        archive = await report_exporter.build_async(photos)
+    except Exception as e:
+        logger.error(f"Ошибка при создании zip-архива: {e}")
+        try:
+            await query.message.reply_text(f"❌ Ошибка при формировании архива: {e}")
+        except:
+            pass
+        return
+    parts = archive.parts
+    skipped_text = (f"\n⚠️ Не вошли в архив фото больше {report_exporter.part_limit // (1024 * 1024)} МБ: "
+                    f"{len(archive.skipped)}." if archive.skipped else "")
+    if not parts:
+        # Альбомы выше отправлены по file_id, но файлов на диске нет (или все они больше лимита части)
+        text = "Архив не собран: файлов этих фото нет на диске." if not archive.skipped else "Архив не собран." + skipped_text
         try:
-            await query.edit_message_text("✉️ Меню рассылок — выберите действие:", reply_markup=reply_markup)
+            await query.message.reply_text(text)
         except:
-            await query.message.reply_text("✉️ Меню рассылок — выберите действие:", reply_markup=reply_markup)
+            pass
         return
 
-    if data == "dev_broadcast":
-        # Доступ только для разработчика (DEV_ID)
-        if DEV_ID is None or user_id != DEV_ID:
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        context.user_data['dev_broadcasting'] = True
-        context.user_data['return_to'] = 'manager_menu'
-        keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    try:
+        await report_exporter.send_parts(context.bot, chat_id, parts, timestamp)
+    except Exception as e:
+        logger.error(f"Ошибка при отправке архива менеджеру {chat_id}: {e}")
         try:
-            await query.edit_message_text("✉️ Введите текст для рассылки от разработчика (будет отправлено всем пользователям):", reply_markup=reply_markup)
+            await query.message.reply_text(f"❌ Ошибка при отправке архива: {e}")
         except:
-            await query.message.reply_text("✉️ Введите текст для рассылки от разработчика (будет отправлено всем пользователям):", reply_markup=reply_markup)
+            pass
         return
+    finally:
+        report_exporter.release(parts)
 
-    if data == "select_category":
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        # Сбрасываем приоритет при выборе новой категории
-        context.user_data['task_priority'] = 'normal'
-        keyboard = [
-            [InlineKeyboardButton("💰 Касса", callback_data="create_task_Касса")],
-            [InlineKeyboardButton("🥗 Саладет", callback_data="create_task_Саладет")],
-            [InlineKeyboardButton("🍞 Панировка", callback_data="create_task_Панировка")],
-            [InlineKeyboardButton("🚶 Улица", callback_data="create_task_Улица")],
-            [InlineKeyboardButton("🪑 Зал", callback_data="create_task_Зал")],
-            [InlineKeyboardButton("📦 Прочее", callback_data="create_task_Прочее")],
-            [InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    done_text = "Готово — архив со всеми фото отправлен." if len(parts) <= 1 else f"Готово — архив со всеми фото отправлен (частей: {len(parts)})."
+    done_text += skipped_text
+    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Назад", callback_data="view_tasks_manager")]])
+    try:
+        await context.bot.send_message(chat_id=chat_id, text=done_text, reply_markup=reply_markup)
+    except:
+        pass
+
+
+@callback_router.exact("delete_completed_tasks", role="manager")
+async def cb_delete_completed_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Показать подтверждение удаления: сколько задач будет удалено и предупреждение
+    count = (await db.count_tasks_by_status()).get(STATUS_APPROVED, 0)
+    if count == 0:
         try:
-            await query.edit_message_text(
-                "📂 Выберите категорию для задачи:",
-                reply_markup=reply_markup
+            await query.message.reply_text(
+                "Нет завершённых задач для удаления.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]])
             )
         except:
-            try:
-                await query.message.edit_text(
-                    "📂 Выберите категорию для задачи:",
-                    reply_markup=reply_markup
-                )
-            except:
-                await query.message.reply_text(
-                    "📂 Выберите категорию для задачи:",
-                    reply_markup=reply_markup
-                )
+            pass
         return
 
-    if data.startswith("create_task_"):
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        category = data.replace("create_task_", "")
-        # Инициализируем приоритет как "normal" если его еще нет
-        if 'task_priority' not in context.user_data:
-            context.user_data['task_priority'] = 'normal'
-        priority = context.user_data.get('task_priority', 'normal')
-        
-        # Создаем кнопку приоритета (зеленая для normal, красная для high)
-        if priority == 'normal':
-            priority_button_text = "🟢 Обычный"
-        else:
-            priority_button_text = "🔴 Высокий"
-        priority_button = InlineKeyboardButton(
-            priority_button_text,
-            callback_data=f"toggle_priority_{category}"
-        )
-        
-        keyboard = [
-            [InlineKeyboardButton("🔄 Изменить категорию", callback_data="select_category")],
-            [priority_button]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        priority_text = "🟢 Обычный" if priority == 'normal' else "🔴 Высокий"
-        await query.message.reply_text(
-            f"📸 Отправьте фотографию места, которое нужно почистить.\n"
-            f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
-            f"⚠️ Укажите приоритет задачи (🟢 Обычный (не требует срочного выполнения) / 🔴 Высокий (выполнить в первую очередь))\n"
-            f"‼️ Не злоупотребляйте высоким приоритетом. Указывайте его по необходимости.\n\n"
+    text = (
+        f"⚠️ Будет удалено {count} задач(а) со статусом \"Задача завершена\".\n"
+        "Это действие не может быть отменено. Вы уверены?"
+    )
+    keyboard = [
+        [InlineKeyboardButton(f"✅ Удалить {count} задач (без восстановления)", callback_data="confirm_delete_completed")],
+        [InlineKeyboardButton("❌ Отмена", callback_data="back_to_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    try:
+        # Редактируем текущее сообщение если возможно, иначе отправим новое
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        except Exception:
+            await query.message.reply_text(text, reply_markup=reply_markup)
+    except Exception:
+        logger.exception("Не удалось показать подтверждение удаления завершённых задач")
 
-            f"Категория: {category}\n"
-            f"Приоритет: {priority_text}",
-            reply_markup=reply_markup
-        )
-        context.user_data['creating_task'] = True
-        context.user_data['task_step'] = "photo"
-        context.user_data['task_category'] = category
-        # Для альбомов фиксируем текущий альбом (сбрасываем)
-        context.user_data.pop('album_id', None)
-        context.user_data.pop('album_task_id', None)
+
+@callback_router.exact("confirm_delete_completed", role="manager")
+async def cb_confirm_delete_completed(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Выполнить окончательное удаление завершённых задач: выбор по статусу, задачи и их фото —
+    # одной транзакцией (задача, отправленная тем временем на доработку, не удалится), файлы — в рабочем потоке
+    try:
+        report = await photo_store.purge_tasks(status=STATUS_APPROVED)
+    except Exception as e:
+        logger.error(f"Ошибка при удалении завершённых задач: {e}", exc_info=True)
+        try:
+            await query.message.reply_text(f"❌ Ошибка при удалении задач: {e}")
+        except:
+            pass
+        return
+    if not report.tasks:
+        try:
+            await query.message.reply_text("Нет завершённых задач для удаления.")
+        except:
+            pass
         return
 
-    if data.startswith("toggle_priority_"):
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        category = data.replace("toggle_priority_", "")
-        # Переключаем приоритет
-        current_priority = context.user_data.get('task_priority', 'normal')
-        new_priority = 'high' if current_priority == 'normal' else 'normal'
-        context.user_data['task_priority'] = new_priority
-        
-        # Обновляем сообщение с новым приоритетом
-        if new_priority == 'normal':
-            priority_button_text = "🟢 Обычный"
-        else:
-            priority_button_text = "🔴 Высокий"
-        priority_button = InlineKeyboardButton(
-            priority_button_text,
-            callback_data=f"toggle_priority_{category}"
-        )
-        
-        priority_text = "🟢 Обычный" if new_priority == 'normal' else "🔴 Высокий"
-        
-        # Определяем, какое сообщение нужно обновить (начало создания или следующая задача)
-        message_text = query.message.text or ""
-        if "следующей задачи" in message_text:
-            # Это сообщение о следующей задаче
-            keyboard = [
-                [priority_button],
-                [InlineKeyboardButton("🏠 В главное меню", callback_data="back_to_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            try:
-                await query.edit_message_text(
-                    f"📸 Отправьте фотографию для следующей задачи.\n"
-                    f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
-                    f"Категория: {category}\n"
-                    f"Приоритет: {priority_text}",
-                    reply_markup=reply_markup
-                )
-            except:
-                await query.message.edit_text(
-                    f"📸 Отправьте фотографию для следующей задачи.\n"
-                    f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
-                    f"Категория: {category}\n"
-                    f"Приоритет: {priority_text}",
-                    reply_markup=reply_markup
-                )
-        else:
-            # Это сообщение о начале создания задачи
-            keyboard = [
-                [InlineKeyboardButton("🔄 Изменить категорию", callback_data="select_category")],
-                [priority_button]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            try:
-                await query.edit_message_text(
-                    f"📸 Отправьте фотографию места, которое нужно почистить.\n"
-                    f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
-                    f"Категория: {category}\n"
-                    f"Приоритет: {priority_text}",
-                    reply_markup=reply_markup
-                )
-            except:
-                await query.message.edit_text(
-                    f"📸 Отправьте фотографию места, которое нужно почистить.\n"
-                    f"Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.\n\n"
-                    f"Категория: {category}\n"
-                    f"Приоритет: {priority_text}",
-                    reply_markup=reply_markup
-                )
-        await query.answer()
-        return
-
-    if data == "export_report_photos":
-        # Выгрузить все фото 'after' только с задач со статусом "Задача завершена" для отчета
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        # Фильтруем только задачи со статусом "Задача завершена"
-        tasks = db.get_tasks(status=STATUS_APPROVED)
-        photos = []
-        for t in tasks:
-            for p in db.get_task_photos(t['task_id']):
-                if p.get('kind') == 'after' and p.get('file_path') and os.path.exists(p['file_path']):
-                    photos.append({'task_id': t['task_id'], 'file_path': p['file_path']})
+    # Очистим кэши и обновим список менеджера
+    context.user_data.pop('manager_list_message_id', None)
+    context.user_data.pop('review_list_message_id', None)
 
-        if not photos:
-            msg = (
-                "Нет фотографий для отчета. Чтобы они появились - проверьте все выполненные задачи и не удаляйте их - отчет появится здесь!"
-            )
-            keyboard = [[InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            try:
-                await query.message.reply_text(msg, reply_markup=reply_markup)
-            except:
-                await query.message.reply_text(msg, reply_markup=reply_markup)
-            return
+    try:
+        text = f"✅ Удалено {report.tasks} завершённых задач, освобождено {report.bytes_freed / (1024 * 1024):.1f} МБ."
+        if report.failures:
+            text += f"\n⚠️ Не удалось удалить файлов: {len(report.failures)}."
+        await query.message.reply_text(text)
+    except:
+        pass
 
-        total = len(photos)
-        try:
-            for i in range(0, total, 10):
-                batch = photos[i:i+10]
-                media = []
-                files = []
-                for idx, ph in enumerate(batch):
-                    f = open(ph['file_path'], 'rb')
-                    files.append(f)
-                    if idx == 0:
-                        caption = f"📸 Фото для отчета — часть {i//10 + 1}. Всего фото: {total}"
-                        media.append(InputMediaPhoto(media=f, caption=caption))
-                    else:
-                        media.append(InputMediaPhoto(media=f))
-                try:
-                    await context.bot.send_media_group(chat_id=chat_id, media=media)
-                finally:
-                    for f in files:
-                        try:
-                            f.close()
-                        except:
-                            pass
-        except Exception as e:
-            logger.error(f"Ошибка при отправке фото для отчета менеджеру {chat_id}: {e}")
-            try:
-                await query.message.reply_text(f"❌ Ошибка при отправке фото: {e}")
-            except:
-                pass
-            return
+    try:
+        await render_manager_tasks_list(update, context, base_message=None, page=0)
+    except Exception:
+        logger.exception("Не удалось обновить список менеджера после удаления завершённых задач")
 
-        # Создадим zip-архив со всеми фото и отправим его как документ
-        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-        zip_name = os.path.join(PHOTOS_DIR, f"report_photos_{timestamp}.zip")
-        try:
-            with zipfile.ZipFile(zip_name, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-                for ph in photos:
-                    src = ph['file_path']
-                    if os.path.exists(src):
-                        arcname = os.path.basename(src)
-                        zf.write(src, arcname=arcname)
-        except Exception as e:
-            logger.error(f"Ошибка при создании zip-архива: {e}")
-            try:
-                await query.message.reply_text(f"❌ Ошибка при формировании архива: {e}")
-            except:
-                pass
-            return
 
-        try:
-            with open(zip_name, 'rb') as zf:
-                await context.bot.send_document(chat_id=chat_id, document=zf, filename=os.path.basename(zip_name))
-        except Exception as e:
-            logger.error(f"Ошибка при отправке архива менеджеру {chat_id}: {e}")
-            try:
-                await query.message.reply_text(f"❌ Ошибка при отправке архива: {e}")
-            except:
-                pass
+@callback_router.exact("view_tasks_manager", role="manager")
+async def cb_view_tasks_manager(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Удаляем все сообщения текущей задачи, если они есть
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    if chat_id:
+        # Удаляем все сообщения задач (фото, кнопки)
+        task_msgs = context.user_data.get('task_view_message_ids', {})
+        for task_id_str, msg_ids in task_msgs.items():
+            for mid in msg_ids:
+                try:
+                    await context.bot.delete_message(chat_id=chat_id, message_id=mid)
+                except Exception:
+                    pass
+        # Очищаем сохраненные сообщения
+        context.user_data['task_view_message_ids'] = {}
+        # Удаляем текущее сообщение с кнопками, если оно не является списком задач
+        manager_list_id = context.user_data.get('manager_list_message_id')
+        if query.message and manager_list_id != query.message.message_id:
             try:
-                os.remove(zip_name)
-            except:
+                await query.message.delete()
+            except Exception:
                 pass
-            return
-
-        # Удалим временный zip-файл
-        try:
-            os.remove(zip_name)
-        except:
-            pass
-
-        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Назад", callback_data="view_tasks_manager")]])
+    # Редактируем сообщение списка задач обратно (начинаем с первой страницы)
+    manager_list_id = context.user_data.get('manager_list_message_id')
+    if manager_list_id and chat_id:
+        # Пытаемся отредактировать сохраненное сообщение списка
         try:
-            await context.bot.send_message(chat_id=chat_id, text="Готово — архив со всеми фото отправлен.", reply_markup=reply_markup)
-        except:
-            pass
-        return
-
-    if data == "delete_completed_tasks":
-        # Показать подтверждение удаления: сколько задач будет удалено и предупреждение
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        tasks_to_delete = db.get_tasks(status=STATUS_APPROVED) or []
-        count = len(tasks_to_delete)
-        if count == 0:
-            try:
-                await query.message.reply_text(
-                    "Нет завершённых задач для удаления.",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]])
-                )
-            except:
-                pass
+            await render_manager_tasks_list(update, context, None, page=0)
             return
-
-        text = (
-            f"⚠️ Будет удалено {count} задач(а) со статусом \"Задача завершена\".\n"
-            "Это действие не может быть отменено. Вы уверены?"
-        )
-        keyboard = [
-            [InlineKeyboardButton(f"✅ Удалить {count} задач (без восстановления)", callback_data="confirm_delete_completed")],
-            [InlineKeyboardButton("❌ Отмена", callback_data="back_to_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        try:
-            # Редактируем текущее сообщение если возможно, иначе отправим новое
-            try:
-                await query.edit_message_text(text, reply_markup=reply_markup)
-            except Exception:
-                await query.message.reply_text(text, reply_markup=reply_markup)
         except Exception:
-            logger.exception("Не удалось показать подтверждение удаления завершённых задач")
-        return
-
-    if data == "confirm_delete_completed":
-        # Выполнить окончательное удаление завершённых задач
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        tasks_to_delete = db.get_tasks(status=STATUS_APPROVED) or []
-        if not tasks_to_delete:
-            try:
-                await query.message.reply_text("Нет завершённых задач для удаления.")
-            except:
-                pass
-            return
-
-        deleted = 0
-        for t in tasks_to_delete:
-            try:
-                task_id = t['task_id']
-                purge_task_files(task_id, t)
-                db.delete_task(task_id)
-                deleted += 1
-            except Exception as e:
-                logger.error(f"Ошибка при удалении задачи #{t.get('task_id')}: {e}", exc_info=True)
-
-        # Очистим кэши и обновим список менеджера
-        context.user_data.pop('manager_list_message_id', None)
-        context.user_data.pop('review_list_message_id', None)
-
-        try:
-            await query.message.reply_text(f"✅ Удалено {deleted} завершённых задач.")
-        except:
             pass
+    # Если не получилось, пробуем отредактировать текущее сообщение
+    base_message = query.message
+    await render_manager_tasks_list(update, context, base_message, page=0)
 
-        try:
-            await render_manager_tasks_list(update, context, base_message=None, page=0)
-        except Exception:
-            logger.exception("Не удалось обновить список менеджера после удаления завершённых задач")
-        return
 
-    if data == "view_tasks_manager":
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            await query.message.reply_text("❌ У вас нет доступа к этой функции.")
-            return
-        # Удаляем все сообщения текущей задачи, если они есть
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        if chat_id:
-            # Удаляем все сообщения задач (фото, кнопки)
-            task_msgs = context.user_data.get('task_view_message_ids', {})
-            for task_id_str, msg_ids in task_msgs.items():
-                for mid in msg_ids:
-                    try:
-                        await context.bot.delete_message(chat_id=chat_id, message_id=mid)
-                    except Exception:
-                        pass
-            # Очищаем сохраненные сообщения
-            context.user_data['task_view_message_ids'] = {}
-            # Удаляем текущее сообщение с кнопками, если оно не является списком задач
-            manager_list_id = context.user_data.get('manager_list_message_id')
-            if query.message and manager_list_id != query.message.message_id:
-                try:
-                    await query.message.delete()
-                except Exception:
-                    pass
-        # Редактируем сообщение списка задач обратно (начинаем с первой страницы)
-        manager_list_id = context.user_data.get('manager_list_message_id')
-        if manager_list_id and chat_id:
-            # Пытаемся отредактировать сохраненное сообщение списка
-            try:
-                await render_manager_tasks_list(update, context, None, page=0)
-                return
-            except Exception:
-                pass
-        # Если не получилось, пробуем отредактировать текущее сообщение
-        base_message = query.message
-        await render_manager_tasks_list(update, context, base_message, page=0)
-        return
+@callback_router.exact("tasks_page_info")
+async def cb_tasks_page_info(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Просто показываем информацию о странице (не переключаем)
+    await query.answer()
+
 
-    if data == "tasks_page_info":
-        # Просто показываем информацию о странице (не переключаем)
+@callback_router.prefix("tasks_page_", role="manager")
+async def cb_tasks_page(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Обработка навигации по страницам списка задач
+    try:
+        page = int(call.arg)
+    except (ValueError, IndexError):
+        page = 0
+    # Отвечаем на callback сразу
+    try:
         await query.answer()
+    except Exception:
+        pass
+    base_message = query.message
+    await render_manager_tasks_list(update, context, base_message, page=page)
+
+
+@callback_router.exact("view_tasks_executor")
+async def cb_view_tasks_executor(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query, user_id, username = call.query, call.user_id, call.username
+    user_category = await db.get_user_category(user_id)
+    if not user_category:
+        await query.answer("Сначала выберите категорию.")
+        if query.message:
+            await send_category_selection(query.message, username)
         return
-
-    if data.startswith("tasks_page_"):
-        # Обработка навигации по страницам списка задач
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        try:
-            page = int(data.split("_")[-1])
-        except (ValueError, IndexError):
-            page = 0
-        # Отвечаем на callback сразу
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    current_task_id = context.user_data.get('current_executor_task_id')
+    if current_task_id and chat_id:
+        await cleanup_executor_task_messages(context, chat_id, current_task_id)
+    list_id = context.user_data.get('executor_list_message_id')
+    use_current_message = query.message and list_id == query.message.message_id
+    base_message = query.message if use_current_message else None
+    await render_executor_tasks_list(context, user_id, chat_id, base_message=base_message)
+    if query.message and not use_current_message:
         try:
-            await query.answer()
+            await query.message.delete()
         except Exception:
             pass
-        base_message = query.message
-        await render_manager_tasks_list(update, context, base_message, page=page)
-        return
 
-    if data == "view_tasks_executor":
-        user_category = db.get_user_category(user_id)
-        if not user_category:
-            await query.answer("Сначала выберите категорию.")
-            if query.message:
-                await send_category_selection(query.message, username)
-            return
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        current_task_id = context.user_data.get('current_executor_task_id')
-        if current_task_id and chat_id:
-            await cleanup_executor_task_messages(context, chat_id, current_task_id)
-        list_id = context.user_data.get('executor_list_message_id')
-        use_current_message = query.message and list_id == query.message.message_id
-        base_message = query.message if use_current_message else None
-        await render_executor_tasks_list(context, user_id, chat_id, base_message=base_message)
-        if query.message and not use_current_message:
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
-        return
 
-    if data == "review_tasks":
-        if role != "manager":
-            try:
-                await query.edit_message_text("❌ У вас нет доступа к этой функции.")
-            except:
-                await query.message.edit_text("❌ У вас нет доступа к этой функции.")
-            return
-        # Удаляем из чата сообщения открытой задачи (шапка/альбом "до" и "после", кнопки), если они были
+@callback_router.exact("review_tasks", role="manager")
+async def cb_review_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Удаляем из чата сообщения открытой задачи (шапка/альбом "до" и "после", кнопки), если они были
+    try:
+        chat_id = query.message.chat_id if query.message else update.effective_chat.id
+        last_task_id = context.user_data.get('last_review_task_id')
+        if last_task_id is not None:
+            review_msgs = context.user_data.get('review_message_ids', {})
+            ids = review_msgs.get(str(last_task_id), [])
+            for mid in ids:
+                try:
+                    await context.bot.delete_message(chat_id=chat_id, message_id=mid)
+                except:
+                    pass
+            if str(last_task_id) in review_msgs:
+                review_msgs.pop(str(last_task_id), None)
+                context.user_data['review_message_ids'] = review_msgs
+            context.user_data.pop('last_review_task_id', None)
+    except:
+        pass
+    tasks = await db.get_tasks(status=STATUS_COMPLETED)
+    # Для заголовка нужны только количества — без чтения всех задач
+    status_counts = await db.count_tasks_by_status()
+    total_count = sum(status_counts.values())
+    approved_count = status_counts.get(STATUS_APPROVED, 0)
+    if not tasks:
+        keyboard = [[InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Возврат из этого экрана должен вести в меню менеджера
+        context.user_data['return_to'] = 'manager_menu'
         try:
+            await query.edit_message_text("📭 Нет задач на проверку.", reply_markup=reply_markup)
+            context.user_data['review_list_message_id'] = query.message.message_id
+        except:
+            # Если текущее сообщение медиа — редактируем сохранённый список и удаляем текущее
+            list_id = context.user_data.get('review_list_message_id')
             chat_id = query.message.chat_id if query.message else update.effective_chat.id
-            last_task_id = context.user_data.get('last_review_task_id')
-            if last_task_id is not None:
-                review_msgs = context.user_data.get('review_message_ids', {})
-                ids = review_msgs.get(str(last_task_id), [])
-                for mid in ids:
+            if list_id:
+                try:
+                    await context.bot.edit_message_text(chat_id=chat_id, message_id=list_id, text="📭 Нет задач на проверку.", reply_markup=reply_markup)
                     try:
-                        await context.bot.delete_message(chat_id=chat_id, message_id=mid)
+                        await query.message.delete()
                     except:
                         pass
-                if str(last_task_id) in review_msgs:
-                    review_msgs.pop(str(last_task_id), None)
-                    context.user_data['review_message_ids'] = review_msgs
-                context.user_data.pop('last_review_task_id', None)
-        except:
-            pass
-        tasks = db.get_tasks(status=STATUS_COMPLETED)
-        all_tasks = db.get_tasks()
-        approved_tasks = db.get_tasks(status=STATUS_APPROVED)
-        if not tasks:
-            keyboard = [[InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            # Возврат из этого экрана должен вести в меню менеджера
-            context.user_data['return_to'] = 'manager_menu'
-            try:
-                await query.edit_message_text("📭 Нет задач на проверку.", reply_markup=reply_markup)
-                context.user_data['review_list_message_id'] = query.message.message_id
-            except:
-                # Если текущее сообщение медиа — редактируем сохранённый список и удаляем текущее
-                list_id = context.user_data.get('review_list_message_id')
-                chat_id = query.message.chat_id if query.message else update.effective_chat.id
-                if list_id:
-                    try:
-                        await context.bot.edit_message_text(chat_id=chat_id, message_id=list_id, text="📭 Нет задач на проверку.", reply_markup=reply_markup)
-                        try:
-                            await query.message.delete()
-                        except:
-                            pass
-                    except:
-                        await query.message.edit_text("📭 Нет задач на проверку.", reply_markup=reply_markup)
-                        context.user_data['review_list_message_id'] = query.message.message_id
-                else:
+                except:
                     await query.message.edit_text("📭 Нет задач на проверку.", reply_markup=reply_markup)
                     context.user_data['review_list_message_id'] = query.message.message_id
-            return
-        
-        keyboard = []
-        for task in tasks:
-            priority = task.get('priority', 'normal')
-            priority_text = " 🔴 Высокий" if priority == 'high' else " 🟢 Обычный"
-            keyboard.append([InlineKeyboardButton(
-                f"Задача #{task['task_id']}{priority_text}",
-                callback_data=f"review_{task['task_id']}"
-            )])
-        keyboard.append([InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        # Возврат из этого экрана должен вести в меню менеджера
-        context.user_data['return_to'] = 'manager_menu'
-        # Всегда стараемся отредактировать сохранённое сообщение списка, а текущее — удалить
-        list_id = context.user_data.get('review_list_message_id')
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        if list_id:
+            else:
+                await query.message.edit_text("📭 Нет задач на проверку.", reply_markup=reply_markup)
+                context.user_data['review_list_message_id'] = query.message.message_id
+        return
+    
+    keyboard = []
+    for task in tasks:
+        priority = task.get('priority', 'normal')
+        priority_text = " 🔴 Высокий" if priority == 'high' else " 🟢 Обычный"
+        keyboard.append([InlineKeyboardButton(
+            f"Задача #{task['task_id']}{priority_text}",
+            callback_data=f"review_{task['task_id']}"
+        )])
+    keyboard.append([InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Возврат из этого экрана должен вести в меню менеджера
+    context.user_data['return_to'] = 'manager_menu'
+    # Всегда стараемся отредактировать сохранённое сообщение списка, а текущее — удалить
+    list_id = context.user_data.get('review_list_message_id')
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    if list_id:
+        try:
+            await context.bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=list_id,
+                text=f"✅ Выберите задачу для проверки:\nВсего задач: {total_count} | На проверке: {len(tasks)} | Завершено: {approved_count}",
+                reply_markup=reply_markup
+            )
+        except Exception:
+            # Если по какой-то причине нельзя — используем текущее сообщение
             try:
-                await context.bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=list_id,
-                    text=f"✅ Выберите задачу для проверки:\nВсего задач: {len(all_tasks)} | На проверке: {len(tasks)} | Завершено: {len(approved_tasks)}",
+                await query.edit_message_text(
+                    f"✅ Выберите задачу для проверки:\n"
+                    f"Всего задач: {total_count} | На проверке: {len(tasks)} | Завершено: {approved_count}",
                     reply_markup=reply_markup
                 )
-            except Exception:
-                # Если по какой-то причине нельзя — используем текущее сообщение
-                try:
-                    await query.edit_message_text(
-                        f"✅ Выберите задачу для проверки:\n"
-                        f"Всего задач: {len(all_tasks)} | На проверке: {len(tasks)} | Завершено: {len(approved_tasks)}",
-                        reply_markup=reply_markup
-                    )
-                    context.user_data['review_list_message_id'] = query.message.message_id
-                except Exception:
-                    pass
-            # Удаляем текущее сообщение, если оно отличается
-            try:
-                if query.message and query.message.message_id != list_id:
-                    await query.message.delete()
+                context.user_data['review_list_message_id'] = query.message.message_id
             except Exception:
                 pass
-        else:
+        # Удаляем текущее сообщение, если оно отличается
+        try:
+            if query.message and query.message.message_id != list_id:
+                await query.message.delete()
+        except Exception:
+            pass
+    else:
+        try:
+            await query.edit_message_text(
+                f"✅ Выберите задачу для проверки:\n"
+                f"Всего задач: {total_count} | На проверке: {len(tasks)} | Завершено: {approved_count}",
+                reply_markup=reply_markup
+            )
+            context.user_data['review_list_message_id'] = query.message.message_id
+        except Exception:
             try:
-                await query.edit_message_text(
+                await query.message.edit_text(
                     f"✅ Выберите задачу для проверки:\n"
-                    f"Всего задач: {len(all_tasks)} | На проверке: {len(tasks)} | Завершено: {len(approved_tasks)}",
+                    f"Всего задач: {total_count} | На проверке: {len(tasks)} | Завершено: {approved_count}",
                     reply_markup=reply_markup
                 )
                 context.user_data['review_list_message_id'] = query.message.message_id
             except Exception:
-                try:
-                    await query.message.edit_text(
-                        f"✅ Выберите задачу для проверки:\n"
-                        f"Всего задач: {len(all_tasks)} | На проверке: {len(tasks)} | Завершено: {len(approved_tasks)}",
-                        reply_markup=reply_markup
-                    )
-                    context.user_data['review_list_message_id'] = query.message.message_id
-                except Exception:
-                    pass
-        return
-
-    if data.startswith("view_task_photo_"):
-        task_id = int(data.split("_")[-1])
-        task = db.get_task(task_id)
-        if not task:
-            await query.answer("❌ Задача не найдена.")
-            await query.message.reply_text("❌ Задача не найдена.")
-            return
-        
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            await query.message.reply_text("❌ У вас нет доступа к этой функции.")
-            return
-        
-        # Подготавливаем кнопки в зависимости от статуса задачи
-        if task['status'] == STATUS_APPROVED:
-            # Для завершенных задач - кнопка "Фото для отчета" и удаление без подтверждения
-            keyboard = [
-                [InlineKeyboardButton("📸 Фото для отчета", callback_data=f"report_photo_{task_id}")],
-                [InlineKeyboardButton("🗑️ Удалить задачу", callback_data=f"delete_approved_{task_id}")],
-                [InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]
-            ]
-        else:
-            # Для незавершенных задач - обычные кнопки редактирования
-            keyboard = [
-                [InlineKeyboardButton("✏️ Изменить комментарий", callback_data=f"edit_comment_{task_id}")],
-                [InlineKeyboardButton("📷 Изменить фото", callback_data=f"edit_photo_{task_id}")],
-                [InlineKeyboardButton("🗑️ Удалить задачу", callback_data=f"delete_task_{task_id}")],
-                [InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]
-            ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Собираем все фото "до" из расширенной таблицы
-        before_photos = [p for p in db.get_task_photos(task_id) if p.get('kind') == 'before' and p.get('file_path') and os.path.exists(p['file_path'])]
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        # Отправляем альбом "до" (если есть)
-        if before_photos:
-            # Сначала изменяем сообщение "Все задачи:" на заголовок выбранной задачи
-            try:
-                await query.edit_message_text(f"📷 Задача #{task_id}")
-            except:
-                pass
-            # Запоминаем id сообщения-списка, чтобы по кнопке "Назад" редактировать именно его
-            try:
-                context.user_data['manager_list_message_id'] = query.message.message_id
-            except:
                 pass
-            media = []
-            files = []
-            for idx, ph in enumerate(before_photos):
-                f = open(ph['file_path'], 'rb')
-                files.append(f)
-                if idx == 0:
-                    caption = format_task_details(task)
-                    media.append(InputMediaPhoto(media=f, caption=caption))
-                else:
-                    media.append(InputMediaPhoto(media=f))
-            try:
-                sent_messages = await context.bot.send_media_group(chat_id=chat_id, media=media)
-                # Сохраняем отправленные message_id для возможного удаления при "Удалить задачу"
-                task_msgs = context.user_data.get('task_view_message_ids', {})
-                ids = [m.message_id for m in sent_messages]
-                task_msgs[str(task_id)] = ids
-                context.user_data['task_view_message_ids'] = task_msgs
-            finally:
-                for f in files:
-                    try:
-                        f.close()
-                    except:
-                        pass
-        else:
-            # Если фото нет, просто текст с описанием задачи
-            text = format_task_details(task) + "\n\n⚠️ Фото не найдено."
-            try:
-                await query.edit_message_text(text)
-            except:
-                await query.message.edit_text(text)
-        # Отдельным сообщением — кнопки управления
-        action_msg = await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-        # Сохраним и это сообщение-кнопки чтобы удалить при удалении задачи
-        task_msgs = context.user_data.get('task_view_message_ids', {})
-        btn_ids = task_msgs.get(str(task_id), [])
-        btn_ids.append(action_msg.message_id)
-        task_msgs[str(task_id)] = btn_ids
-        context.user_data['task_view_message_ids'] = task_msgs
-        return
 
-    if data.startswith("edit_comment_"):
-        task_id = int(data.split("_")[-1])
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        context.user_data['editing_comment'] = True
-        context.user_data['task_id'] = task_id
-        keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data=f"view_task_photo_{task_id}")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(
-            f"✏️ Введите новый комментарий для задачи #{task_id}:",
-            reply_markup=reply_markup
-        )
-        return
 
-    if data.startswith("edit_photo_"):
-        task_id = int(data.split("_")[-1])
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        context.user_data['editing_photo'] = True
-        context.user_data['task_id'] = task_id
-        keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data=f"view_task_photo_{task_id}")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(
-            f"📷 Отправьте новое фото для задачи #{task_id}:",
-            reply_markup=reply_markup
-        )
+@callback_router.prefix("view_task_photo_", role="manager")
+async def cb_view_task_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    task = await db.get_task(task_id)
+    if not task:
+        await query.answer("❌ Задача не найдена.")
+        await query.message.reply_text("❌ Задача не найдена.")
         return
-
-    if data.startswith("delete_task_"):
-        task_id = int(data.split("_")[-1])
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        
-        # Проверяем, существует ли задача
-        task = db.get_task(task_id)
-        if not task:
-            await query.answer("❌ Задача не найдена.")
-            await query.edit_message_text("❌ Задача не найдена.")
-            return
-        
+    
+    # Подготавливаем кнопки в зависимости от статуса задачи
+    if task['status'] == STATUS_APPROVED:
+        # Для завершенных задач - кнопка "Фото для отчета" и удаление без подтверждения
         keyboard = [
-            [InlineKeyboardButton("✅ Да, удалить", callback_data=f"confirm_delete_{task_id}")],
-            [InlineKeyboardButton("❌ Оставить задачу", callback_data=f"keep_task_{task_id}")]
+            [InlineKeyboardButton("📸 Фото для отчета", callback_data=f"report_photo_{task_id}")],
+            [InlineKeyboardButton("🗑️ Удалить задачу", callback_data=f"delete_approved_{task_id}")],
+            [InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]
         ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        text = f"⚠️ Вы уверены, что хотите удалить задачу #{task_id}?\n\nЭто действие нельзя отменить!"
+    else:
+        # Для незавершенных задач - обычные кнопки редактирования
+        keyboard = [
+            [InlineKeyboardButton("✏️ Изменить комментарий", callback_data=f"edit_comment_{task_id}")],
+            [InlineKeyboardButton("📷 Изменить фото", callback_data=f"edit_photo_{task_id}")],
+            [InlineKeyboardButton("🗑️ Удалить задачу", callback_data=f"delete_task_{task_id}")],
+            [InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]
+        ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    # Собираем все фото "до" из расширенной таблицы
+    before_photos = await available_photos([p for p in await db.get_task_photos(task_id) if p.get('kind') == 'before'])
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    # Отправляем альбом "до" (если есть)
+    if before_photos:
+        # Сначала изменяем сообщение "Все задачи:" на заголовок выбранной задачи
         try:
-            await query.edit_message_text(text, reply_markup=reply_markup)
-        except Exception:
-            await query.message.edit_text(text, reply_markup=reply_markup)
+            await query.edit_message_text(f"📷 Задача #{task_id}")
+        except:
+            pass
+        # Запоминаем id сообщения-списка, чтобы по кнопке "Назад" редактировать именно его
+        try:
+            context.user_data['manager_list_message_id'] = query.message.message_id
+        except:
+            pass
+        caption = await format_task_details(task)
+        sent_messages = await media_sender.send_album(context.bot, chat_id, before_photos, caption)
+        # Сохраняем отправленные message_id для возможного удаления при "Удалить задачу"
+        task_msgs = context.user_data.get('task_view_message_ids', {})
+        ids = [m.message_id for m in sent_messages]
+        task_msgs[str(task_id)] = ids
+        context.user_data['task_view_message_ids'] = task_msgs
+    else:
+        # Если фото нет, просто текст с описанием задачи
+        text = await format_task_details(task) + "\n\n⚠️ Фото не найдено."
+        try:
+            await query.edit_message_text(text)
+        except:
+            await query.message.edit_text(text)
+    # Отдельным сообщением — кнопки управления
+    action_msg = await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+    # Сохраним и это сообщение-кнопки чтобы удалить при удалении задачи
+    task_msgs = context.user_data.get('task_view_message_ids', {})
+    btn_ids = task_msgs.get(str(task_id), [])
+    btn_ids.append(action_msg.message_id)
+    task_msgs[str(task_id)] = btn_ids
+    context.user_data['task_view_message_ids'] = task_msgs
+
+
+@callback_router.prefix("edit_comment_", role="manager")
+async def cb_edit_comment(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    context.user_data['editing_comment'] = True
+    context.user_data['task_id'] = task_id
+    keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data=f"view_task_photo_{task_id}")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await query.message.reply_text(
+        f"✏️ Введите новый комментарий для задачи #{task_id}:",
+        reply_markup=reply_markup
+    )
+
+
+@callback_router.prefix("edit_photo_", role="manager")
+async def cb_edit_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    context.user_data['editing_photo'] = True
+    context.user_data['task_id'] = task_id
+    keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data=f"view_task_photo_{task_id}")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await query.message.reply_text(
+        f"📷 Отправьте новое фото для задачи #{task_id}:",
+        reply_markup=reply_markup
+    )
+
+
+@callback_router.prefix("delete_task_", role="manager")
+async def cb_delete_task(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    # Проверяем, существует ли задача
+    task = await db.get_task(task_id)
+    if not task:
+        await query.answer("❌ Задача не найдена.")
+        await query.edit_message_text("❌ Задача не найдена.")
         return
+    
+    keyboard = [
+        [InlineKeyboardButton("✅ Да, удалить", callback_data=f"confirm_delete_{task_id}")],
+        [InlineKeyboardButton("❌ Оставить задачу", callback_data=f"keep_task_{task_id}")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    text = f"⚠️ Вы уверены, что хотите удалить задачу #{task_id}?\n\nЭто действие нельзя отменить!"
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    except Exception:
+        await query.message.edit_text(text, reply_markup=reply_markup)
 
-    if data.startswith("keep_task_"):
-        task_id = int(data.split("_")[-1])
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
+
+@callback_router.prefix("keep_task_")
+async def cb_keep_task(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    try:
+        await query.message.delete()
+    except Exception:
+        pass
+    if chat_id:
+        await cleanup_manager_task_messages(context, chat_id, task_id)
+    await render_manager_tasks_list(update, context, page=0)
+    keyboard = [[InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    if chat_id:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"❎ Задача #{task_id} сохранена. Возвращаюсь к списку задач.",
+        reply_markup=reply_markup
+    )
+
+
+@callback_router.prefix("delete_approved_", role="manager")
+async def cb_delete_approved(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    # Удаление завершенной задачи без подтверждения
+    task_id = int(call.arg)
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    await photo_store.purge_tasks([task_id])
+    if chat_id:
+        await cleanup_manager_task_messages(context, chat_id, task_id)
+        await cleanup_review_task_messages(context, chat_id, task_id)
+    tasks = await db.get_tasks(status=STATUS_COMPLETED)
+    # Для заголовка нужны только количества — без чтения всех задач
+    status_counts = await db.count_tasks_by_status()
+    total_count = sum(status_counts.values())
+    approved_count = status_counts.get(STATUS_APPROVED, 0)
+    keyboard = []
+    for t in tasks:
+        pr = t.get('priority', 'normal')
+        pr_text = " 🔴 Высокий" if pr == 'high' else " 🟢 Обычный"
+        keyboard.append([InlineKeyboardButton(f"Задача #{t['task_id']}{pr_text}", callback_data=f"review_{t['task_id']}")])
+    keyboard.append([InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    text = (
+        f"✅ Выберите задачу для проверки:\n"
+        f"Всего задач: {total_count} | На проверке: {len(tasks)} | Завершено: {approved_count}"
+    )
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+        context.user_data['review_list_message_id'] = query.message.message_id
+    except Exception:
         try:
-            await query.message.delete()
+            sent = await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+            context.user_data['review_list_message_id'] = sent.message_id
         except Exception:
             pass
-        if chat_id:
-            await cleanup_manager_task_messages(context, chat_id, task_id)
-        await render_manager_tasks_list(update, context, page=0)
-        keyboard = [[InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        if chat_id:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=f"❎ Задача #{task_id} сохранена. Возвращаюсь к списку задач.",
-            reply_markup=reply_markup
-        )
-        return
 
-    if data.startswith("delete_approved_"):
-        # Удаление завершенной задачи без подтверждения
-        task_id = int(data.split("_")[-1])
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        task = db.get_task(task_id)
-        purge_task_files(task_id, task)
-        db.delete_task(task_id)
-        if chat_id:
-            await cleanup_manager_task_messages(context, chat_id, task_id)
-            await cleanup_review_task_messages(context, chat_id, task_id)
-        tasks = db.get_tasks(status=STATUS_COMPLETED)
-        all_tasks = db.get_tasks()
-        approved_tasks = db.get_tasks(status=STATUS_APPROVED)
-        keyboard = []
-        for t in tasks:
-            pr = t.get('priority', 'normal')
-            pr_text = " 🔴 Высокий" if pr == 'high' else " 🟢 Обычный"
-            keyboard.append([InlineKeyboardButton(f"Задача #{t['task_id']}{pr_text}", callback_data=f"review_{t['task_id']}")])
-        keyboard.append([InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        text = (
-            f"✅ Выберите задачу для проверки:\n"
-            f"Всего задач: {len(all_tasks)} | На проверке: {len(tasks)} | Завершено: {len(approved_tasks)}"
-        )
+
+@callback_router.prefix("confirm_delete_", role="manager")
+async def cb_confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    await photo_store.purge_tasks([task_id])
+    if chat_id:
+        await cleanup_manager_task_messages(context, chat_id, task_id)
+    try:
+        await query.message.delete()
+    except Exception:
+        pass
+    await render_manager_tasks_list(update, context, page=0)
+    keyboard = [[InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    if chat_id:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"✅ Задача #{task_id} успешно удалена.",
+        reply_markup=reply_markup
+    )
+
+
+@callback_router.prefix("report_photo_", role="manager")
+async def cb_report_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query, username = call.query, call.username
+    # Показываем фото исполнителя для отчета
+    task_id = int(call.arg)
+    task = await db.get_task(task_id)
+    if not task:
+        await query.answer("❌ Задача не найдена.")
+        return
+    
+    if task['status'] != STATUS_APPROVED:
+        await query.answer("❌ Эта функция доступна только для завершенных задач.")
+        return
+    
+    # Отправляем весь альбом фото исполнителя (kind='after') из расширенной таблицы
+    after_list = await available_photos([p for p in await db.get_task_photos(task_id) if p.get('kind') == 'after'])
+    keyboard = [
+        [InlineKeyboardButton("🗑️ Удалить задачу", callback_data=f"delete_approved_{task_id}")],
+        [InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    if after_list:
+        if task['completed_by']:
+            username = await db.get_username(task['completed_by'])
+            if username:
+                caption = f"📸 Фото для отчета - Задача #{task_id}\nИсполнитель: @{username}"
+            else:
+                caption = f"📸 Фото для отчета - Задача #{task_id}\nИсполнитель ID: {task['completed_by']}"
+        else:
+            caption = f"📸 Фото для отчета - Задача #{task_id}"
+        sent_group = await media_sender.send_album(context.bot, chat_id, after_list, caption,
+                                                  variant=REPORT_PHOTO_VARIANT)
+        # После альбома отправим кнопки отдельным сообщением
+        btn_msg = await context.bot.send_message(chat_id=chat_id, text="Действия:", reply_markup=reply_markup)
+        # Сохраняем id сообщений для последующего удаления
         try:
-            await query.edit_message_text(text, reply_markup=reply_markup)
-            context.user_data['review_list_message_id'] = query.message.message_id
-        except Exception:
-            try:
-                sent = await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
-                context.user_data['review_list_message_id'] = sent.message_id
-            except Exception:
-                pass
+            task_msgs = context.user_data.get('task_view_message_ids', {})
+            ids = task_msgs.get(str(task_id), [])
+            if sent_group and len(sent_group) > 0:
+                ids.extend([m.message_id for m in sent_group])
+            ids.append(btn_msg.message_id)
+            task_msgs[str(task_id)] = ids
+            context.user_data['task_view_message_ids'] = task_msgs
+        except:
+            pass
+        # Убираем кнопки у исходного сообщения
+        try:
+            await query.edit_message_caption(caption=query.message.caption, reply_markup=None)
+        except:
+            pass
+    else:
+        await query.message.reply_text("⚠️ Фото исполнителя не найдено.", reply_markup=reply_markup)
+
+
+@callback_router.prefix("task_")
+async def cb_task(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    task = await db.get_task(task_id)
+    if not task:
+        await query.answer("❌ Задача не найдена.")
+        await query.edit_message_text("❌ Задача не найдена.")
         return
+    executor_task_msgs = context.user_data.get('executor_task_message_ids', {}) or {}
+    executor_task_msgs.pop(str(task_id), None)
+    task_message_ids = []
+    
+    # Подготавливаем кнопки действий
+    keyboard = [
+        [InlineKeyboardButton("✅ Выполнено", callback_data=f"complete_{task_id}")],
+        [InlineKeyboardButton("◀️ Назад", callback_data="view_tasks_executor")],
+        [InlineKeyboardButton("🚪 Выйти", callback_data="restart")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    priority = task.get('priority', 'normal')
+    priority_text = "\n🔴 ВЫСОКИЙ ПРИОРИТЕТ!" if priority == 'high' else ""
+    header_text = f"📋 Задача #{task_id}{priority_text}\n\n{task['comment']}\n\nСтатус: {task['status']}"
+    # Удаляем исходное сообщение списка, чтобы не было "первого" сообщения
+    try:
+        await query.message.delete()
+    except Exception:
+        pass
 
-    if data.startswith("confirm_delete_"):
-        task_id = int(data.split("_")[-1])
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        task = db.get_task(task_id)
-        purge_task_files(task_id, task)
-        db.delete_task(task_id)
-        if chat_id:
-            await cleanup_manager_task_messages(context, chat_id, task_id)
+    # Собираем все фото "до" и отправляем как альбом
+    before_photos = await available_photos([p for p in await db.get_task_photos(task_id) if p.get('kind') == 'before'])
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    sent_any = False
+    if before_photos:
+        sent_group = await media_sender.send_album(context.bot, chat_id, before_photos, header_text)
+        task_message_ids.extend([m.message_id for m in sent_group])
+        sent_any = True
+    # После фото отправляем отдельное сообщение с кнопками действий
+    try:
+        action_msg = await context.bot.send_message(chat_id=chat_id, text="Выберите действие:", reply_markup=reply_markup)
+        task_message_ids.append(action_msg.message_id)
+    except Exception:
         try:
-            await query.message.delete()
+            action_msg = await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
+            task_message_ids.append(action_msg.message_id)
         except Exception:
             pass
-        await render_manager_tasks_list(update, context, page=0)
-        keyboard = [[InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        if chat_id:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=f"✅ Задача #{task_id} успешно удалена.",
-            reply_markup=reply_markup
-        )
+    executor_task_msgs[str(task_id)] = task_message_ids
+    context.user_data['executor_task_message_ids'] = executor_task_msgs
+    context.user_data['current_executor_task_id'] = task_id
+
+
+@callback_router.prefix("complete_")
+async def cb_complete(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    context.user_data['completing_task'] = True
+    context.user_data['task_id'] = task_id
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    if chat_id:
+        await cleanup_executor_task_messages(context, chat_id, task_id)
+
+    keyboard = [[InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await query.message.reply_text(
+        "📸 Отправьте фотографию выполненной работы.\n"
+        "Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.",
+        reply_markup=reply_markup
+    )
+
+
+@callback_router.prefix("review_")
+async def cb_review(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query, username = call.query, call.username
+    task_id = int(call.arg)
+    task = await db.get_task(task_id)
+    if not task:
+        await query.message.reply_text("❌ Задача не найдена.")
         return
+    # Помечаем возврат в меню менеджера
+    context.user_data['return_to'] = 'manager_menu'
+    # Сохраняем id последней открытой задачи для последующей очистки сообщений
+    context.user_data['last_review_task_id'] = task_id
+    review_msgs = context.user_data.get('review_message_ids', {}) or {}
+    task_msg_ids = review_msgs.get(str(task_id), [])
+    
+    # Подготавливаем кнопки действий
+    keyboard = [
+        [InlineKeyboardButton("✅ Задача завершена", callback_data=f"approve_{task_id}")],
+        [InlineKeyboardButton("❌ Переделать", callback_data=f"redo_{task_id}")],
+        [InlineKeyboardButton("◀️ Назад", callback_data="review_tasks")],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    # Заголовок
+    priority = task.get('priority', 'normal')
+    priority_text = " 🔴 Высокий приоритет" if priority == 'high' else " 🟢 Обычный приоритет"
+    header_text = f"📋 Задача #{task_id}{priority_text}\n\nКомментарий: {task['comment']}\nСтатус: {task['status']}"
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
 
-    if data.startswith("report_photo_"):
-        # Показываем фото исполнителя для отчета
-        task_id = int(data.split("_")[-1])
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        
-        task = db.get_task(task_id)
-        if not task:
-            await query.answer("❌ Задача не найдена.")
-            return
-        
-        if task['status'] != STATUS_APPROVED:
-            await query.answer("❌ Эта функция доступна только для завершенных задач.")
-            return
-        
-        # Отправляем весь альбом фото исполнителя (kind='after') из расширенной таблицы
-        after_list = [p for p in db.get_task_photos(task_id) if p.get('kind') == 'after' and p.get('file_path') and os.path.exists(p['file_path'])]
-        keyboard = [
-            [InlineKeyboardButton("🗑️ Удалить задачу", callback_data=f"delete_approved_{task_id}")],
-            [InlineKeyboardButton("◀️ Назад к списку задач", callback_data="view_tasks_manager")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        if after_list:
-            if task['completed_by']:
-                username = db.get_username(task['completed_by'])
-                if username:
-                    caption = f"📸 Фото для отчета - Задача #{task_id}\nИсполнитель: @{username}"
-                else:
-                    caption = f"📸 Фото для отчета - Задача #{task_id}\nИсполнитель ID: {task['completed_by']}"
+    # Удаляем исходное сообщение списка, чтобы не было лишнего первого сообщения
+    try:
+        await query.message.delete()
+    except Exception:
+        pass
+    # Сбрасываем сохраненный id списка, он больше не актуален
+    try:
+        context.user_data.pop('review_list_message_id', None)
+    except Exception:
+        pass
+    # Альбомы "до" (менеджер) и "после" (исполнитель) из расширенной таблицы
+    task_photos = (await db.get_task_photos_bulk([task_id]))[task_id]
+    before_list = await available_photos(task_photos.get('before', []))
+    after_list = await available_photos(task_photos.get('after', []))
+    # Отправляем "до"
+    if before_list:
+        sent_group = await media_sender.send_album(context.bot, chat_id, before_list, header_text,
+                                                  variant=REVIEW_PHOTO_VARIANT)
+        if sent_group:
+            task_msg_ids.extend([m.message_id for m in sent_group])
+    else:
+        # Нет фото "до" — отправим шапку
+        header_msg = await query.message.reply_text(header_text)
+        task_msg_ids.append(header_msg.message_id)
+    # Отправляем "после"
+    if after_list:
+        if task['completed_by']:
+            username = await db.get_username(task['completed_by'])
+            if username:
+                after_caption = f"Исполнитель @{username} прикрепил фото к задаче #{task_id}"
             else:
-                caption = f"📸 Фото для отчета - Задача #{task_id}"
-            media = []
-            files = []
-            for idx, ph in enumerate(after_list):
-                f = open(ph['file_path'], 'rb')
-                files.append(f)
-                if idx == 0:
-                    media.append(InputMediaPhoto(media=f, caption=caption))
-                else:
-                    media.append(InputMediaPhoto(media=f))
-            try:
-                sent_group = await context.bot.send_media_group(chat_id=chat_id, media=media)
-                # После альбома отправим кнопки отдельным сообщением
-                btn_msg = await context.bot.send_message(chat_id=chat_id, text="Действия:", reply_markup=reply_markup)
-                # Сохраняем id сообщений для последующего удаления
-                try:
-                    task_msgs = context.user_data.get('task_view_message_ids', {})
-                    ids = task_msgs.get(str(task_id), [])
-                    if sent_group and len(sent_group) > 0:
-                        ids.extend([m.message_id for m in sent_group])
-                    ids.append(btn_msg.message_id)
-                    task_msgs[str(task_id)] = ids
-                    context.user_data['task_view_message_ids'] = task_msgs
-                except:
-                    pass
-            finally:
-                for f in files:
-                    try:
-                        f.close()
-                    except:
-                        pass
-            # Убираем кнопки у исходного сообщения
-            try:
-                await query.edit_message_caption(caption=query.message.caption, reply_markup=None)
-            except:
-                pass
+                after_caption = f"Исполнитель (ID: {task['completed_by']}) прикрепил фото к задаче #{task_id}"
         else:
-            await query.message.reply_text("⚠️ Фото исполнителя не найдено.", reply_markup=reply_markup)
-        return
+            after_caption = f"Исполнитель прикрепил фото к задаче #{task_id}"
+        sent_after = await media_sender.send_album(context.bot, chat_id, after_list, after_caption,
+                                                  variant=REVIEW_PHOTO_VARIANT)
+        if sent_after:
+            task_msg_ids.extend([m.message_id for m in sent_after])
+        # Сообщение с кнопками отдельно
+        sent_btn = await context.bot.send_message(chat_id=chat_id, text="Выберите действие:", reply_markup=reply_markup)
+        task_msg_ids.append(sent_btn.message_id)
+    else:
+        # Нет фото "после" — отправляем предупреждение с кнопками
+        sent = await context.bot.send_message(chat_id=chat_id, text="⚠️ Исполнитель не прикрепил фото результата.", reply_markup=reply_markup)
+        task_msg_ids.append(sent.message_id)
+    review_msgs[str(task_id)] = task_msg_ids
+    context.user_data['review_message_ids'] = review_msgs
+    
+    # Сообщение списка уже отредактировано выше, дополнительные кнопки убраны вместе с заменой текста
 
-    if data.startswith("task_"):
-        task_id = int(data.split("_")[1])
-        task = db.get_task(task_id)
-        if not task:
-            await query.answer("❌ Задача не найдена.")
-            await query.edit_message_text("❌ Задача не найдена.")
-            return
-        executor_task_msgs = context.user_data.get('executor_task_message_ids', {}) or {}
-        executor_task_msgs.pop(str(task_id), None)
-        task_message_ids = []
-        
-        # Подготавливаем кнопки действий
-        keyboard = [
-            [InlineKeyboardButton("✅ Выполнено", callback_data=f"complete_{task_id}")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="view_tasks_executor")],
-            [InlineKeyboardButton("🚪 Выйти", callback_data="restart")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        priority = task.get('priority', 'normal')
-        priority_text = "\n🔴 ВЫСОКИЙ ПРИОРИТЕТ!" if priority == 'high' else ""
-        header_text = f"📋 Задача #{task_id}{priority_text}\n\n{task['comment']}\n\nСтатус: {task['status']}"
-        # Удаляем исходное сообщение списка, чтобы не было "первого" сообщения
+
+@callback_router.prefix("approve_", role="manager")
+async def cb_approve(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    if chat_id:
+        await cleanup_review_task_messages(context, chat_id, task_id)
+        await cleanup_manager_task_messages(context, chat_id, task_id)
+        # Удаляем заголовок/список, если он есть, чтобы не мешал после утверждения
         try:
-            await query.message.delete()
+            list_id = context.user_data.get('review_list_message_id')
+            if list_id:
+                await context.bot.delete_message(chat_id=chat_id, message_id=list_id)
+                context.user_data.pop('review_list_message_id', None)
         except Exception:
             pass
+    
+    await db.update_task_status(task_id, STATUS_APPROVED)
+    
+    # Предлагаем выбор - удалить задачу или нет
+    keyboard = [
+        [InlineKeyboardButton("🗑️ Удалить задачу", callback_data=f"delete_approved_{task_id}")],
+        [InlineKeyboardButton("❌ Оставить задачу", callback_data="review_tasks")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.effective_message.reply_text(
+        f"✅ Задача #{task_id} помечена как завершенная.\n\n"
+        "Хотите удалить задачу?",
+        reply_markup=reply_markup
+    )
 
-        # Собираем все фото "до" и отправляем как альбом
-        before_photos = [p for p in db.get_task_photos(task_id) if p.get('kind') == 'before' and p.get('file_path') and os.path.exists(p['file_path'])]
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        sent_any = False
-        if before_photos:
-            media = []
-            files = []
-            for idx, ph in enumerate(before_photos):
-                f = open(ph['file_path'], 'rb')
-                files.append(f)
-                if idx == 0:
-                    caption = header_text
-                    media.append(InputMediaPhoto(media=f, caption=caption))
-                else:
-                    media.append(InputMediaPhoto(media=f))
-            try:
-                sent_group = await context.bot.send_media_group(chat_id=chat_id, media=media)
-                task_message_ids.extend([m.message_id for m in sent_group])
-                sent_any = True
-            finally:
-                for f in files:
-                    try:
-                        f.close()
-                    except:
-                        pass
-        # После фото отправляем отдельное сообщение с кнопками действий
-        try:
-            action_msg = await context.bot.send_message(chat_id=chat_id, text="Выберите действие:", reply_markup=reply_markup)
-            task_message_ids.append(action_msg.message_id)
-        except Exception:
-            try:
-                action_msg = await query.message.reply_text("Выберите действие:", reply_markup=reply_markup)
-                task_message_ids.append(action_msg.message_id)
-            except Exception:
-                pass
-        executor_task_msgs[str(task_id)] = task_message_ids
-        context.user_data['executor_task_message_ids'] = executor_task_msgs
-        context.user_data['current_executor_task_id'] = task_id
-        return
 
-    if data.startswith("complete_"):
-        task_id = int(data.split("_")[1])
-        context.user_data['completing_task'] = True
-        context.user_data['task_id'] = task_id
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        if chat_id:
-            await cleanup_executor_task_messages(context, chat_id, task_id)
+@callback_router.prefix("redo_", role="manager")
+async def cb_redo(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query = call.query
+    task_id = int(call.arg)
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    if chat_id:
+        await cleanup_review_task_messages(context, chat_id, task_id)
+    
+    # Устанавливаем флаг ожидания комментария для переделки
+    context.user_data['redoing_task'] = True
+    context.user_data['task_id'] = task_id
+    
+    keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data=f"review_{task_id}")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await query.message.reply_text(
+        f"✏️ Введите комментарий, что нужно сделать по задаче #{task_id}:",
+        reply_markup=reply_markup
+    )
 
-        keyboard = [[InlineKeyboardButton("◀️ Главное меню", callback_data="back_to_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
+
+@callback_router.exact("restart")
+async def cb_restart(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query, user_id, username = call.query, call.user_id, call.username
+    chat_id = query.message.chat_id if query.message else update.effective_chat.id
+    await cleanup_executor_task_messages(context, chat_id, context.user_data.get('current_executor_task_id'))
+    # Очищаем все данные пользователя
+    context.user_data.clear()
+    
+    # Сбрасываем роль и категорию: делаем пользователя исполнителем без категории
+    username = query.from_user.username or "Пользователь"
+    await db.set_user_role(user_id, username, "executor", None)
+    
+    keyboard = await build_category_keyboard()
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    try:
+        await query.edit_message_text(
+            f"👋 Добро пожаловать, {username}!\n\n"
+            "Выберите, где делать отмывки:",
+            reply_markup=reply_markup
+        )
+    except Exception:
         await query.message.reply_text(
-            "📸 Отправьте фотографию выполненной работы.\n"
-            "Можно одно фото или несколько фото ОДНИМ сообщением (альбомом). Все фото прикрепляйте в одном сообщении.",
+            f"👋 Добро пожаловать, {username}!\n\n"
+            "Выберите, где делать отмывки:",
             reply_markup=reply_markup
         )
-        return
-
-    if data.startswith("review_"):
-        task_id = int(data.split("_")[1])
-        task = db.get_task(task_id)
-        if not task:
-            await query.message.reply_text("❌ Задача не найдена.")
-            return
-        # Помечаем возврат в меню менеджера
-        context.user_data['return_to'] = 'manager_menu'
-        # Сохраняем id последней открытой задачи для последующей очистки сообщений
-        context.user_data['last_review_task_id'] = task_id
-        review_msgs = context.user_data.get('review_message_ids', {}) or {}
-        task_msg_ids = review_msgs.get(str(task_id), [])
-        
-        # Подготавливаем кнопки действий
-        keyboard = [
-            [InlineKeyboardButton("✅ Задача завершена", callback_data=f"approve_{task_id}")],
-            [InlineKeyboardButton("❌ Переделать", callback_data=f"redo_{task_id}")],
-            [InlineKeyboardButton("◀️ Назад", callback_data="review_tasks")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Заголовок
-        priority = task.get('priority', 'normal')
-        priority_text = " 🔴 Высокий приоритет" if priority == 'high' else " 🟢 Обычный приоритет"
-        header_text = f"📋 Задача #{task_id}{priority_text}\n\nКомментарий: {task['comment']}\nСтатус: {task['status']}"
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
 
-        # Удаляем исходное сообщение списка, чтобы не было лишнего первого сообщения
-        try:
-            await query.message.delete()
-        except Exception:
-            pass
-        # Сбрасываем сохраненный id списка, он больше не актуален
-        try:
-            context.user_data.pop('review_list_message_id', None)
-        except Exception:
-            pass
-        # Альбомы "до" (менеджер) и "после" (исполнитель) из расширенной таблицы
-        before_list = [p for p in db.get_task_photos(task_id) if p.get('kind') == 'before' and p.get('file_path') and os.path.exists(p['file_path'])]
-        after_list = [p for p in db.get_task_photos(task_id) if p.get('kind') == 'after' and p.get('file_path') and os.path.exists(p['file_path'])]
-        # Отправляем "до"
-        if before_list:
-            media = []
-            files = []
-            for idx, ph in enumerate(before_list):
-                f = open(ph['file_path'], 'rb')
-                files.append(f)
-                if idx == 0:
-                    media.append(InputMediaPhoto(media=f, caption=header_text))
-                else:
-                    media.append(InputMediaPhoto(media=f))
-            try:
-                sent_group = await context.bot.send_media_group(chat_id=chat_id, media=media)
-                if sent_group:
-                    task_msg_ids.extend([m.message_id for m in sent_group])
-            finally:
-                for f in files:
-                    try:
-                        f.close()
-                    except:
-                        pass
-        else:
-            # Нет фото "до" — отправим шапку
-            header_msg = await query.message.reply_text(header_text)
-            task_msg_ids.append(header_msg.message_id)
-        # Отправляем "после"
-        if after_list:
-            if task['completed_by']:
-                username = db.get_username(task['completed_by'])
-                if username:
-                    after_caption = f"Исполнитель @{username} прикрепил фото к задаче #{task_id}"
-                else:
-                    after_caption = f"Исполнитель (ID: {task['completed_by']}) прикрепил фото к задаче #{task_id}"
-            else:
-                after_caption = f"Исполнитель прикрепил фото к задаче #{task_id}"
-            media = []
-            files = []
-            for idx, ph in enumerate(after_list):
-                f = open(ph['file_path'], 'rb')
-                files.append(f)
-                if idx == 0:
-                    media.append(InputMediaPhoto(media=f, caption=after_caption))
-                else:
-                    media.append(InputMediaPhoto(media=f))
-            try:
-                sent_after = await context.bot.send_media_group(chat_id=chat_id, media=media)
-                if sent_after:
-                    task_msg_ids.extend([m.message_id for m in sent_after])
-            finally:
-                for f in files:
-                    try:
-                        f.close()
-                    except:
-                        pass
-            # Сообщение с кнопками отдельно
-            sent_btn = await context.bot.send_message(chat_id=chat_id, text="Выберите действие:", reply_markup=reply_markup)
-            task_msg_ids.append(sent_btn.message_id)
-        else:
-            # Нет фото "после" — отправляем предупреждение с кнопками
-            sent = await context.bot.send_message(chat_id=chat_id, text="⚠️ Исполнитель не прикрепил фото результата.", reply_markup=reply_markup)
-            task_msg_ids.append(sent.message_id)
-        review_msgs[str(task_id)] = task_msg_ids
-        context.user_data['review_message_ids'] = review_msgs
-        
-        # Сообщение списка уже отредактировано выше, дополнительные кнопки убраны вместе с заменой текста
-        return
 
-    if data.startswith("approve_"):
-        task_id = int(data.split("_")[1])
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        if chat_id:
-            await cleanup_review_task_messages(context, chat_id, task_id)
-            await cleanup_manager_task_messages(context, chat_id, task_id)
-            # Удаляем заголовок/список, если он есть, чтобы не мешал после утверждения
-            try:
-                list_id = context.user_data.get('review_list_message_id')
-                if list_id:
-                    await context.bot.delete_message(chat_id=chat_id, message_id=list_id)
-                    context.user_data.pop('review_list_message_id', None)
-            except Exception:
-                pass
-        
-        db.update_task_status(task_id, STATUS_APPROVED)
-        
-        # Предлагаем выбор - удалить задачу или нет
+@callback_router.exact("back_to_menu")
+async def cb_back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, call: CallbackCall):
+    query, user_id, username, role = call.query, call.user_id, call.username, call.role
+    # Очищаем состояние создания задачи, если оно было активно
+    context.user_data['creating_task'] = False
+    context.user_data['task_step'] = None
+    context.user_data['task_id'] = None
+    context.user_data['task_category'] = None
+    # Отменяем режим рассылки, если он был активен
+    if context.user_data.get('broadcasting'):
+        context.user_data['broadcasting'] = False
+    # Удаляем сообщение, под которым нажали кнопку "Главное меню"
+    try:
+        await query.message.delete()
+    except:
+        pass
+    
+    return_to = context.user_data.pop('return_to', None)
+    
+    # Показываем меню менеджера только если пользователь действительно менеджер
+    if return_to == 'manager_menu' and role == "manager":
         keyboard = [
-            [InlineKeyboardButton("🗑️ Удалить задачу", callback_data=f"delete_approved_{task_id}")],
-            [InlineKeyboardButton("❌ Оставить задачу", callback_data="review_tasks")]
+            [InlineKeyboardButton("📋 Создать задачу", callback_data="select_category")],
+            [InlineKeyboardButton("📊 Просмотреть задачи", callback_data="view_tasks_manager")],
+            [InlineKeyboardButton("✅ Проверить выполненные", callback_data="review_tasks")],
+            [InlineKeyboardButton("📨 Создать рассылку", callback_data="broadcast_start")],
+            [InlineKeyboardButton("🏠 В начало", callback_data="restart")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.effective_message.reply_text(
-            f"✅ Задача #{task_id} помечена как завершенная.\n\n"
-            "Хотите удалить задачу?",
+            f"👋 Добро пожаловать, менеджер {username}!\n\nВыберите действие:",
             reply_markup=reply_markup
         )
-        return
-
-    if data.startswith("redo_"):
-        task_id = int(data.split("_")[1])
-        if role != "manager":
-            await query.answer("❌ У вас нет доступа к этой функции.")
-            return
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        if chat_id:
-            await cleanup_review_task_messages(context, chat_id, task_id)
-        
-        # Устанавливаем флаг ожидания комментария для переделки
-        context.user_data['redoing_task'] = True
-        context.user_data['task_id'] = task_id
-        
-        keyboard = [[InlineKeyboardButton("◀️ Отмена", callback_data=f"review_{task_id}")]]
+    else:
+        # Всегда делаем пользователя исполнителем при выходе в главное меню
+        if role == "manager":
+            username = query.from_user.username or "Пользователь"
+            await db.set_user_role(user_id, username, "executor", None)
+            role = "executor"
+        keyboard = [
+            [InlineKeyboardButton("📋 Мои задачи", callback_data="view_tasks_executor")],
+            [InlineKeyboardButton("🏠 В начало", callback_data="restart")]
+        ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(
-            f"✏️ Введите комментарий, что нужно сделать по задаче #{task_id}:",
+        await update.effective_message.reply_text(
+            f"👋 Добро пожаловать, {username}!\n\nВы исполнитель. Выберите действие:",
             reply_markup=reply_markup
         )
-        return
-
-    if data == "restart":
-        chat_id = query.message.chat_id if query.message else update.effective_chat.id
-        await cleanup_executor_task_messages(context, chat_id, context.user_data.get('current_executor_task_id'))
-        # Очищаем все данные пользователя
-        context.user_data.clear()
-        
-        # Сбрасываем роль и категорию: делаем пользователя исполнителем без категории
-        username = query.from_user.username or "Пользователь"
-        db.set_user_role(user_id, username, "executor", None)
-        
-        keyboard = build_category_keyboard()
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        try:
-            await query.edit_message_text(
-                f"👋 Добро пожаловать, {username}!\n\n"
-                "Выберите, где делать отмывки:",
-                reply_markup=reply_markup
-            )
-        except Exception:
-            await query.message.reply_text(
-                f"👋 Добро пожаловать, {username}!\n\n"
-                "Выберите, где делать отмывки:",
-                reply_markup=reply_markup
-            )
-        return
-
-    if data == "back_to_menu":
-        # Очищаем состояние создания задачи, если оно было активно
-        context.user_data['creating_task'] = False
-        context.user_data['task_step'] = None
-        context.user_data['task_id'] = None
-        context.user_data['task_category'] = None
-        # Отменяем режим рассылки, если он был активен
-        if context.user_data.get('broadcasting'):
-            context.user_data['broadcasting'] = False
-        # Удаляем сообщение, под которым нажали кнопку "Главное меню"
-        try:
-            await query.message.delete()
-        except:
-            pass
-        
-        # Проверяем роль пользователя
-        role = db.get_user_role(user_id)
-        return_to = context.user_data.pop('return_to', None)
-        
-        # Показываем меню менеджера только если пользователь действительно менеджер
-        if return_to == 'manager_menu' and role == "manager":
-            keyboard = [
-                [InlineKeyboardButton("📋 Создать задачу", callback_data="select_category")],
-                [InlineKeyboardButton("📊 Просмотреть задачи", callback_data="view_tasks_manager")],
-                [InlineKeyboardButton("✅ Проверить выполненные", callback_data="review_tasks")],
-                [InlineKeyboardButton("📨 Создать рассылку", callback_data="broadcast_start")],
-                [InlineKeyboardButton("🏠 В начало", callback_data="restart")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.effective_message.reply_text(
-                f"👋 Добро пожаловать, менеджер {username}!\n\nВыберите действие:",
-                reply_markup=reply_markup
-            )
-        else:
-            # Всегда делаем пользователя исполнителем при выходе в главное меню
-            if role == "manager":
-                username = query.from_user.username or "Пользователь"
-                db.set_user_role(user_id, username, "executor", None)
-                role = "executor"
-            keyboard = [
-                [InlineKeyboardButton("📋 Мои задачи", callback_data="view_tasks_executor")],
-                [InlineKeyboardButton("🏠 В начало", callback_data="restart")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.effective_message.reply_text(
-                f"👋 Добро пожаловать, {username}!\n\nВы исполнитель. Выберите действие:",
-                reply_markup=reply_markup
-            )
-        return
-    
-    # Обработка неизвестных callback_data
-    logger.warning(f"Неизвестный callback_data: {data}")
-    try:
-        await query.answer("❌ Неизвестная команда. Попробуйте /start")
-    except:
-        pass
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1658,9 +1522,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('waiting_for_code'):
         if text == MANAGER_CODE:
             # Устанавливаем роль менеджера
-            db.set_user_role(user_id, username, "manager")
+            await db.set_user_role(user_id, username, "manager")
             # Проверяем, что роль сохранилась
-            saved_role = db.get_user_role(user_id)
+            saved_role = await db.get_user_role(user_id)
             logger.debug(f"Пароль введен правильно, роль установлена: {saved_role}")
             if saved_role != "manager":
                 logger.error(f"Роль не сохранилась! Ожидалось: manager, получено: {saved_role}")
@@ -1686,15 +1550,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Режим рассылки
     if context.user_data.get('broadcasting'):
         broadcast_text = text
-        executors = db.get_all_executors()
-        sent = 0
+        executors = await db.get_all_executors()
         disclaimer = "\n\nЭто сообщение создано автоматически. Не нужно на него отвечать."
-        for executor_id in executors:
-            try:
-                await context.bot.send_message(executor_id, f"📢 Сообщение от менеджера:\n\n{broadcast_text}{disclaimer}")
-                sent += 1
-            except Exception as e:
-                logger.error(f"Не удалось отправить рассылку пользователю {executor_id}: {e}")
         context.user_data['broadcasting'] = False
         keyboard = [
             [InlineKeyboardButton("📋 Создать задачу", callback_data="select_category")],
@@ -1704,7 +1561,24 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("🏠 В начало", callback_data="restart")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(f"✅ Рассылка отправлена {sent} исполнителям.", reply_markup=reply_markup)
+        # Рассылка идёт в фоне: менеджер может продолжать работу, прогресс обновляется в одном сообщении
+        status_msg = await update.message.reply_text(f"⏳ Рассылка запущена: {len(executors)} получателей.")
+
+        async def report_progress(done: int, total: int):
+            await status_msg.edit_text(f"⏳ Рассылка: отправлено {done} из {total}...")
+
+        async def report_done(result):
+            await context.bot.send_message(
+                update.effective_chat.id,
+                f"✅ Рассылка отправлена {result.sent} исполнителям.",
+                reply_markup=reply_markup
+            )
+
+        broadcaster.start(
+            context.application, context.bot, executors,
+            f"📢 Сообщение от менеджера:\n\n{broadcast_text}{disclaimer}",
+            progress=report_progress, on_done=report_done
+        )
         return
 
     # Создание задачи - комментарий
@@ -1713,20 +1587,17 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         category = context.user_data.get('task_category', 'Не указана')
         
         # Обновляем комментарий в задаче
-        db.update_task_comment(task_id, text)
+        await db.update_task_comment(task_id, text)
         
         # Получаем список исполнителей для этой категории
         if category == "Прочее":
             # Для "Прочее" - все пользователи
-            executors = db.get_all_executors()
-            executor_usernames = []
-            for executor_id in executors:
-                username = db.get_username(executor_id)
-                if username:
-                    executor_usernames.append(f"@{username}")
+            executors = await db.get_all_executors()
+            usernames = await db.get_usernames(executors)
+            executor_usernames = [f"@{usernames[executor_id]}" for executor_id in executors if usernames.get(executor_id)]
         else:
             # Для других категорий - только пользователи этой категории
-            users = db.get_users_by_category(category)
+            users = await db.get_users_by_category(category)
             executor_usernames = [f"@{user['username']}" for user in users if user.get('username')]
         
         executors_text = ", ".join(executor_usernames) if executor_usernames else "Нет исполнителей"
@@ -1778,7 +1649,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Комментарий для переделки задачи
     if context.user_data.get('redoing_task'):
         task_id = context.user_data.get('task_id')
-        task = db.get_task(task_id)
+        task = await db.get_task(task_id)
         
         if not task:
             await update.message.reply_text("❌ Задача не найдена.")
@@ -1789,13 +1660,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Обновляем комментарий задачи, добавляя новый комментарий менеджера в новой строке
         manager_username = update.effective_user.username or "Менеджер"
         new_comment = f"{task['comment']}\n\n⚠️ Переделать - @{manager_username}: {text}"
-        db.update_task_comment(task_id, new_comment)
+        await db.update_task_comment(task_id, new_comment)
         
         # Обновляем статус задачи на "Переделать"
-        db.update_task_status(task_id, STATUS_REDO)
+        await db.update_task_status(task_id, STATUS_REDO)
         
         # Уведомляем всех исполнителей с комментарием менеджера
-        executors = db.get_all_executors()
+        executors = await db.get_all_executors()
         
         # Кнопка для быстрого возврата к задаче
         keyboard = [
@@ -1803,17 +1674,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        for executor_id in executors:
-            try:
-                await context.bot.send_message(
-                    executor_id,
-                    f"⚠️ Задача #{task_id} требует переделки!\n\n"
-                    f"Комментарий менеджера @{manager_username}:\n{text}\n\n"
-                    f"Пожалуйста, выполните задачу заново.",
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.error(f"Не удалось отправить уведомление пользователю {executor_id}: {e}")
+        broadcaster.start(
+            context.application, context.bot, executors,
+            f"⚠️ Задача #{task_id} требует переделки!\n\n"
+            f"Комментарий менеджера @{manager_username}:\n{text}\n\n"
+            f"Пожалуйста, выполните задачу заново.",
+            reply_markup=reply_markup
+        )
         
         context.user_data['redoing_task'] = False
         context.user_data['task_id'] = None
@@ -1833,35 +1700,26 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Редактирование комментария задачи
     if context.user_data.get('editing_comment'):
         task_id = context.user_data.get('task_id')
-        task = db.get_task(task_id)
-        db.update_task_comment(task_id, text)
+        task = await db.get_task(task_id)
+        await db.update_task_comment(task_id, text)
         context.user_data['editing_comment'] = False
         context.user_data['task_id'] = None
         
         # Если задача была выполнена - сбрасываем в статус "Новая" и удаляем фото после
         if task and (task['status'] == STATUS_COMPLETED or task['status'] == STATUS_APPROVED):
-            # Удаляем фото после, если оно существует
-            if task.get('photo_after_path') and os.path.exists(task['photo_after_path']):
-                try:
-                    os.remove(task['photo_after_path'])
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении фото после: {e}")
-            
-            # Сбрасываем задачу в статус "Новая"
-            db.reset_task_to_new(task_id)
+            # Сбрасываем задачу в статус "Новая"; фото после удаляется, если на него больше ничего не ссылается
+            await db.reset_task_to_new(task_id)
+            if task.get('photo_after_path'):
+                await photo_store.release([task['photo_after_path']])
             
             # Уведомляем всех исполнителей
-            executors = db.get_all_executors()
+            executors = await db.get_all_executors()
             manager_username = update.effective_user.username or "Менеджер"
-            for executor_id in executors:
-                try:
-                    await context.bot.send_message(
-                        executor_id,
-                        f"🔄 Задача #{task_id} была изменена менеджером @{manager_username}.\n\n"
-                        f"Задача возвращена в работу. Новый комментарий: {text}"
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось отправить уведомление пользователю {executor_id}: {e}")
+            broadcaster.start(
+                context.application, context.bot, executors,
+                f"🔄 Задача #{task_id} была изменена менеджером @{manager_username}.\n\n"
+                f"Задача возвращена в работу. Новый комментарий: {text}"
+            )
         
         keyboard = [
             [InlineKeyboardButton("📊 Просмотреть задачи", callback_data="view_tasks_manager")],
@@ -1880,31 +1738,25 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик фотографий"""
     user_id = update.effective_user.id
-    username = update.effective_user.username or "Пользователь"
-    role = db.get_user_role(user_id)
+    role = await db.get_user_role(user_id)
     if not role:
         role = "executor"
     ensure_photos_dir()
     media_group_id = update.message.media_group_id
     # Если продолжается альбом (как при создании, так и при выполнении), добавляем фото к уже созданной задаче
     if media_group_id and context.user_data.get('album_id') == media_group_id and context.user_data.get('album_task_id') and context.user_data.get('album_kind') in ('before','after'):
-        photo = update.message.photo[-1]
-        file = await context.bot.get_file(photo.file_id)
         kind = context.user_data['album_kind']
         task_id = context.user_data['album_task_id']
-        suffix = "before" if kind == "before" else f"after_{task_id}"
-        photo_path = os.path.join(PHOTOS_DIR, f"{suffix}_{photo.file_id}.jpg")
-        await file.download_to_drive(photo_path)
-        db.add_task_photo(task_id, kind, photo.file_id, photo_path)
+        # Скачивание идёт в фоне параллельно с остальными фото альбома, в БД они попадут одной вставкой
+        photo_downloader.add_album_photo(context.application, context.bot, media_group_id, task_id, kind,
+                                         update.message.photo)
         return
 
     # Создание задачи - фото
     if context.user_data.get('creating_task') and context.user_data.get('task_step') == "photo":
         photo = update.message.photo[-1]  # Берем фото наибольшего размера
-        file = await context.bot.get_file(photo.file_id)
         
-        photo_path = os.path.join(PHOTOS_DIR, f"before_{photo.file_id}.jpg")
-        await file.download_to_drive(photo_path)
+        photo_path = await photo_downloader.download_photo(context.application, context.bot, update.message.photo)
         
         category = context.user_data.get('task_category', 'Прочее')
         media_group_id = update.message.media_group_id
@@ -1916,12 +1768,12 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Если это часть альбома и задача уже создана под этот альбом — просто добавим фото
             if media_group_id and context.user_data.get('album_id') == media_group_id and context.user_data.get('album_task_id'):
                 task_id = context.user_data['album_task_id']
-                db.add_task_photo(task_id, 'before', photo.file_id, photo_path)
+                await db.add_task_photo(task_id, 'before', photo.file_id, photo_path)
             else:
                 priority = context.user_data.get('task_priority', 'normal')
-                task_id = db.create_task(user_id, photo.file_id, photo_path, caption, category, priority)
+                task_id = await db.create_task(user_id, photo.file_id, photo_path, caption, category, priority)
                 # Сохраняем это фото как дополнительное тоже для списка
-                db.add_task_photo(task_id, 'before', photo.file_id, photo_path)
+                await db.add_task_photo(task_id, 'before', photo.file_id, photo_path)
                 if media_group_id:
                     context.user_data['album_id'] = media_group_id
                     context.user_data['album_task_id'] = task_id
@@ -1930,15 +1782,12 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Получаем список исполнителей для этой категории
             if category == "Прочее":
                 # Для "Прочее" - все пользователи
-                executors = db.get_all_executors()
-                executor_usernames = []
-                for executor_id in executors:
-                    username = db.get_username(executor_id)
-                    if username:
-                        executor_usernames.append(f"@{username}")
+                executors = await db.get_all_executors()
+                usernames = await db.get_usernames(executors)
+                executor_usernames = [f"@{usernames[executor_id]}" for executor_id in executors if usernames.get(executor_id)]
             else:
                 # Для других категорий - только пользователи этой категории
-                users = db.get_users_by_category(category)
+                users = await db.get_users_by_category(category)
                 executor_usernames = [f"@{user['username']}" for user in users if user.get('username')]
             
             executors_text = ", ".join(executor_usernames) if executor_usernames else "Нет исполнителей"
@@ -1989,17 +1838,17 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Если это продолжение альбома без подписи и уже есть задача — просто добавим фото
             if media_group_id and context.user_data.get('album_id') == media_group_id and context.user_data.get('album_task_id'):
                 task_id = context.user_data['album_task_id']
-                db.add_task_photo(task_id, 'before', photo.file_id, photo_path)
+                await db.add_task_photo(task_id, 'before', photo.file_id, photo_path)
                 return
             else:
                 priority = context.user_data.get('task_priority', 'normal')
-                task_id = db.create_task(user_id, photo.file_id, photo_path, "Введите комментарий...", category, priority)
+                task_id = await db.create_task(user_id, photo.file_id, photo_path, "Введите комментарий...", category, priority)
             context.user_data['task_id'] = task_id
             context.user_data['photo_id'] = photo.file_id
             context.user_data['photo_path'] = photo_path
             context.user_data['task_step'] = "comment"
             # Дополнительно сохраняем фото в расширенную таблицу
-            db.add_task_photo(task_id, 'before', photo.file_id, photo_path)
+            await db.add_task_photo(task_id, 'before', photo.file_id, photo_path)
             if media_group_id:
                 context.user_data['album_id'] = media_group_id
                 context.user_data['album_task_id'] = task_id
@@ -2015,22 +1864,20 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('completing_task'):
         task_id = context.user_data.get('task_id')
         photo = update.message.photo[-1]
-        file = await context.bot.get_file(photo.file_id)
         
-        photo_path = os.path.join(PHOTOS_DIR, f"after_{task_id}_{photo.file_id}.jpg")
-        await file.download_to_drive(photo_path)
+        photo_path = await photo_downloader.download_photo(context.application, context.bot, update.message.photo)
         
         media_group_id = update.message.media_group_id
         # Если альбом: на первой фотке меняем статус, остальные просто добавляем
         if media_group_id and (context.user_data.get('album_id') != media_group_id or not context.user_data.get('album_task_id')):
-            db.update_task_status(task_id, STATUS_COMPLETED, user_id, photo.file_id, photo_path)
+            await db.update_task_status(task_id, STATUS_COMPLETED, user_id, photo.file_id, photo_path)
             context.user_data['album_id'] = media_group_id
             context.user_data['album_task_id'] = task_id
             context.user_data['album_kind'] = 'after'
         elif not media_group_id:
-            db.update_task_status(task_id, STATUS_COMPLETED, user_id, photo.file_id, photo_path)
+            await db.update_task_status(task_id, STATUS_COMPLETED, user_id, photo.file_id, photo_path)
         # Всегда добавляем фото в расширенную таблицу
-        db.add_task_photo(task_id, 'after', photo.file_id, photo_path)
+        await db.add_task_photo(task_id, 'after', photo.file_id, photo_path)
         # Сообщение подтверждения и возврат к списку задач показываем:
         # - для одиночного фото
         # - для первой фотографии альбома
@@ -2044,27 +1891,19 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.user_data.pop('album_kind', None)
         
         # Получаем информацию о задаче для уведомления
-        task = db.get_task(task_id)
+        task = await db.get_task(task_id)
         executor_username = update.effective_user.username or "Исполнитель"
         
         # Отправляем уведомления всем менеджерам
-        managers = db.get_all_managers()
-        for manager_id in managers:
-            try:
-                keyboard = [
-                    [InlineKeyboardButton("✅ Проверить задачу", callback_data=f"review_{task_id}")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                message_text = f"✅ Задача #{task_id} была выполнена исполнителем @{executor_username}.\n\n"
-                if task:
-                    message_text += f"Комментарий: {task['comment']}"
-                await context.bot.send_message(
-                    manager_id,
-                    message_text,
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.error(f"Не удалось отправить уведомление менеджеру {manager_id}: {e}")
+        managers = await db.get_all_managers()
+        keyboard = [
+            [InlineKeyboardButton("✅ Проверить задачу", callback_data=f"review_{task_id}")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        message_text = f"✅ Задача #{task_id} была выполнена исполнителем @{executor_username}.\n\n"
+        if task:
+            message_text += f"Комментарий: {task['comment']}"
+        broadcaster.start(context.application, context.bot, managers, message_text, reply_markup=reply_markup)
         
         # Сообщение пользователю:
         if should_notify:
@@ -2108,49 +1947,34 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.user_data.get('editing_photo'):
         task_id = context.user_data.get('task_id')
         photo = update.message.photo[-1]
-        file = await context.bot.get_file(photo.file_id)
         
         # Получаем задачу перед изменением
-        task = db.get_task(task_id)
+        task = await db.get_task(task_id)
         
-        # Удаляем старое фото если оно существует
-        if task and task['photo_before_path'] and os.path.exists(task['photo_before_path']):
-            try:
-                os.remove(task['photo_before_path'])
-            except:
-                pass
+        photo_path = await photo_downloader.download_photo(context.application, context.bot, update.message.photo)
         
-        photo_path = os.path.join(PHOTOS_DIR, f"before_{task_id}_{photo.file_id}.jpg")
-        await file.download_to_drive(photo_path)
-        
-        db.update_task_photo(task_id, photo.file_id, photo_path)
+        await db.update_task_photo(task_id, photo.file_id, photo_path)
+        # Старое фото удаляется с диска, только если на него больше ничего не ссылается
+        if task and task['photo_before_path']:
+            await photo_store.release([task['photo_before_path']])
         context.user_data['editing_photo'] = False
         context.user_data['task_id'] = None
         
         # Если задача была выполнена - сбрасываем в статус "Новая" и удаляем фото после
         if task and (task['status'] == STATUS_COMPLETED or task['status'] == STATUS_APPROVED):
-            # Удаляем фото после, если оно существует
-            if task.get('photo_after_path') and os.path.exists(task['photo_after_path']):
-                try:
-                    os.remove(task['photo_after_path'])
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении фото после: {e}")
-            
-            # Сбрасываем задачу в статус "Новая"
-            db.reset_task_to_new(task_id)
+            # Сбрасываем задачу в статус "Новая"; фото после удаляется, если на него больше ничего не ссылается
+            await db.reset_task_to_new(task_id)
+            if task.get('photo_after_path'):
+                await photo_store.release([task['photo_after_path']])
             
             # Уведомляем всех исполнителей
-            executors = db.get_all_executors()
+            executors = await db.get_all_executors()
             manager_username = update.effective_user.username or "Менеджер"
-            for executor_id in executors:
-                try:
-                    await context.bot.send_message(
-                        executor_id,
-                        f"🔄 Задача #{task_id} была изменена менеджером @{manager_username}.\n\n"
-                        f"Фотография задачи была обновлена. Задача возвращена в работу."
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось отправить уведомление пользователю {executor_id}: {e}")
+            broadcaster.start(
+                context.application, context.bot, executors,
+                f"🔄 Задача #{task_id} была изменена менеджером @{manager_username}.\n\n"
+                f"Фотография задачи была обновлена. Задача возвращена в работу."
+            )
         
         keyboard = [
             [InlineKeyboardButton("📊 Просмотреть задачи", callback_data="view_tasks_manager")],
@@ -0,0 +1,4 @@
+"""Прогон обработчиков бота без Telegram: поддельный Bot API, сборка обновлений и сценарий смены.
+
+Запуск: python -m harness [--managers 2 --executors 6 --tasks 10 --latency 50]
+"""
@@ -0,0 +1,62 @@
+"""Прогон смены без Telegram: python -m harness --managers 3 --executors 10 --tasks 20"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+from harness.runtime import enter_workdir
+
+
+async def run(args) -> dict:
+    # Модули бота импортируются после смены рабочего каталога: handlers при импорте
+    # открывает restaurant_cleaner.db и photos/ относительно него
+    from main import build_application
+    from harness.fake_bot import FakeRequest, make_bot
+    from harness.shift import ShiftDriver
+
+    request = FakeRequest(latency=args.latency / 1000, download_latency=args.download_latency / 1000,
+                          seed=args.seed)
+    application = build_application(make_bot(request))
+    await application.initialize()
+    await application.start()
+    try:
+        driver = ShiftDriver(application, request, think=args.think / 1000, seed=args.seed)
+        return await driver.run(args.managers, args.executors, args.tasks, args.album)
+    finally:
+        # Как при остановке бота: дожидаемся фоновых задач (альбомы, рассылки), сохраняем сессии
+        await application.stop()
+        await application.shutdown()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Смена менеджеров и исполнителей против бота без Telegram")
+    parser.add_argument("--managers", type=int, default=2)
+    parser.add_argument("--executors", type=int, default=6)
+    parser.add_argument("--tasks", type=int, default=10, help="задач на каждого менеджера")
+    parser.add_argument("--album", type=int, default=3, help="фото в альбоме при создании задачи")
+    parser.add_argument("--latency", type=float, default=50, help="задержка ответа Bot API, мс")
+    parser.add_argument("--download-latency", type=float, default=100, help="задержка скачивания файла, мс")
+    parser.add_argument("--think", type=float, default=0, help="средняя пауза пользователя между действиями, мс")
+    parser.add_argument("--workdir", help="каталог для базы и фото (по умолчанию временный, удаляется)")
+    parser.add_argument("--json", help="сохранить результат в JSON")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = enter_workdir(args.workdir)
+    try:
+        summary = asyncio.run(run(args))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    from harness.shift import render
+    print(render(summary))
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 1 if any(route['errors'] for route in summary['routes'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
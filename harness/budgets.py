@@ -0,0 +1,167 @@
+"""Бюджеты работы на одно обновление: python -m harness.budgets
+
+Прогоняет смену без задержек Bot API поверх архива из ARCHIVE_TASKS утверждённых задач и сравнивает
+с BUDGETS максимум по каждому маршруту: SQL-запросы, прочитанные строки, новые соединения с базой
+и вызовы Bot API. Архив нужен, чтобы полный просмотр tasks (или N+1 по задачам) сразу выходил
+за бюджет строк. Код возврата 1, если какой-то маршрут превысил бюджет.
+Тот же прогон выполняет tests/test_route_budgets.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, NamedTuple, Optional
+from harness.runtime import enter_workdir
+
+# Утверждённые задачи, созданные до смены
+ARCHIVE_TASKS = 300
+ARCHIVE_USER_ID = 899_999_999
+# Соединения открываются один раз на поток БД: писатель и читатели AsyncDatabase
+POOL_CONNECTIONS = 5
+
+
+class Budget(NamedTuple):
+    """Верхние границы на одно обновление; None — не ограничено"""
+    sql: Optional[int]
+    rows: Optional[int]
+    connections: Optional[int] = POOL_CONNECTIONS
+    api_calls: Optional[int] = None
+
+
+# Строк — с запасом на задачи смены, но намного меньше архива: полный просмотр tasks не пройдёт
+BUDGETS: Dict[str, Budget] = {
+    "/start": Budget(sql=4, rows=10, api_calls=3),
+    "текст": Budget(sql=4, rows=10, api_calls=3),
+    "become_manager": Budget(sql=3, rows=10, api_calls=4),
+    "select_category": Budget(sql=2, rows=10, api_calls=4),
+    "set_category_*": Budget(sql=8, rows=20, api_calls=4),
+    "create_task_*": Budget(sql=2, rows=10, api_calls=4),
+    "фото (альбом)": Budget(sql=12, rows=10, api_calls=12),
+    "фото": Budget(sql=16, rows=20, api_calls=14),
+    "view_tasks_executor": Budget(sql=4, rows=40, api_calls=5),
+    "view_tasks_manager": Budget(sql=4, rows=40, api_calls=5),
+    "tasks_page_*": Budget(sql=4, rows=40, api_calls=5),
+    "task_*": Budget(sql=4, rows=10, api_calls=6),
+    "complete_*": Budget(sql=2, rows=10, api_calls=6),
+    "review_tasks": Budget(sql=4, rows=50, api_calls=4),
+    "review_*": Budget(sql=6, rows=20, api_calls=8),
+    "approve_*": Budget(sql=3, rows=10, api_calls=8),
+    "delete_completed_tasks": Budget(sql=2, rows=10, api_calls=4),
+    # Выгрузка отчёта читает и отправляет весь архив — ограничено только число запросов
+    "export_report_photos": Budget(sql=4, rows=None),
+}
+FIELDS = Budget._fields
+
+
+def seed_archive(db, tasks: int):
+    """Утверждённые задачи с фото «до» и «после» — как после нескольких недель работы"""
+    from config import STATUS_APPROVED
+    photos = []
+    for n in range(tasks):
+        task_id = db.create_task(ARCHIVE_USER_ID, f"archive{n}", f"photos/archive/{n}_before.jpg",
+                                 f"Архивная задача {n}", "Зал")
+        db.update_task_status(task_id, STATUS_APPROVED, ARCHIVE_USER_ID, f"archive{n}_after",
+                              f"photos/archive/{n}_after.jpg")
+        photos += [(task_id, 'before', f"archive{n}", f"photos/archive/{n}_before.jpg"),
+                   (task_id, 'after', f"archive{n}_after", f"photos/archive/{n}_after.jpg")]
+    db.add_task_photos_bulk(photos)
+
+
+async def run(args) -> Dict[str, Dict]:
+    from main import build_application
+    import handlers
+    import instrumentation
+    from harness.fake_bot import FakeRequest, make_bot
+    from harness.shift import FIRST_USER_ID, ShiftDriver
+
+    seed_archive(handlers.db.sync, args.archive)
+    worst: Dict[str, Dict] = {}
+
+    def collect(counters):
+        seen = worst.setdefault(counters.route, {'updates': 0, **{field: 0 for field in FIELDS}})
+        seen['updates'] += 1
+        for field in FIELDS:
+            seen[field] = max(seen[field], getattr(counters, field))
+
+    request = FakeRequest(latency=0, download_latency=0, seed=args.seed)
+    application = build_application(make_bot(request))
+    await application.initialize()
+    await application.start()
+    instrumentation.add_listener(collect)
+    try:
+        driver = ShiftDriver(application, request, seed=args.seed)
+        await driver.run(args.managers, args.executors, args.tasks, args.album)
+        # Экраны, которые смена не открывает
+        for data in ("view_tasks_manager", "tasks_page_1", "select_category", "delete_completed_tasks"):
+            await driver.send(driver.updates.callback(FIRST_USER_ID, data))
+    finally:
+        instrumentation.remove_listener(collect)
+        await application.stop()
+        await application.shutdown()
+    return worst
+
+
+def check(worst: Dict[str, Dict]) -> Dict[str, list]:
+    """Маршруты с превышением: {маршрут: [(поле, факт, бюджет), ...]}; маршрут без бюджета — тоже ошибка"""
+    over = {}
+    for route, seen in worst.items():
+        budget = BUDGETS.get(route)
+        if budget is None:
+            over[route] = [("бюджет не задан", None, None)]
+            continue
+        fields = [(field, seen[field], getattr(budget, field)) for field in FIELDS
+                  if getattr(budget, field) is not None and seen[field] > getattr(budget, field)]
+        if fields:
+            over[route] = fields
+    return over
+
+
+def render(worst: Dict[str, Dict], over: Dict[str, list]) -> str:
+    lines = [f"{'Маршрут':<28}{'Обновл.':>8}" + "".join(f"{field:>16}" for field in FIELDS)]
+    for route in sorted(worst):
+        seen, budget = worst[route], BUDGETS.get(route)
+        limits = [getattr(budget, field) if budget else None for field in FIELDS]
+        cells = "".join(f"{seen[field]:>8} / {'—' if limit is None else limit:<5}" for field, limit in zip(FIELDS, limits))
+        mark = "  ПРЕВЫШЕН" if route in over else ""
+        lines.append(f"{route:<28}{seen['updates']:>8}{cells}{mark}")
+    lines.append("")
+    if not over:
+        lines.append("Все маршруты в пределах бюджета")
+    for route, fields in over.items():
+        lines.append(f"{route}: " + ", ".join(field if actual is None else f"{field} {actual} > {limit}"
+                                             for field, actual, limit in fields))
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Проверка бюджетов SQL и Bot API на одно обновление")
+    parser.add_argument("--managers", type=int, default=2)
+    parser.add_argument("--executors", type=int, default=5)
+    parser.add_argument("--tasks", type=int, default=6, help="задач на каждого менеджера")
+    parser.add_argument("--album", type=int, default=3)
+    parser.add_argument("--archive", type=int, default=ARCHIVE_TASKS, help="утверждённых задач до смены")
+    parser.add_argument("--json", help="сохранить максимумы по маршрутам в JSON")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main() -> int:
+    args = parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = enter_workdir()
+    try:
+        worst = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    over = check(worst)
+    print(render(worst, over))
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(worst, f, ensure_ascii=False, indent=2)
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Бот без Telegram: HTTP-клиент PTB подменяется FakeRequest, который отвечает правдоподобным JSON.
+
+Сам бот — настоящий ExtBot, поэтому обработчики проходят тот же путь, что и в работе:
+сериализация параметров, разбор ответов в Message/File, скачивание файлов через request.retrieve.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from telegram.ext import ExtBot
+from telegram.request import BaseRequest, RequestData
+from instrumentation import CountingRequest
+
+FAKE_TOKEN = "123456:HARNESS"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Harness", "username": "harness_bot"}
+# Размеры, в которых «Telegram» хранит каждое фото (как в message.photo)
+PHOTO_SIZES = ((90, 67), (320, 240), (800, 600), (1280, 960))
+# Размер «скачанного» файла в байтах для наибольшего размера фото
+FULL_PHOTO_BYTES = 200_000
+
+
+class ApiCall(NamedTuple):
+    method: str
+    chat_id: Optional[int]
+    started: float
+    elapsed: float
+
+
+def photo_sizes(file_id: str) -> List[Dict]:
+    """Описание фото во всех размерах; id размеров выводятся из file_id"""
+    return [{"file_id": f"{file_id}_{w}", "file_unique_id": f"u{file_id}_{w}", "width": w, "height": h,
+             "file_size": FULL_PHOTO_BYTES * w // PHOTO_SIZES[-1][0]}
+            for w, h in PHOTO_SIZES]
+
+
+class FakeRequest(BaseRequest):
+    """Ответы Bot API с задержкой latency (± jitter) и запись каждого вызова.
+
+    Скачивание файла (get_file + download) задерживается на download_latency и возвращает
+    байты, однозначно зависящие от file_id, — одинаковые фото дедуплицируются хранилищем как в работе.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.3, download_latency: float = 0.1, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.download_latency = download_latency
+        self.calls: List[ApiCall] = []
+        self._rng = random.Random(seed)
+        self._message_ids: Dict[int, int] = {}
+        self._documents = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _delay(self, base: float) -> float:
+        if not base:
+            return 0.0
+        return max(0.0, base * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+
+    def _next_message_id(self, chat_id: int) -> int:
+        self._message_ids[chat_id] = self._message_ids.get(chat_id, 1_000_000) + 1
+        return self._message_ids[chat_id]
+
+    def _message(self, chat_id: int, **fields) -> Dict:
+        return {"message_id": self._next_message_id(chat_id), "date": int(time.time()), "from": BOT_USER,
+                "chat": {"id": chat_id, "type": "private"}, **fields}
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        if method == "getMe":
+            return {**BOT_USER, "can_join_groups": False, "can_read_all_group_messages": False,
+                    "supports_inline_queries": False}
+        if method == "sendMessage":
+            return self._message(chat_id, text=params.get("text", ""))
+        if method in ("editMessageText", "editMessageCaption", "editMessageReplyMarkup"):
+            if "inline_message_id" in params:
+                return True
+            return {"message_id": int(params["message_id"]), "date": int(time.time()), "from": BOT_USER,
+                    "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+        if method == "sendMediaGroup":
+            media = params.get("media") or []
+            messages = []
+            for item in media:
+                ref = item.get("media", "") if isinstance(item, dict) else ""
+                # Загруженный файл получает новый file_id, как в Telegram
+                file_id = ref if ref and not ref.startswith("attach://") else f"uploaded{len(self.calls)}_{ref[9:]}"
+                messages.append(self._message(chat_id, photo=photo_sizes(file_id), caption=item.get("caption")))
+            return messages
+        if method == "sendDocument":
+            self._documents += 1
+            return self._message(chat_id, document={"file_id": f"doc{self._documents}",
+                                                    "file_unique_id": f"udoc{self._documents}"})
+        if method == "getFile":
+            file_id = params["file_id"]
+            return {"file_id": file_id, "file_unique_id": f"u{file_id}", "file_size": FULL_PHOTO_BYTES,
+                    "file_path": f"photos/{file_id}.jpg"}
+        # deleteMessage, answerCallbackQuery и прочее
+        return True
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        started = time.perf_counter()
+        if method == "GET" and "/file/bot" in url:
+            # Скачивание файла: содержимое зависит только от пути (то есть от file_id)
+            await asyncio.sleep(self._delay(self.download_latency))
+            path = url.rsplit("/", 1)[-1]
+            body = b"\xff\xd8\xff\xe0" + (path.encode() * (FULL_PHOTO_BYTES // max(1, len(path))))
+            self.calls.append(ApiCall("downloadFile", None, started, time.perf_counter() - started))
+            return 200, body
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        await asyncio.sleep(self._delay(self.latency))
+        result = self._result(api_method, params)
+        chat_id = params.get("chat_id")
+        self.calls.append(ApiCall(api_method, int(chat_id) if chat_id is not None else None, started,
+                                  time.perf_counter() - started))
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def counts(self) -> Counter:
+        """Число вызовов по методам API"""
+        return Counter(call.method for call in self.calls)
+
+
+def make_bot(request: FakeRequest) -> ExtBot:
+    """ExtBot, который ходит в FakeRequest вместо api.telegram.org"""
+    return ExtBot(FAKE_TOKEN, request=CountingRequest(request), get_updates_request=request)
@@ -0,0 +1,23 @@
+"""Рабочий каталог прогона: база и фото бота создаются в нём, а не в репозитории."""
+import logging
+import os
+import sys
+import tempfile
+from typing import Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def enter_workdir(workdir: Optional[str] = None) -> str:
+    """Перейти в workdir (по умолчанию — новый временный каталог) до импорта модулей бота.
+
+    handlers при импорте открывает restaurant_cleaner.db и photos/ относительно рабочего каталога.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="harness_")
+    os.makedirs(workdir, exist_ok=True)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    # Настраиваем журнал раньше main.py, иначе он включит INFO для всех модулей
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+    return workdir
@@ -0,0 +1,185 @@
+"""Нагрузочный сценарий «смена»: менеджеры создают задачи альбомами, исполнители их выполняют,
+менеджеры проверяют и утверждают, в конце — выгрузка отчёта.
+
+Каждый пользователь действует последовательно и ждёт ответа бота на своё действие (как человек
+с телефоном), пользователи — одновременно. Для каждого обновления замеряется время от передачи
+в обработку до завершения, включая ожидание очереди пользователя и общего лимита обработчиков.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Set
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+from config import MANAGER_CODE, STATUS_NEW, STATUS_COMPLETED, STATUS_APPROVED
+from replay_updates import percentile
+from instrumentation import update_route
+import handlers
+from harness.fake_bot import FakeRequest
+from harness.updates import UpdateFactory
+
+logger = logging.getLogger(__name__)
+
+# Категории, в которых работают исполнители сценария
+SHIFT_CATEGORIES = ("Касса", "Саладет", "Панировка", "Улица", "Зал")
+# id пользователей сценария не пересекаются с VIP_IDS и DEV_ID
+FIRST_USER_ID = 900_000_000
+# Как часто простаивающий участник проверяет, не появилась ли работа (секунд)
+IDLE_POLL = 0.05
+
+
+class ShiftDriver:
+    """Отправка обновлений в приложение и сбор задержек по маршрутам"""
+
+    def __init__(self, application: Application, request: FakeRequest, think: float = 0.0, seed: int = 1):
+        self.application = application
+        self.request = request
+        self.updates = UpdateFactory(application.bot)
+        self.think = think
+        self.rng = random.Random(seed)
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self._failed: Set[int] = set()
+        application.add_error_handler(self._on_error)
+
+    async def _on_error(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        if isinstance(update, Update):
+            self._failed.add(update.update_id)
+        logger.error(f"Ошибка обработчика: {context.error!r}")
+
+    @staticmethod
+    def route(update: Update) -> str:
+        if update.callback_query:
+            match = handlers.callback_router.resolve(update.callback_query.data or "")
+            return match[0].name if match else "неизвестная кнопка"
+        return update_route(update)
+
+    async def send(self, update: Update):
+        """Обработать обновление так же, как это делает Application при получении из очереди"""
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+        route = self.route(update)
+        started = time.perf_counter()
+        await self.application.update_processor.process_update(update, self.application.process_update(update))
+        self.timings[route].append(time.perf_counter() - started)
+        if update.update_id in self._failed:
+            self.errors[route] += 1
+
+    # --- участники смены ---
+
+    async def manager_login(self, user_id: int):
+        await self.send(self.updates.command(user_id, "/start"))
+        await self.send(self.updates.callback(user_id, "become_manager"))
+        await self.send(self.updates.text(user_id, MANAGER_CODE))
+
+    async def create_tasks(self, user_id: int, tasks: int, album_size: int):
+        for n in range(tasks):
+            category = SHIFT_CATEGORIES[(user_id + n) % len(SHIFT_CATEGORIES)]
+            await self.send(self.updates.callback(user_id, f"create_task_{category}"))
+            group = f"album{user_id}_{n}" if album_size > 1 else None
+            await self.send(self.updates.photo(user_id, caption=f"Задача {n + 1} от {user_id}", media_group_id=group))
+            for _ in range(album_size - 1):
+                await self.send(self.updates.photo(user_id, media_group_id=group))
+
+    async def review(self, user_id: int, index: int, managers: int, work_done: asyncio.Event):
+        """Проверять выполненные задачи (свою долю по номеру задачи), пока исполнители работают"""
+        while True:
+            completed = [t['task_id'] for t in await handlers.db.get_tasks(status=STATUS_COMPLETED)
+                         if t['task_id'] % managers == index]
+            if not completed:
+                if work_done.is_set():
+                    return
+                await asyncio.sleep(IDLE_POLL)
+                continue
+            await self.send(self.updates.callback(user_id, "review_tasks"))
+            for task_id in completed:
+                await self.send(self.updates.callback(user_id, f"review_{task_id}"))
+                await self.send(self.updates.callback(user_id, f"approve_{task_id}"))
+
+    async def execute(self, user_id: int, category: str, claimed: Set[int], creation_done: asyncio.Event):
+        """Выполнять новые задачи своей категории, пока менеджеры их создают"""
+        await self.send(self.updates.command(user_id, "/start"))
+        await self.send(self.updates.callback(user_id, f"set_category_{category}"))
+        while True:
+            open_tasks = [t['task_id'] for t in await handlers.db.get_tasks(status=STATUS_NEW, category=category)
+                          if t['task_id'] not in claimed]
+            if not open_tasks:
+                if creation_done.is_set():
+                    return
+                await asyncio.sleep(IDLE_POLL)
+                continue
+            task_id = min(open_tasks)
+            claimed.add(task_id)
+            await self.send(self.updates.callback(user_id, "view_tasks_executor"))
+            await self.send(self.updates.callback(user_id, f"task_{task_id}"))
+            await self.send(self.updates.callback(user_id, f"complete_{task_id}"))
+            await self.send(self.updates.photo(user_id))
+
+    async def run(self, managers: int, executors: int, tasks_per_manager: int, album_size: int) -> Dict:
+        manager_ids = [FIRST_USER_ID + i for i in range(managers)]
+        executor_ids = [FIRST_USER_ID + managers + i for i in range(executors)]
+        creation_done, work_done = asyncio.Event(), asyncio.Event()
+        claimed: Set[int] = set()
+        started = time.perf_counter()
+
+        await asyncio.gather(*(self.manager_login(uid) for uid in manager_ids))
+
+        async def creation():
+            await asyncio.gather(*(self.create_tasks(uid, tasks_per_manager, album_size) for uid in manager_ids))
+            creation_done.set()
+
+        async def execution():
+            await asyncio.gather(*(self.execute(uid, SHIFT_CATEGORIES[i % len(SHIFT_CATEGORIES)], claimed,
+                                                creation_done)
+                                   for i, uid in enumerate(executor_ids)))
+            work_done.set()
+
+        await asyncio.gather(
+            creation(),
+            execution(),
+            *(self.review(uid, i, managers, work_done) for i, uid in enumerate(manager_ids)),
+        )
+        await self.send(self.updates.callback(manager_ids[0], "export_report_photos"))
+        elapsed = time.perf_counter() - started
+
+        approved = len(await handlers.db.get_tasks(status=STATUS_APPROVED))
+        return self.summary(elapsed, approved)
+
+    def summary(self, elapsed: float, approved: int) -> Dict:
+        routes = {}
+        for route, values in self.timings.items():
+            routes[route] = {
+                'count': len(values),
+                'errors': self.errors.get(route, 0),
+                'p50': percentile(values, 0.5),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+                'max': max(values),
+            }
+        total = sum(len(values) for values in self.timings.values())
+        return {
+            'updates': total,
+            'elapsed': elapsed,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'approved_tasks': approved,
+            'routes': routes,
+            'api_calls': dict(self.request.counts()),
+            'handler_stats': handlers.callback_router.stats(),
+        }
+
+
+def render(summary: Dict) -> str:
+    lines = [
+        f"Обновлений: {summary['updates']} за {summary['elapsed']:.1f} с "
+        f"({summary['throughput']:.1f} в секунду), утверждено задач: {summary['approved_tasks']}",
+        "",
+        f"{'Маршрут':<28}{'Кол-во':>8}{'Ошибок':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}",
+    ]
+    for route, s in sorted(summary['routes'].items(), key=lambda item: -item[1]['p95']):
+        lines.append(f"{route:<28}{s['count']:>8}{s['errors']:>8}{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}"
+                     f"{s['p99'] * 1000:>10.1f}{s['max'] * 1000:>10.1f}")
+    lines += ["", "Вызовы Bot API: " + ", ".join(f"{method} {count}" for method, count
+                                                  in sorted(summary['api_calls'].items(), key=lambda i: -i[1]))]
+    return "\n".join(lines)
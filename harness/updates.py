@@ -0,0 +1,55 @@
+"""Сборка входящих обновлений (команды, текст, фото, альбомы, нажатия кнопок) для обработчиков."""
+import itertools
+import time
+from typing import Dict, Optional
+from telegram import Bot, Update
+from harness.fake_bot import photo_sizes
+
+
+class UpdateFactory:
+    """Update от имени пользователя; объекты привязаны к боту, поэтому reply_text/answer работают"""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._photo_ids = itertools.count(1)
+        self._query_ids = itertools.count(1)
+
+    @staticmethod
+    def user(user_id: int) -> Dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _message(self, user_id: int, **fields) -> Dict:
+        return {"message_id": next(self._message_ids), "date": int(time.time()), "from": self.user(user_id),
+                "chat": {"id": user_id, "type": "private"}, **fields}
+
+    def _update(self, **fields) -> Update:
+        return Update.de_json({"update_id": next(self._update_ids), **fields}, self.bot)
+
+    def command(self, user_id: int, command: str) -> Update:
+        text = command if command.startswith("/") else f"/{command}"
+        entity = {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        return self._update(message=self._message(user_id, text=text, entities=[entity]))
+
+    def text(self, user_id: int, text: str) -> Update:
+        return self._update(message=self._message(user_id, text=text))
+
+    def photo(self, user_id: int, caption: Optional[str] = None, media_group_id: Optional[str] = None,
+              file_id: Optional[str] = None) -> Update:
+        """Фото во всех размерах; file_id можно задать, чтобы отправить то же изображение повторно"""
+        file_id = file_id or f"photo{next(self._photo_ids)}"
+        fields = {"photo": photo_sizes(file_id)}
+        if caption:
+            fields["caption"] = caption
+        if media_group_id:
+            fields["media_group_id"] = media_group_id
+        return self._update(message=self._message(user_id, **fields))
+
+    def callback(self, user_id: int, data: str, message_id: Optional[int] = None) -> Update:
+        """Нажатие кнопки под сообщением бота message_id"""
+        message = {"message_id": message_id or next(self._message_ids), "date": int(time.time()),
+                   "from": {"id": self.bot.id, "is_bot": True, "first_name": "Harness"},
+                   "chat": {"id": user_id, "type": "private"}, "text": "…"}
+        return self._update(callback_query={"id": str(next(self._query_ids)), "from": self.user(user_id),
+                                             "chat_instance": str(user_id), "data": data, "message": message})
@@ -0,0 +1,199 @@
+"""Счётчики работы одного обновления: SQL-запросы, прочитанные строки, новые соединения, вызовы Bot API.
+
+Счётчики текущего обновления лежат в contextvar: AsyncDatabase переносит контекст в потоки БД,
+а запросы к Bot API выполняются в задаче обработчика, поэтому всё, что сделано ради обновления,
+попадает в его счётчики. Фоновые задачи (рассылки, сохранение альбомов) после завершения
+обновления в его итоги не входят.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+from metrics import API_CALL_SECONDS, API_FLOOD_ERRORS, api_method
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateCounters:
+    __slots__ = ("update_id", "route", "sql", "rows", "connections", "api_calls", "elapsed", "finished")
+
+    def __init__(self, update_id: Optional[int], route: str):
+        self.update_id = update_id
+        self.route = route
+        self.sql = 0
+        self.rows = 0
+        self.connections = 0
+        self.api_calls = 0
+        self.elapsed = 0.0
+        self.finished = False
+
+    def as_dict(self) -> Dict:
+        return {'route': self.route, 'sql': self.sql, 'rows': self.rows, 'connections': self.connections,
+                'api_calls': self.api_calls, 'elapsed': self.elapsed}
+
+    def __repr__(self) -> str:
+        return (f"SQL {self.sql}, строк {self.rows}, соединений {self.connections}, "
+                f"Bot API {self.api_calls}, {self.elapsed * 1000:.1f} мс")
+
+
+class RouteTotals:
+    __slots__ = ("updates", "sql", "rows", "connections", "api_calls", "max_sql", "max_api_calls")
+
+    def __init__(self):
+        self.updates = self.sql = self.rows = self.connections = self.api_calls = 0
+        self.max_sql = self.max_api_calls = 0
+
+    def add(self, counters: UpdateCounters):
+        self.updates += 1
+        self.sql += counters.sql
+        self.rows += counters.rows
+        self.connections += counters.connections
+        self.api_calls += counters.api_calls
+        self.max_sql = max(self.max_sql, counters.sql)
+        self.max_api_calls = max(self.max_api_calls, counters.api_calls)
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+_current: ContextVar[Optional[UpdateCounters]] = ContextVar("update_counters", default=None)
+_totals: Dict[str, RouteTotals] = {}
+_totals_lock = threading.Lock()
+_listeners: List[Callable[[UpdateCounters], None]] = []
+
+
+def update_route(update: object) -> str:
+    """Название маршрута по виду обновления; для кнопок его уточняет CallbackRouter"""
+    if not isinstance(update, Update):
+        return "другое"
+    if update.callback_query:
+        return "кнопка"
+    message = update.effective_message
+    if message is None:
+        return "другое"
+    if message.photo:
+        return "фото (альбом)" if message.media_group_id else "фото"
+    if message.text and message.text.startswith("/"):
+        return message.text.split()[0].split("@")[0]
+    if message.text:
+        return "текст"
+    return "сообщение"
+
+
+@contextmanager
+def track(update: object) -> Iterator[UpdateCounters]:
+    """Считать всё, что происходит внутри блока, как работу обновления update"""
+    counters = UpdateCounters(update.update_id if isinstance(update, Update) else None, update_route(update))
+    token = _current.set(counters)
+    started = time.perf_counter()
+    try:
+        yield counters
+    finally:
+        counters.elapsed = time.perf_counter() - started
+        counters.finished = True
+        _current.reset(token)
+        _finish(counters)
+
+
+def _finish(counters: UpdateCounters):
+    with _totals_lock:
+        _totals.setdefault(counters.route, RouteTotals()).add(counters)
+    logger.debug(f"Обновление {counters.update_id} ({counters.route}): {counters!r}")
+    for listener in _listeners:
+        try:
+            listener(counters)
+        except Exception as e:
+            logger.error(f"Ошибка в обработчике счётчиков обновления: {e}")
+
+
+def set_route(route: str):
+    """Уточнить маршрут текущего обновления (например, имя маршрута кнопки)"""
+    counters = _current.get()
+    if counters is not None:
+        counters.route = route
+
+
+def current() -> Optional[UpdateCounters]:
+    return _current.get()
+
+
+def count_sql(statements: int = 1):
+    counters = _current.get()
+    if counters is not None and not counters.finished:
+        counters.sql += statements
+
+
+def count_rows(rows: int):
+    counters = _current.get()
+    if counters is not None and not counters.finished:
+        counters.rows += rows
+
+
+def count_connection():
+    counters = _current.get()
+    if counters is not None and not counters.finished:
+        counters.connections += 1
+
+
+def count_api_call():
+    counters = _current.get()
+    if counters is not None and not counters.finished:
+        counters.api_calls += 1
+
+
+def add_listener(listener: Callable[[UpdateCounters], None]):
+    """Вызывать listener(counters) после каждого обработанного обновления"""
+    _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[UpdateCounters], None]):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def route_totals() -> Dict[str, Dict]:
+    """Суммарные счётчики по маршрутам с момента запуска"""
+    with _totals_lock:
+        return {route: totals.as_dict() for route, totals in _totals.items()}
+
+
+class CountingRequest(BaseRequest):
+    """Обёртка над HTTP-клиентом PTB: каждый запрос к Bot API засчитывается текущему обновлению.
+
+    Заодно замеряет время запроса и считает ответы 429 для metrics: RetryAfter PTB выбрасывает
+    уже после do_request, по коду ответа.
+    """
+
+    def __init__(self, inner: BaseRequest):
+        self.inner = inner
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.inner.read_timeout
+
+    async def initialize(self) -> None:
+        await self.inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self.inner.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> Tuple[int, bytes]:
+        count_api_call()
+        name = api_method(url)
+        started = time.perf_counter()
+        try:
+            code, payload = await self.inner.do_request(url, method, request_data, read_timeout=read_timeout,
+                                                        write_timeout=write_timeout,
+                                                        connect_timeout=connect_timeout, pool_timeout=pool_timeout)
+        finally:
+            API_CALL_SECONDS.observe(name, time.perf_counter() - started)
+        if code == 429:
+            API_FLOOD_ERRORS.inc(name)
+        return code, payload
@@ -1,8 +1,18 @@
+import argparse
+import asyncio
 import logging
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from handlers import start, handle_message, handle_photo, button_handler
-from config import BOT_TOKEN
+from typing import Optional
+from telegram import Bot, Update
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.request import HTTPXRequest
+from handlers import start, slowlog, handle_message, handle_photo, button_handler, db, photo_store
+from config import (BOT_TOKEN, CONCURRENT_UPDATES, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL,
+                    WEBHOOK_SECRET_TOKEN, METRICS_LISTEN, METRICS_PORT)
+from update_processor import PerUserUpdateProcessor
+from persistence import SQLitePersistence, UserSession
+from instrumentation import CountingRequest, add_listener
+import metrics
+import slow_queries
 
 # Настройка логирования тест переноса кода
 logging.basicConfig(
@@ -10,24 +20,114 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+slow_queries.configure()
+# Как часто удалять из хранилища фото, загрузка которых не дошла до записи в БД (секунд)
+PHOTO_SWEEP_INTERVAL = 3600
+_photo_sweeper: Optional[asyncio.Task] = None
 
 
-def main():
-    """Запуск бота"""
-    # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+async def on_init(application: Application):
+    """Запускаем очистку хранилища фото и эндпоинт метрик, если он включён в config.py"""
+    global _photo_sweeper
+    # Не через application.create_task: stop() ждёт такие задачи, а эта бесконечная
+    _photo_sweeper = asyncio.create_task(photo_store.run_sweeper(PHOTO_SWEEP_INTERVAL))
+    if not METRICS_PORT:
+        return
+    metrics.watch_application(application)
+    add_listener(metrics.observe_update)
+    await metrics.start_server(METRICS_LISTEN, METRICS_PORT)
+
+
+async def on_stop(application: Application):
+    """Приём обновлений остановлен, принятые обновления и фоновые задачи обработаны"""
+    if _photo_sweeper is not None:
+        _photo_sweeper.cancel()
+    logger.info("Все принятые обновления обработаны, бот останавливается")
+
+
+async def on_shutdown(application: Application):
+    """Закрываем соединения с базой данных и эндпоинт метрик при остановке"""
+    await metrics.stop_server()
+    db.close()
+
+
+def build_application(bot: Optional[Bot] = None) -> Application:
+    """Создать приложение и зарегистрировать обработчики.
+
+    bot — готовый экземпляр бота (например, с подменённым HTTP-клиентом в harness); по умолчанию бот с BOT_TOKEN.
+    """
+    builder = Application.builder()
+    if bot is not None:
+        builder = builder.bot(bot)
+    else:
+        # Вызовы Bot API засчитываются обновлению, ради которого сделаны (instrumentation);
+        # размер пула соединений — как у клиента, который PTB создаёт по умолчанию
+        builder = builder.token(BOT_TOKEN).request(CountingRequest(HTTPXRequest(connection_pool_size=256)))
+    application = (
+        builder
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        # Состояние диалогов хранится в той же базе и переживает перезапуск
+        .persistence(SQLitePersistence(db))
+        .context_types(ContextTypes(user_data=UserSession))
+        .post_init(on_init)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     # Регистрируем обработчики
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("slowlog", slowlog))
     application.add_handler(CallbackQueryHandler(button_handler))
     application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Telegram бот для контроля чистоты ресторана")
+    parser.add_argument("--webhook", action="store_true",
+                        help="получать обновления через webhook (настройки WEBHOOK_* в config.py) вместо long polling")
+    parser.add_argument("--local", action="store_true",
+                        help="webhook для нагрузочного прогона (replay_updates.py): Bot API подменяется "
+                             "harness.fake_bot, webhook в Telegram не регистрируется, WEBHOOK_URL не нужен")
+    args = parser.parse_args()
+    if args.local:
+        args.webhook = True
+    elif args.webhook and not WEBHOOK_URL:
+        # Без публичного адреса PTB сам соберёт адрес из listen/port/path, и Telegram его отклонит
+        parser.error("для --webhook укажите в config.py WEBHOOK_URL — публичный HTTPS-адрес, "
+                     "например https://bot.example.com/telegram")
+    return args
+
 
-    # Запускаем бота
-    logger.info("Бот запущен...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+def main():
+    """Запуск бота"""
+    args = parse_args()
+    if args.local:
+        # Ответы Bot API подделываются локально: воспроизведённые обновления не доходят до Telegram,
+        # а set_webhook, который PTB вызывает при запуске, уходит в тот же поддельный клиент
+        from harness.fake_bot import FakeRequest, make_bot
+        application = build_application(make_bot(FakeRequest()))
+    else:
+        application = build_application()
+
+    # При остановке (SIGINT/SIGTERM) сначала перестаём принимать обновления, затем дожидаемся
+    # обработки уже принятых и фоновых задач (рассылки, сохранение альбомов) и только потом закрываем БД
+    if args.webhook:
+        logger.info(f"Бот запущен в режиме webhook на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=None if args.local else WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET_TOKEN or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        logger.info("Бот запущен...")
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == '__main__':
     main()
-
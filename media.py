@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from contextlib import ExitStack
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from telegram import InputMediaPhoto, Message
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает в одном альбоме не больше 10 фото
+MEDIA_GROUP_LIMIT = 10
+# Сколько отклонённых file_id помнить (самые старые забываются)
+MAX_REJECTED_FILE_IDS = 1000
+
+
+def _existing_paths(paths: List[str]) -> set:
+    return {path for path in paths if os.path.exists(path)}
+
+
+def _open_files(paths: List[str]) -> List[Optional[BinaryIO]]:
+    """Открыть файлы для загрузки (в рабочем потоке); None — файла нет"""
+    files: List[Optional[BinaryIO]] = []
+    for path in paths:
+        try:
+            files.append(open(path, 'rb'))
+        except OSError:
+            files.append(None)
+    return files
+
+
+async def available_photos(photos: List[Dict]) -> List[Dict]:
+    """Фото, которые можно отправить: есть file_id или локальный файл.
+
+    Диск проверяется одним проходом в рабочем потоке и только для фото без file_id.
+    """
+    paths = [p['file_path'] for p in photos if not p.get('file_id') and p.get('file_path')]
+    existing = await asyncio.to_thread(_existing_paths, paths) if paths else set()
+    return [p for p in photos if p.get('file_id') or p.get('file_path') in existing]
+
+
+def refresh_file_stats(photos: List[Dict]) -> List[Tuple[Optional[int], Optional[int], int]]:
+    """Проверить локальные файлы фото одним проходом (вызывать в рабочем потоке).
+
+    Дописывает в каждое фото актуальные file_size/file_mtime (None, если файла нет) и возвращает
+    изменившиеся значения в виде [(file_size, file_mtime, photo_id), ...] для сохранения в БД.
+    """
+    changed = []
+    for p in photos:
+        size = mtime = None
+        if p.get('file_path'):
+            try:
+                st = os.stat(p['file_path'])
+                size, mtime = st.st_size, int(st.st_mtime)
+            except OSError:
+                pass
+        if (size, mtime) != (p.get('file_size'), p.get('file_mtime')):
+            p['file_size'], p['file_mtime'] = size, mtime
+            if p.get('id'):
+                changed.append((size, mtime, p['id']))
+    return changed
+
+
+def with_variant(photos: List[Dict], variants: Dict[str, Dict[str, Dict]], variant: str) -> List[Dict]:
+    """Подставить вместо оригиналов уменьшенные копии variant там, где они есть.
+
+    variants — результат Database.get_photo_variants. У подставленных фото нет id (новый file_id
+    не должен попасть в task_photos) и размера файла (его проверят заново при сборке архива).
+    """
+    result = []
+    for p in photos:
+        copy = variants.get(p.get('file_path'), {}).get(variant)
+        if copy:
+            p = {**p, 'id': None, 'file_id': copy['file_id'], 'file_path': copy['file_path'],
+                 'file_size': None, 'file_mtime': None}
+        result.append(p)
+    return result
+
+
+class MediaSender:
+    """Отправка фото задач по file_id с запасным вариантом — загрузкой локального файла.
+
+    Если Telegram отклоняет альбом, каждый его file_id проверяется через get_file (без сообщений
+    в чат), и только недействительные запоминаются и загружаются из локальных файлов. file_id,
+    который вернул Telegram для загруженного файла, сохраняется в task_photos — следующий показ
+    снова идёт по file_id.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._rejected_file_ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def _can_use_file_id(self, photo: Dict) -> bool:
+        return bool(photo.get('file_id')) and photo['file_id'] not in self._rejected_file_ids
+
+    def _reject(self, file_ids: List[str]):
+        for file_id in file_ids:
+            self._rejected_file_ids[file_id] = None
+        while len(self._rejected_file_ids) > MAX_REJECTED_FILE_IDS:
+            self._rejected_file_ids.popitem(last=False)
+
+    @staticmethod
+    async def _find_rejected(bot, photos: List[Dict]) -> List[str]:
+        """file_id альбома, которые Telegram не принимает"""
+        file_ids = list(dict.fromkeys(p['file_id'] for p in photos))
+        results = await asyncio.gather(*(bot.get_file(file_id) for file_id in file_ids), return_exceptions=True)
+        return [file_id for file_id, result in zip(file_ids, results) if isinstance(result, BadRequest)]
+
+    async def send_album(self, bot, chat_id: int, photos: List[Dict], caption: Optional[str] = None,
+                         variant: Optional[str] = None) -> List[Message]:
+        """Отправить фото альбомами по 10 штук, подпись — у первого фото.
+
+        variant — имя уменьшенной копии ('preview', 'report'): фото, у которых она есть, отправляются ею.
+        """
+        if variant and photos:
+            variants = await self.db.get_photo_variants([p.get('file_path') for p in photos], variant)
+            photos = with_variant(photos, variants, variant)
+        sent: List[Message] = []
+        for i in range(0, len(photos), MEDIA_GROUP_LIMIT):
+            batch = photos[i:i + MEDIA_GROUP_LIMIT]
+            sent.extend(await self._send_batch(bot, chat_id, batch, caption if i == 0 else None))
+        return sent
+
+    async def _send_batch(self, bot, chat_id: int, photos: List[Dict], caption: Optional[str]) -> List[Message]:
+        if all(self._can_use_file_id(p) for p in photos):
+            media = [InputMediaPhoto(media=p['file_id'], caption=caption if idx == 0 else None)
+                     for idx, p in enumerate(photos)]
+            try:
+                return await bot.send_media_group(chat_id=chat_id, media=media)
+            except BadRequest as e:
+                rejected = await self._find_rejected(bot, photos)
+                logger.warning(f"Telegram отклонил альбом ({e}), недействительных file_id: {len(rejected)}; "
+                               f"загружаю локальные файлы")
+                if rejected:
+                    self._reject(rejected)
+                else:
+                    # Виноват не конкретный file_id — загружаем все фото, у которых есть файл
+                    return await self._upload_batch(bot, chat_id, photos, caption, upload_all=True)
+        return await self._upload_batch(bot, chat_id, photos, caption)
+
+    async def _upload_batch(self, bot, chat_id: int, photos: List[Dict], caption: Optional[str],
+                            upload_all: bool = False) -> List[Message]:
+        """Отправить фото, загружая локальные файлы там, где file_id использовать нельзя (или всегда — upload_all)"""
+        media = []
+        with ExitStack() as stack:
+            # Файлы открываются одним проходом в рабочем потоке, а не в event loop
+            to_upload = [p for p in photos if p.get('file_path') and (upload_all or not self._can_use_file_id(p))]
+            opened = await asyncio.to_thread(_open_files, [p['file_path'] for p in to_upload]) if to_upload else []
+            files = {}
+            for p, f in zip(to_upload, opened):
+                if f is not None:
+                    files[id(p)] = stack.enter_context(f)
+            for p in photos:
+                if self._can_use_file_id(p) and not upload_all:
+                    media.append((p, p['file_id'], False))
+                elif id(p) in files:
+                    media.append((p, files[id(p)], True))
+                elif self._can_use_file_id(p):
+                    media.append((p, p['file_id'], False))
+                else:
+                    logger.warning(f"Фото {p.get('id')} недоступно ни по file_id, ни локально — пропускаю")
+            if not media:
+                return []
+            items = [InputMediaPhoto(media=item, caption=caption if idx == 0 else None)
+                     for idx, (_, item, _) in enumerate(media)]
+            sent = await bot.send_media_group(chat_id=chat_id, media=items)
+        # Запоминаем новые file_id загруженных фото одной записью, чтобы не загружать их повторно
+        updated = [(photo, message.photo[-1].file_id) for (photo, _, uploaded), message in zip(media, sent)
+                   if uploaded and message.photo and photo.get('id')]
+        if updated:
+            try:
+                await self.db.update_task_photo_file_ids([(file_id, photo['id']) for photo, file_id in updated])
+                for photo, file_id in updated:
+                    photo['file_id'] = file_id
+            except Exception as e:
+                logger.error(f"Не удалось сохранить новые file_id для фото {[photo['id'] for photo, _ in updated]}: {e}")
+        return sent
@@ -0,0 +1,199 @@
+"""Метрики бота в текстовом формате Prometheus и HTTP-эндпоинт для локального сбора.
+
+Гистограммы: время обработки обновления по маршруту, время методов Database, время запросов
+к Bot API по методу. Счётчики: ответы 429 (RetryAfter) от Telegram, SQL-запросы и вызовы Bot API
+по маршрутам. Датчики: очередь обновлений и обновления, ждущие своей очереди у обработчика.
+
+Сбор значений ничего не стоит, если эндпоинт не запущен: это несколько сложений под блокировкой.
+Сервер включается в config.py (METRICS_PORT) и слушает только локальный адрес.
+"""
+import asyncio
+import bisect
+import logging
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах: от быстрых запросов SQLite до медленных загрузок фото
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Гистограмма с одной меткой: накопленные корзины, сумма и количество наблюдений"""
+
+    def __init__(self, name: str, documentation: str, label: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, label_value: str, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # [счётчики по корзинам (+Inf последней), сумма]
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(value, list(counts), total) for value, (counts, total) in sorted(self._series.items())]
+        for value, counts, total in snapshot:
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{_number(bound)}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total!r}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Монотонный счётчик с одной меткой"""
+
+    def __init__(self, name: str, documentation: str, label: str):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, label_value: str, amount: float = 1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f'{self.name}{{{self.label}="{_escape(value)}"}} {_number(amount)}' for value, amount in values]
+        return lines
+
+
+class Gauge:
+    """Значение, которое считывается функцией в момент сбора; None — значения сейчас нет"""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.error(f"Не удалось прочитать метрику {self.name}: {e}")
+            value = None
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_number(value)}"]
+
+
+REGISTRY: List = []
+
+UPDATE_SECONDS = Histogram("bot_update_duration_seconds",
+                           "Время обработки обновления по маршруту (кнопка, команда, вид сообщения)", "route")
+DB_CALL_SECONDS = Histogram("bot_db_call_duration_seconds",
+                            "Время выполнения метода Database в потоке БД", "method")
+API_CALL_SECONDS = Histogram("bot_api_request_duration_seconds",
+                             "Время запроса к Bot API по методу (download_file — скачивание файла)", "method")
+API_FLOOD_ERRORS = Counter("bot_api_flood_errors_total",
+                           "Ответы Telegram 429 Too Many Requests (RetryAfter) по методу", "method")
+UPDATE_SQL = Counter("bot_update_sql_statements_total", "SQL-запросы, выполненные ради обновлений", "route")
+UPDATE_API_CALLS = Counter("bot_update_api_calls_total", "Вызовы Bot API, сделанные ради обновлений", "route")
+
+
+def api_method(url: str) -> str:
+    """Имя метода Bot API из адреса запроса в стиле PTB: sendMediaGroup -> send_media_group"""
+    if "/file/bot" in url:
+        return "download_file"
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", url.rsplit("/", 1)[-1]).lower()
+
+
+def observe_update(counters):
+    """Слушатель instrumentation: итоги обработанного обновления"""
+    UPDATE_SECONDS.observe(counters.route, counters.elapsed)
+    UPDATE_SQL.inc(counters.route, counters.sql)
+    UPDATE_API_CALLS.inc(counters.route, counters.api_calls)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def watch_application(application: Application):
+    """Датчики очереди: принятые Telegram обновления и обновления, ждущие обработчика"""
+    Gauge("bot_update_queue_depth", "Обновления в очереди приложения, ещё не переданные обработчику",
+          lambda: application.update_queue.qsize())
+    if hasattr(application.update_processor, "pending_updates"):
+        Gauge("bot_updates_pending", "Обновления, которые обрабатываются или ждут очереди своего пользователя",
+              lambda: application.update_processor.pending_updates)
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки не нужны, но их нужно дочитать до пустой строки
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/metrics", "/"):
+            status, body = "200 OK", render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    except Exception as e:
+        logger.error(f"Ошибка при отдаче метрик: {e}")
+    finally:
+        writer.close()
+
+
+_server: Optional[asyncio.AbstractServer] = None
+
+
+async def start_server(listen: str, port: int) -> Tuple[str, int]:
+    """Запустить эндпоинт /metrics в текущем event loop; возвращает фактический адрес"""
+    global _server
+    _server = await asyncio.start_server(_handle, listen, port)
+    address = _server.sockets[0].getsockname()[:2]
+    logger.info(f"Метрики доступны на http://{address[0]}:{address[1]}/metrics")
+    return address
+
+
+async def stop_server():
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,243 @@
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(cursor: sqlite3.Cursor, table: str) -> List[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    """Добавить колонку, если её ещё нет (для баз, созданных старыми версиями бота)"""
+    if column not in _columns(cursor, table):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _migration_base_schema(cursor: sqlite3.Cursor):
+    """Базовая схема: users, tasks, task_photos и колонки, добавленные позже"""
+    # Таблица пользователей
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            role TEXT DEFAULT 'executor',
+            category TEXT,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Таблица задач
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id INTEGER PRIMARY KEY,
+            created_by INTEGER,
+            photo_before_id TEXT,
+            photo_before_path TEXT,
+            comment TEXT,
+            status TEXT DEFAULT 'Новая',
+            category TEXT,
+            completed_by INTEGER,
+            photo_after_id TEXT,
+            photo_after_path TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            FOREIGN KEY (created_by) REFERENCES users(user_id),
+            FOREIGN KEY (completed_by) REFERENCES users(user_id)
+        )
+    """)
+
+    # Таблица для нескольких фото задачи
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS task_photos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            kind TEXT CHECK(kind IN ('before','after')) NOT NULL,
+            file_id TEXT,
+            file_path TEXT,
+            FOREIGN KEY (task_id) REFERENCES tasks(task_id) ON DELETE CASCADE
+        )
+    """)
+
+    _add_column(cursor, "tasks", "category", "TEXT")
+    _add_column(cursor, "tasks", "priority", "TEXT DEFAULT 'normal'")
+    _add_column(cursor, "users", "category", "TEXT")
+    if "last_active" not in _columns(cursor, "users"):
+        # SQLite не позволяет добавлять колонку с DEFAULT CURRENT_TIMESTAMP
+        # Добавляем колонку без DEFAULT, затем обновляем существующие записи
+        cursor.execute("ALTER TABLE users ADD COLUMN last_active TIMESTAMP")
+        cursor.execute("UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE last_active IS NULL")
+
+
+def _migration_indexes(cursor: sqlite3.Cursor):
+    """Составные индексы под основные запросы бота"""
+    # get_tasks(status, category): фильтр + сортировка по created_at без временного B-дерева
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_category_created ON tasks(status, category, created_at)")
+    # get_tasks(status): проверка выполненных, отчёт, удаление завершённых
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks(status, created_at)")
+    # Общий список задач менеджера
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks(created_at, task_id)")
+    # Фото задачи по task_id (и виду до/после)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_photos_task_kind ON task_photos(task_id, kind)")
+    # Покрывающие индексы для выборок пользователей по категории и по роли
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_category ON users(category, user_id, username)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role, user_id)")
+    cursor.execute("ANALYZE")
+
+
+def _migration_free_task_ids(cursor: sqlite3.Cursor):
+    """Список освободившихся номеров задач для выдачи минимального свободного ID без полного скана"""
+    cursor.execute("CREATE TABLE IF NOT EXISTS free_task_ids (task_id INTEGER PRIMARY KEY)")
+    # Заполняем пропусками, которые уже есть в нумерации
+    cursor.execute("""
+        WITH RECURSIVE seq(n) AS (
+            SELECT 1
+            UNION ALL
+            SELECT n + 1 FROM seq WHERE n < (SELECT IFNULL(MAX(task_id), 0) FROM tasks)
+        )
+        INSERT OR IGNORE INTO free_task_ids (task_id)
+        SELECT n FROM seq WHERE n NOT IN (SELECT task_id FROM tasks)
+    """)
+    # Список поддерживается триггерами, поэтому корректен при любом способе удаления/вставки задач
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_release_id AFTER DELETE ON tasks
+        BEGIN
+            INSERT OR IGNORE INTO free_task_ids (task_id) VALUES (OLD.task_id);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_take_id AFTER INSERT ON tasks
+        BEGIN
+            DELETE FROM free_task_ids WHERE task_id = NEW.task_id;
+        END
+    """)
+
+
+def _migration_photo_file_stats(cursor: sqlite3.Cursor):
+    """Размер и время изменения файла фото: проверка файлов при выгрузке без отдельного запроса на задачу"""
+    _add_column(cursor, "task_photos", "file_size", "INTEGER")
+    _add_column(cursor, "task_photos", "file_mtime", "INTEGER")
+
+
+def _migration_conversation_state(cursor: sqlite3.Cursor):
+    """Состояние диалогов (context.user_data), чтобы перезапуск бота не терял начатые действия"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            user_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# Колонки, которые ссылаются на файлы фото: счётчик ссылок photo_files ведут триггеры на них
+PHOTO_PATH_COLUMNS = (
+    ("task_photos", "file_path"),
+    ("tasks", "photo_before_path"),
+    ("tasks", "photo_after_path"),
+)
+
+
+def _create_photo_ref_triggers(cursor: sqlite3.Cursor, table: str, column: str):
+    """Триггеры, которые ведут photo_files.refcount для колонки table.column с путём к файлу.
+
+    Новая ссылка снимает защиту pinned_until, выданную файлу при загрузке (Database.pin_photo_file).
+    """
+    name = f"{table}_{column}"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{name}_ref AFTER INSERT ON {table}
+        WHEN NEW.{column} IS NOT NULL
+        BEGIN
+            INSERT INTO photo_files (path, refcount) VALUES (NEW.{column}, 1)
+            ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1, pinned_until = NULL;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{name}_unref AFTER DELETE ON {table}
+        WHEN OLD.{column} IS NOT NULL
+        BEGIN
+            UPDATE photo_files SET refcount = refcount - 1 WHERE path = OLD.{column};
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{name}_reref AFTER UPDATE OF {column} ON {table}
+        WHEN OLD.{column} IS NOT NEW.{column}
+        BEGIN
+            UPDATE photo_files SET refcount = refcount - 1 WHERE path = OLD.{column};
+            INSERT INTO photo_files (path, refcount) SELECT NEW.{column}, 1 WHERE NEW.{column} IS NOT NULL
+            ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1, pinned_until = NULL;
+        END
+    """)
+
+
+def _migration_photo_files(cursor: sqlite3.Cursor):
+    """Счётчик ссылок на файлы фото: файл удаляется, только когда на него не ссылается ни одна запись"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS photo_files (
+            path TEXT PRIMARY KEY,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            pinned_until TIMESTAMP
+        )
+    """)
+    # Ссылки, которые уже есть в базе
+    cursor.execute("""
+        INSERT OR IGNORE INTO photo_files (path, refcount)
+        SELECT path, COUNT(*) FROM (
+            SELECT file_path AS path FROM task_photos
+            UNION ALL SELECT photo_before_path FROM tasks
+            UNION ALL SELECT photo_after_path FROM tasks
+        )
+        WHERE path IS NOT NULL
+        GROUP BY path
+    """)
+    for table, column in PHOTO_PATH_COLUMNS:
+        _create_photo_ref_triggers(cursor, table, column)
+
+
+def _migration_photo_variants(cursor: sqlite3.Cursor):
+    """Уменьшенные копии фото (превью, для отчёта) из размеров, которые Telegram хранит сам"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS photo_variants (
+            source_path TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            file_id TEXT,
+            file_path TEXT NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            PRIMARY KEY (source_path, variant)
+        )
+    """)
+    _create_photo_ref_triggers(cursor, "photo_variants", "file_path")
+
+
+# Миграции применяются строго по порядку; номер записывается в PRAGMA user_version.
+# Новые миграции только добавляются в конец списка, старые не меняются.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "базовая схема", _migration_base_schema),
+    (2, "индексы для tasks, users и task_photos", _migration_indexes),
+    (3, "список свободных номеров задач", _migration_free_task_ids),
+    (4, "размер и время изменения файлов фото", _migration_photo_file_stats),
+    (5, "состояние диалогов пользователей", _migration_conversation_state),
+    (6, "счётчик ссылок на файлы фото", _migration_photo_files),
+    (7, "уменьшенные копии фото", _migration_photo_variants),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def apply_migrations(pool) -> int:
+    """Довести схему до последней версии. Возвращает итоговую версию схемы."""
+    for version, description, migration in MIGRATIONS:
+        with pool.transaction() as cursor:
+            # Версию читаем внутри транзакции записи: два процесса не применят миграцию дважды
+            cursor.execute("PRAGMA user_version")
+            current = cursor.fetchone()[0]
+            if current >= version:
+                continue
+            logger.info(f"Применяю миграцию {version}: {description}")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+    return SCHEMA_VERSION
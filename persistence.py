@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# Сколько задач помнить в словарях message_id и сколько сообщений на одну задачу
+MAX_TRACKED_TASKS = 20
+MAX_MESSAGES_PER_TASK = 30
+# Как часто PTB сохраняет изменённые сессии (секунд)
+FLUSH_INTERVAL = 15
+
+_MISSING = object()
+
+
+class MessageIdMap(OrderedDict):
+    """str(task_id) → [message_id, ...] с ограничением размера: самые старые задачи вытесняются"""
+
+    def __setitem__(self, key, value):
+        if len(value) > MAX_MESSAGES_PER_TASK:
+            value = list(value)[-MAX_MESSAGES_PER_TASK:]
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > MAX_TRACKED_TASKS:
+            self.popitem(last=False)
+
+
+class UserSession:
+    """Состояние диалога пользователя (context.user_data) с интерфейсом словаря.
+
+    Известные ключи хранятся в слотах, незнакомые — в extra. Любое изменение увеличивает
+    revision: по нему persistence сохраняет только изменившиеся сессии.
+    """
+
+    FIELDS = (
+        # Создание задачи
+        'creating_task', 'task_step', 'task_category', 'task_priority', 'task_id', 'photo_id', 'photo_path',
+        # Альбомы
+        'album_id', 'album_task_id', 'album_kind',
+        # Режимы ввода
+        'completing_task', 'editing_comment', 'editing_photo', 'redoing_task', 'broadcasting',
+        'dev_broadcasting', 'waiting_for_code', 'return_to',
+        # Открытые экраны и их сообщения
+        'current_executor_task_id', 'last_review_task_id', 'executor_list_message_id',
+        'manager_list_message_id', 'review_list_message_id', 'manager_page_cursors',
+        'executor_task_message_ids', 'review_message_ids', 'task_view_message_ids',
+    )
+    MESSAGE_ID_MAPS = frozenset(('executor_task_message_ids', 'review_message_ids', 'task_view_message_ids'))
+
+    __slots__ = FIELDS + ('extra', 'revision')
+
+    def __init__(self):
+        self.extra: Dict[str, Any] = {}
+        self.revision = 0
+
+    # --- интерфейс словаря (как у обычного context.user_data) ---
+
+    def __getitem__(self, key: str):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        if key in self.MESSAGE_ID_MAPS and value is not None and not isinstance(value, MessageIdMap):
+            value = MessageIdMap(value)
+        elif isinstance(value, MessageIdMap):
+            # Словарь мог пополниться на месте — повторное присваивание применяет ограничение
+            while len(value) > MAX_TRACKED_TASKS:
+                value.popitem(last=False)
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+        self.revision += 1
+
+    def __delitem__(self, key: str):
+        if self.pop(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def get(self, key: str, default=None):
+        if key in self.FIELDS:
+            return getattr(self, key, default)
+        return self.extra.get(key, default)
+
+    def pop(self, key: str, default=_MISSING):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        if key in self.FIELDS:
+            delattr(self, key)
+        else:
+            del self.extra[key]
+        self.revision += 1
+        return value
+
+    def setdefault(self, key: str, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = default
+            value = self.get(key)
+        return value
+
+    def keys(self) -> List[str]:
+        return [f for f in self.FIELDS if hasattr(self, f)] + list(self.extra)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self.get(key)) for key in self.keys()]
+
+    def clear(self):
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                delattr(self, field)
+        self.extra.clear()
+        self.revision += 1
+
+    # --- сериализация ---
+
+    def to_json(self) -> str:
+        state = {}
+        for key, value in self.items():
+            if key == 'manager_page_cursors' and value:
+                # Ключи — номера страниц, значения — кортежи (created_at, task_id)
+                value = [[page, list(cursor)] for page, cursor in value.items()]
+            elif isinstance(value, MessageIdMap):
+                value = [[task_id, ids] for task_id, ids in value.items()]
+            state[key] = value
+        return json.dumps(state, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text: str) -> "UserSession":
+        session = cls()
+        for key, value in json.loads(text).items():
+            if key == 'manager_page_cursors' and value:
+                value = {int(page): tuple(cursor) for page, cursor in value}
+            elif key in cls.MESSAGE_ID_MAPS and value is not None:
+                value = MessageIdMap((task_id, ids) for task_id, ids in value)
+            session[key] = value
+        session.revision = 0
+        return session
+
+    def __deepcopy__(self, memo):
+        # PTB копирует user_data перед сохранением; через JSON копия заодно проверяет сериализуемость
+        copy = UserSession.from_json(self.to_json())
+        copy.revision = self.revision
+        return copy
+
+    def __repr__(self) -> str:
+        return f"UserSession({dict(self.items())!r})"
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранение context.user_data в таблице conversation_state той же базы SQLite.
+
+    Сохраняются только сессии, изменившиеся с прошлого сохранения, одной транзакцией на пачку.
+    chat_data, bot_data и callback_data бот не использует и не хранит.
+    """
+
+    def __init__(self, db, update_interval: float = FLUSH_INTERVAL):
+        super().__init__(store_data=PersistenceInput(user_data=True, chat_data=False, bot_data=False,
+                                                     callback_data=False),
+                         update_interval=update_interval)
+        self.db = db
+        # revision каждой сессии на момент последнего сохранения
+        self._saved_revisions: Dict[int, int] = {}
+        self._pending: Dict[int, UserSession] = {}
+        self._write_lock = asyncio.Lock()
+
+    async def get_user_data(self) -> Dict[int, UserSession]:
+        sessions = {}
+        for user_id, state in (await self.db.get_conversation_states()).items():
+            try:
+                sessions[user_id] = UserSession.from_json(state)
+            except (ValueError, TypeError) as e:
+                logger.error(f"Не удалось восстановить состояние пользователя {user_id}: {e}")
+                continue
+            self._saved_revisions[user_id] = 0
+        logger.info(f"Восстановлено состояние диалогов: {len(sessions)} пользователей")
+        return sessions
+
+    async def update_user_data(self, user_id: int, data: UserSession) -> None:
+        if self._saved_revisions.get(user_id) == data.revision:
+            return
+        self._pending[user_id] = data
+        # Даём остальным вызовам из того же update_persistence поставить свои сессии в очередь
+        await asyncio.sleep(0)
+        await self._write_pending()
+
+    async def _write_pending(self):
+        async with self._write_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            await self.db.save_conversation_states([(user_id, s.to_json()) for user_id, s in pending.items()])
+            for user_id, session in pending.items():
+                self._saved_revisions[user_id] = session.revision
+            logger.debug(f"Сохранено состояние диалогов: {len(pending)} пользователей")
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._saved_revisions.pop(user_id, None)
+        self._pending.pop(user_id, None)
+        await self.db.delete_conversation_state(user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: UserSession) -> None:
+        pass
+
+    async def flush(self) -> None:
+        await self._write_pending()
+
+    # --- данные, которые бот не хранит ---
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Any:
+        return {}
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state: Optional[object]) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
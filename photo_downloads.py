@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+from telegram import PhotoSize
+
+logger = logging.getLogger(__name__)
+
+MAX_PARALLEL_DOWNLOADS = 4
+# Фоновые скачивания уменьшенных копий ограничены отдельно и не занимают места оригиналов
+MAX_PARALLEL_VARIANT_DOWNLOADS = 2
+# Сколько ждать следующее фото альбома, прежде чем сохранять собранные фото в БД
+ALBUM_QUIET_PERIOD = 1.5  # секунд
+# Уменьшенные копии фото: имя → наибольшая сторона в пикселях
+PHOTO_VARIANTS = {'preview': 320, 'report': 800}
+
+
+def pick_variants(sizes: Sequence[PhotoSize], names: Iterable[str] = PHOTO_VARIANTS) -> Dict[str, PhotoSize]:
+    """Выбрать для каждой копии names (из PHOTO_VARIANTS) размер фото, который Telegram уже сделал сам.
+
+    Берётся наибольший размер, не превышающий нужный (или самый маленький, если все больше).
+    Копия, совпадающая с оригиналом, не нужна и не возвращается.
+    """
+    if not sizes:
+        return {}
+    by_side = sorted(sizes, key=lambda s: max(s.width, s.height))
+    original = by_side[-1]
+    result = {}
+    for name in names:
+        side = PHOTO_VARIANTS[name]
+        fitting = [s for s in by_side if max(s.width, s.height) <= side]
+        size = fitting[-1] if fitting else by_side[0]
+        if size.file_unique_id != original.file_unique_id:
+            result[name] = size
+    return result
+
+
+class _AlbumBatch:
+    __slots__ = ("task_id", "kind", "downloads", "last_added")
+
+    def __init__(self, task_id: int, kind: str):
+        self.task_id = task_id
+        self.kind = kind
+        self.downloads: List[Tuple[str, asyncio.Task]] = []
+        self.last_added = time.monotonic()
+
+
+class PhotoDownloader:
+    """Загрузка фото из Telegram с ограниченным числом параллельных скачиваний.
+
+    Файл скачивается во временный путь и переносится в хранилище (PhotoStore) целиком, поэтому
+    недокачанный файл никогда не окажется под итоговым именем. Фото одного альбома
+    (media_group_id) скачиваются параллельно и регистрируются в task_photos одной вставкой,
+    когда альбом перестаёт пополняться. Уменьшенные копии (photo_variants) скачиваются в фоне,
+    только перечисленные в variants, и со своим ограничением — оригиналы их не ждут.
+    """
+
+    def __init__(self, db, store, variants: Iterable[str] = (), max_parallel: int = MAX_PARALLEL_DOWNLOADS,
+                 quiet_period: float = ALBUM_QUIET_PERIOD):
+        self.db = db
+        self.store = store
+        self.variants = list(dict.fromkeys(name for name in variants if name))
+        unknown = [name for name in self.variants if name not in PHOTO_VARIANTS]
+        if unknown:
+            raise ValueError(f"Неизвестные копии фото: {', '.join(unknown)} (есть: {', '.join(PHOTO_VARIANTS)})")
+        self.quiet_period = quiet_period
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._variant_semaphore = asyncio.Semaphore(MAX_PARALLEL_VARIANT_DOWNLOADS)
+        self._albums: Dict[str, _AlbumBatch] = {}
+
+    async def download(self, bot, file_id: str, background: bool = False) -> str:
+        """Скачать файл по file_id в хранилище. Возвращает путь к файлу.
+
+        background — фоновое скачивание (копии): занимает отдельные места, а не места оригиналов.
+        """
+        tmp_path = self.store.temp_path()
+        async with (self._variant_semaphore if background else self._semaphore):
+            try:
+                file = await bot.get_file(file_id)
+                await file.download_to_drive(tmp_path)
+            except Exception:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+        return await self.store.add(tmp_path)
+
+    async def download_photo(self, application, bot, sizes: Sequence[PhotoSize]) -> str:
+        """Скачать фото наибольшего размера (message.photo[-1]); уменьшенные копии — в фоне"""
+        path = await self.download(bot, sizes[-1].file_id)
+        variants = pick_variants(sizes, self.variants) if self.variants else {}
+        if variants:
+            application.create_task(self._download_variants(bot, path, variants))
+        return path
+
+    async def _download_variants(self, bot, source_path: str, variants: Dict[str, PhotoSize]):
+        placed: List[str] = []
+        try:
+            # То же изображение могли прислать раньше — его копии уже есть
+            existing = (await self.db.get_photo_variants([source_path])).get(source_path, {})
+            todo = {name: size for name, size in variants.items() if name not in existing}
+            # Если двум копиям подошёл один размер, скачиваем его один раз
+            unique = {size.file_unique_id: size for size in todo.values()}
+            results = await asyncio.gather(*(self.download(bot, size.file_id, background=True)
+                                             for size in unique.values()),
+                                           return_exceptions=True)
+            placed = [result for result in results if not isinstance(result, BaseException)]
+            failed = next((result for result in results if isinstance(result, BaseException)), None)
+            if failed is not None:
+                raise failed
+            downloads = dict(zip(unique, results))
+            await self.db.add_photo_variants([
+                (source_path, name, size.file_id, downloads[size.file_unique_id], size.width, size.height)
+                for name, size in todo.items()
+            ])
+        except Exception as e:
+            logger.error(f"Не удалось сохранить уменьшенные копии фото {source_path}: {e}")
+            # Скачанные копии без записи в photo_variants никому не нужны
+            await self._discard(placed)
+
+    async def _discard(self, paths: List[str]):
+        try:
+            await self.store.discard(paths)
+        except Exception as e:
+            logger.error(f"Не удалось удалить несохранённые фото {paths}: {e}")
+
+    def add_album_photo(self, application, bot, media_group_id: str, task_id: int, kind: str,
+                        sizes: Sequence[PhotoSize]):
+        """Поставить фото альбома в очередь: скачивание начинается сразу, запись в БД — пачкой"""
+        batch = self._albums.get(media_group_id)
+        if batch is None:
+            batch = self._albums[media_group_id] = _AlbumBatch(task_id, kind)
+            # Задача приложения: при остановке бот дождётся сохранения альбома
+            application.create_task(self._flush(media_group_id, batch))
+        batch.last_added = time.monotonic()
+        download = asyncio.create_task(self.download_photo(application, bot, sizes))
+        batch.downloads.append((sizes[-1].file_id, download))
+
+    async def _flush(self, media_group_id: str, batch: _AlbumBatch):
+        delay = self.quiet_period
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = batch.last_added + self.quiet_period - time.monotonic()
+        # Новые фото этого альбома после этой точки попадут в новую пачку
+        self._albums.pop(media_group_id, None)
+
+        results = await asyncio.gather(*(task for _, task in batch.downloads), return_exceptions=True)
+        photos = []
+        for (file_id, _), result in zip(batch.downloads, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Не удалось скачать фото альбома {media_group_id} для задачи #{batch.task_id}: {result}")
+                continue
+            photos.append((batch.task_id, batch.kind, file_id, result))
+        try:
+            await self.db.add_task_photos_bulk(photos)
+        except Exception as e:
+            logger.error(f"Не удалось сохранить фото альбома {media_group_id} для задачи #{batch.task_id}: {e}")
+            await self._discard([path for _, _, _, path in photos])
+            return
+        logger.info(f"Альбом {media_group_id}: сохранено {len(photos)} из {len(batch.downloads)} фото задачи #{batch.task_id}")
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from typing import List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK = 1024 * 1024
+
+
+class PurgeReport(NamedTuple):
+    tasks: int  # удалено задач
+    photos: int  # удалено строк task_photos
+    files: int  # удалено файлов
+    bytes_freed: int
+    failures: List[Tuple[str, str]]  # (путь, ошибка)
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 содержимого файла (читается блоками)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PhotoStore:
+    """Хранилище фото по хэшу содержимого: <root>/ab/cd/<sha256>.jpg.
+
+    Одинаковые изображения хранятся одним файлом, на который ссылаются несколько записей;
+    число ссылок ведут триггеры таблицы photo_files. Файл удаляется с диска только
+    вместе с последней ссылкой: строки снимаются с учёта в транзакции (claim_unreferenced_files),
+    а файлы удаляются после её фиксации в отдельном потоке.
+    """
+
+    def __init__(self, db, root: str):
+        self.db = db
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        # Перенос нового файла и удаление снятых с учёта не должны пересекаться: иначе удаление
+        # может забрать файл, который add только что нашёл на месте и не стал копировать
+        self._files_lock = asyncio.Lock()
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.jpg")
+
+    def temp_path(self) -> str:
+        """Временный путь для скачивания нового файла"""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.part")
+
+    @staticmethod
+    def _place(tmp_path: str, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            # Такое изображение уже есть — второй копии не нужно
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+
+    async def add(self, tmp_path: str) -> str:
+        """Перенести скачанный файл в хранилище. Возвращает путь, который нужно сохранить в БД."""
+        digest = await asyncio.to_thread(file_digest, tmp_path)
+        path = self.path_for(digest)
+        # Сначала защищаем путь от удаления: файл мог как раз терять последнюю ссылку
+        await self.db.pin_photo_file(path)
+        async with self._files_lock:
+            await asyncio.to_thread(self._place, tmp_path, path)
+        return path
+
+    @staticmethod
+    def _unlink(paths: List[str]) -> Tuple[int, int, List[Tuple[str, str]]]:
+        removed = freed = 0
+        failures = []
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+                freed += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Не удалось удалить файл {path}: {e}")
+                failures.append((path, str(e)))
+        return removed, freed, failures
+
+    async def release(self, paths: List[str]) -> Tuple[int, int, List[Tuple[str, str]]]:
+        """Удалить файлы, на которые больше нет ссылок. Возвращает (удалено файлов, освобождено байт, ошибки).
+
+        Строки photo_files удаляются в транзакции, файлы — после её фиксации, в отдельном потоке:
+        откат транзакции не оставит записей без файлов, а поток записи БД не ждёт диска.
+        """
+        if not paths:
+            return 0, 0, []
+        claimed = await self.db.claim_unreferenced_files(paths)
+        if not claimed:
+            return 0, 0, []
+        async with self._files_lock:
+            # Пока ждали блокировку, add мог снова взять один из путей под защиту
+            tracked = set(await self.db.get_tracked_photo_files(claimed))
+            return await asyncio.to_thread(self._unlink, [p for p in claimed if p not in tracked])
+
+    async def discard(self, paths: List[str]) -> Tuple[int, int, List[Tuple[str, str]]]:
+        """Файлы, которые add положил в хранилище, но запись о которых в БД не появилась:
+        снять защиту и удалить, если на них никто не ссылается"""
+        if not paths:
+            return 0, 0, []
+        await self.db.unpin_photo_files(paths)
+        return await self.release(paths)
+
+    async def sweep(self) -> Tuple[int, int, List[Tuple[str, str]]]:
+        """Удалить файлы без ссылок с истёкшей защитой (оставшиеся после сбоев и перезапусков)"""
+        removed, freed, failures = await self.release(await self.db.get_orphan_photo_files())
+        if removed or failures:
+            logger.info(f"Очистка хранилища: удалено файлов {removed} ({freed} байт), ошибок: {len(failures)}")
+        return removed, freed, failures
+
+    async def run_sweeper(self, interval: float):
+        """Периодическая очистка хранилища (отменяется при остановке бота)"""
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка очистки хранилища фото: {e}")
+            await asyncio.sleep(interval)
+
+    async def purge_tasks(self, task_ids: Optional[List[int]] = None, status: Optional[str] = None) -> PurgeReport:
+        """Удалить задачи с их фото: записи — одной транзакцией, файлы — после, вне event loop.
+
+        task_ids — конкретные задачи; status — все задачи в этом статусе на момент удаления.
+        """
+        if status is not None:
+            result = await self.db.delete_tasks_by_status(status)
+        else:
+            result = await self.db.delete_tasks(task_ids or [])
+        removed, freed, failures = await self.release(result['paths'])
+        report = PurgeReport(result['tasks'], result['photos'], removed, freed, failures)
+        logger.info(f"Удалено задач: {report.tasks}, фото: {report.photos}, файлов: {report.files} "
+                    f"({report.bytes_freed} байт), ошибок: {len(report.failures)}")
+        return report
@@ -0,0 +1,112 @@
+"""Отправка записанных обновлений Telegram на webhook бота вместо Telegram.
+
+Файл с обновлениями — JSON-массив (как в ответе getUpdates, можно целиком с "result")
+или по одному объекту Update на строку.
+
+Нагрузочный прогон против локального бота: с --local бот слушает webhook на WEBHOOK_LISTEN:WEBHOOK_PORT,
+но вызовы Bot API уходят в поддельный клиент harness.fake_bot, а webhook в Telegram не регистрируется.
+База и фото создаются в рабочем каталоге, поэтому бота лучше запускать из отдельного каталога:
+
+    cd /tmp/replay && python /path/to/main.py --local
+    python replay_updates.py updates.json --repeat 10 --concurrency 20
+
+Против настоящего бота (python main.py --webhook) обновления обрабатываются как обычно,
+и ответы уходят пользователям через Telegram.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List
+import httpx
+from config import WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+
+
+def load_updates(path: str) -> List[Dict]:
+    with open(path, encoding='utf-8') as f:
+        text = f.read().strip()
+    if text.startswith('[') or text.startswith('{"ok"'):
+        data = json.loads(text)
+        return data['result'] if isinstance(data, dict) else data
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def replay(url: str, updates: List[Dict], secret: str, concurrency: int, rate: float) -> Dict:
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def post(client: httpx.AsyncClient, update: Dict):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=update, headers=headers)
+                if response.status_code != 200:
+                    errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=30) as client:
+        tasks = []
+        for idx, update in enumerate(updates):
+            if rate:
+                # Равномерный темп: idx-е обновление не раньше idx / rate секунд от начала
+                delay = started + idx / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(post(client, update)))
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return {
+        'sent': len(updates),
+        'errors': errors,
+        'elapsed': elapsed,
+        'rps': len(updates) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'mean': statistics.mean(latencies) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправить записанные обновления на webhook бота")
+    parser.add_argument("file", help="JSON с обновлениями (массив, ответ getUpdates или по объекту на строку)")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET_TOKEN, help="секретный токен webhook")
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз повторить набор обновлений")
+    parser.add_argument("--concurrency", type=int, default=10, help="одновременных запросов")
+    parser.add_argument("--rate", type=float, default=0, help="обновлений в секунду (0 — без ограничения)")
+    args = parser.parse_args()
+
+    recorded = load_updates(args.file)
+    updates = []
+    # update_id должны расти, как у настоящего Telegram
+    next_id = max((u.get('update_id', 0) for u in recorded), default=0) + 1
+    for round_no in range(args.repeat):
+        for update in recorded:
+            if round_no:
+                update = {**update, 'update_id': next_id}
+                next_id += 1
+            updates.append(update)
+
+    result = asyncio.run(replay(args.url, updates, args.secret, args.concurrency, args.rate))
+    print(f"Отправлено: {result['sent']} за {result['elapsed']:.2f} с ({result['rps']:.1f} обновлений/с)")
+    print(f"Задержка ответа: p50 {result['p50'] * 1000:.1f} мс, p95 {result['p95'] * 1000:.1f} мс, "
+          f"среднее {result['mean'] * 1000:.1f} мс")
+    if result['errors']:
+        print(f"Ошибки: {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()
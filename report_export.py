@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import zipfile
+from typing import Dict, List, NamedTuple, Optional
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# Боты могут отправлять документы до 50 МБ; оставляем запас на заголовки ZIP
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+PART_LIMIT = TELEGRAM_DOCUMENT_LIMIT - 1024 * 1024
+# Примерные накладные расходы ZIP на один файл (локальный заголовок + запись каталога)
+ZIP_ENTRY_OVERHEAD = 256
+
+
+class ReportArchive(NamedTuple):
+    """Части архива и фото, которые в него не вошли: одно такое фото больше лимита части"""
+    parts: List[str]
+    skipped: List[str]
+
+
+class ReportExporter:
+    """Сборка архивов с фото для отчёта.
+
+    Архив собирается в рабочем потоке без сжатия (JPEG всё равно не сжимается), при превышении
+    лимита Telegram делится на пронумерованные части. Готовые части кэшируются по набору фото:
+    повторная выгрузка без новых фото отправляет уже собранные (и загруженные в Telegram) файлы.
+    Части, которые вернул build, не удаляются при сборке другого набора, пока не вызван release.
+    """
+
+    def __init__(self, exports_dir: str, part_limit: int = PART_LIMIT):
+        self.exports_dir = exports_dir
+        self.part_limit = part_limit
+        self._lock = threading.Lock()
+        # file_id уже отправленных частей: повторная отправка без загрузки
+        self._document_file_ids: Dict[str, str] = {}
+        # Сколько выгрузок сейчас отправляет архив с этим ключом
+        self._in_use: Dict[str, int] = {}
+
+    @staticmethod
+    def _stat_photos(photos: List[Dict]) -> List[Dict]:
+        """Оставить только существующие файлы с известными размером и временем изменения.
+
+        Если file_size/file_mtime уже проверены (refresh_file_stats), файл повторно не трогаем.
+        """
+        result = []
+        for ph in photos:
+            path = ph.get('file_path')
+            if not path:
+                continue
+            if ph.get('file_size') is not None and ph.get('file_mtime') is not None:
+                result.append(ph)
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append({**ph, 'file_size': st.st_size, 'file_mtime': int(st.st_mtime)})
+        return result
+
+    @staticmethod
+    def cache_key(photos: List[Dict]) -> str:
+        """Ключ набора фото: пути, размеры и время изменения файлов"""
+        digest = hashlib.sha1()
+        for ph in sorted(photos, key=lambda p: p['file_path']):
+            digest.update(f"{ph['file_path']}|{ph['file_size']}|{ph['file_mtime']}\n".encode())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def _key_of(name: str) -> str:
+        """Ключ набора из имени файла кэша: report_<key>.json, report_<key>_partN.zip"""
+        return name[len("report_"):].split("_")[0].split(".")[0]
+
+    def _manifest_path(self, key: str) -> str:
+        return os.path.join(self.exports_dir, f"report_{key}.json")
+
+    def _load_cached(self, key: str) -> Optional[ReportArchive]:
+        try:
+            with open(self._manifest_path(key), encoding='utf-8') as f:
+                manifest = json.load(f)
+            archive = ReportArchive(manifest['parts'], manifest.get('skipped', []))
+        except (OSError, ValueError, KeyError):
+            return None
+        if all(os.path.exists(p) for p in archive.parts):
+            return archive
+        return None
+
+    def _evict_other(self, key: str):
+        """Удалить архивы прошлых выгрузок, чтобы не копить их на диске (кроме тех, что сейчас отправляются)"""
+        for name in os.listdir(self.exports_dir):
+            if name.startswith("report_") and self._key_of(name) != key and self._key_of(name) not in self._in_use:
+                path = os.path.join(self.exports_dir, name)
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error(f"Не удалось удалить старый архив {path}: {e}")
+                self._document_file_ids.pop(path, None)
+
+    @staticmethod
+    def _entry_size(ph: Dict) -> int:
+        return ph['file_size'] + ZIP_ENTRY_OVERHEAD + len(os.path.basename(ph['file_path']))
+
+    def _split(self, photos: List[Dict]) -> List[List[Dict]]:
+        """Разложить фото по частям не больше part_limit (фото больше лимита сюда не передаются)"""
+        parts: List[List[Dict]] = [[]]
+        size = 0
+        for ph in photos:
+            entry = self._entry_size(ph)
+            if parts[-1] and size + entry > self.part_limit:
+                parts.append([])
+                size = 0
+            parts[-1].append(ph)
+            size += entry
+        return parts
+
+    def _write_part(self, path: str, photos: List[Dict]):
+        tmp_path = path + ".tmp"
+        used_names = set()
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for ph in photos:
+                arcname = os.path.basename(ph['file_path'])
+                if arcname in used_names:
+                    arcname = f"{ph.get('task_id', 'x')}_{ph.get('id', len(used_names))}_{arcname}"
+                used_names.add(arcname)
+                # zf.write копирует файл блоками, не загружая его целиком в память
+                zf.write(ph['file_path'], arcname=arcname)
+        os.replace(tmp_path, path)
+
+    def build(self, photos: List[Dict]) -> ReportArchive:
+        """Собрать (или взять из кэша) архив с фото: пути к частям и фото, не вошедшие в архив.
+
+        Фото, которое одно больше лимита части, Telegram не примет ни в какой части — оно пропускается.
+        Части остаются на диске до release(parts), даже если тем временем собирается другой набор.
+        """
+        with self._lock:
+            os.makedirs(self.exports_dir, exist_ok=True)
+            photos = self._stat_photos(photos)
+            if not photos:
+                return ReportArchive([], [])
+            key = self.cache_key(photos)
+            cached = self._load_cached(key)
+            if cached:
+                logger.info(f"Архив отчёта {key} взят из кэша ({len(cached.parts)} ч.)")
+                self._in_use[key] = self._in_use.get(key, 0) + 1
+                return cached
+            self._evict_other(key)
+            skipped = [ph['file_path'] for ph in photos if self._entry_size(ph) > self.part_limit]
+            if skipped:
+                logger.warning(f"В архив отчёта не вошли фото больше {self.part_limit} байт: {', '.join(skipped)}")
+            photos = [ph for ph in photos if self._entry_size(ph) <= self.part_limit]
+            if not photos:
+                return ReportArchive([], skipped)
+            groups = self._split(photos)
+            parts = []
+            for idx, group in enumerate(groups, start=1):
+                path = os.path.join(self.exports_dir, f"report_{key}_part{idx}.zip")
+                self._write_part(path, group)
+                parts.append(path)
+            with open(self._manifest_path(key), 'w', encoding='utf-8') as f:
+                json.dump({'parts': parts, 'skipped': skipped, 'photos': len(photos)}, f)
+            logger.info(f"Собран архив отчёта {key}: {len(photos)} фото, {len(parts)} ч.")
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            return ReportArchive(parts, skipped)
+
+    def release(self, parts: List[str]):
+        """Архив, который вернул build, больше не отправляется: его снова можно удалить"""
+        if not parts:
+            return
+        key = self._key_of(os.path.basename(parts[0]))
+        with self._lock:
+            if self._in_use.get(key, 0) <= 1:
+                self._in_use.pop(key, None)
+            else:
+                self._in_use[key] -= 1
+
+    async def build_async(self, photos: List[Dict]) -> ReportArchive:
+        """Собрать архив в рабочем потоке, не блокируя event loop"""
+        return await asyncio.to_thread(self.build, photos)
+
+    async def send_parts(self, bot, chat_id: int, parts: List[str], timestamp: str):
+        """Отправить части архива; уже загруженные части отправляются по file_id"""
+        total = len(parts)
+        for idx, path in enumerate(parts, start=1):
+            filename = f"report_photos_{timestamp}.zip" if total == 1 else f"report_photos_{timestamp}_part{idx}of{total}.zip"
+            file_id = self._document_file_ids.get(path)
+            if file_id:
+                try:
+                    await bot.send_document(chat_id=chat_id, document=file_id, filename=filename)
+                    continue
+                except BadRequest as e:
+                    logger.warning(f"Telegram отклонил file_id архива, загружаю файл заново: {e}")
+                    self._document_file_ids.pop(path, None)
+            with open(path, 'rb') as f:
+                message = await bot.send_document(chat_id=chat_id, document=f, filename=filename,
+                                                  read_timeout=120, write_timeout=120)
+            if message and message.document:
+                self._document_file_ids[path] = message.document.file_id
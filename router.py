@@ -0,0 +1,178 @@
+import logging
+import time
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+from telegram import CallbackQuery, Update
+from telegram.ext import ContextTypes
+from instrumentation import set_route
+
+logger = logging.getLogger(__name__)
+
+ACCESS_DENIED_TEXT = "❌ У вас нет доступа к этой функции."
+UNKNOWN_COMMAND_TEXT = "❌ Неизвестная команда. Попробуйте /start"
+# Обработка нажатия дольше этого времени попадает в журнал как предупреждение
+SLOW_ROUTE_SECONDS = 2.0
+
+
+class CallbackCall(NamedTuple):
+    """Разобранное нажатие кнопки, которое получает обработчик маршрута"""
+    query: CallbackQuery
+    user_id: int
+    username: str
+    data: str
+    role: str
+    arg: str  # часть callback_data после префикса маршрута ('' для точного совпадения)
+
+
+RouteHandler = Callable[[Update, ContextTypes.DEFAULT_TYPE, CallbackCall], Awaitable[None]]
+AccessCheck = Callable[[int, str], bool]
+
+
+class Route(NamedTuple):
+    name: str
+    handler: RouteHandler
+    role: Optional[str]
+    access: Optional[AccessCheck]
+
+    def allows(self, user_id: int, role: str) -> bool:
+        if self.role and role != self.role:
+            return False
+        if self.access and not self.access(user_id, role):
+            return False
+        return True
+
+
+class RouteStats:
+    __slots__ = ("calls", "errors", "total", "max")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def as_dict(self) -> Dict:
+        return {'calls': self.calls, 'errors': self.errors, 'total': self.total,
+                'avg': self.total / self.calls if self.calls else 0.0, 'max': self.max}
+
+
+class _TrieNode:
+    __slots__ = ("children", "route")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.route: Optional[Route] = None
+
+
+class CallbackRouter:
+    """Диспетчер callback_data: точные значения — поиск в словаре, префиксы — в префиксном дереве.
+
+    Из префиксов выбирается самый длинный подходящий, поэтому порядок регистрации не важен
+    (task_ и tasks_page_ не перекрывают друг друга). Требования к роли проверяются до ответа
+    на callback по роли из кэша пользователей; для каждого маршрута собирается время обработки.
+    """
+
+    def __init__(self, role_loader: Callable[[int], Awaitable[Optional[str]]], default_role: str = "executor"):
+        self._role_loader = role_loader
+        self._default_role = default_role
+        self._exact: Dict[str, Route] = {}
+        self._prefixes = _TrieNode()
+        self._stats: Dict[str, RouteStats] = {}
+
+    def exact(self, data: str, role: Optional[str] = None, access: Optional[AccessCheck] = None):
+        """Декоратор: обработчик для callback_data, равного data"""
+        def register(handler: RouteHandler) -> RouteHandler:
+            if data in self._exact:
+                raise ValueError(f"Маршрут {data!r} уже зарегистрирован")
+            self._exact[data] = Route(data, handler, role, access)
+            return handler
+        return register
+
+    def prefix(self, prefix: str, role: Optional[str] = None, access: Optional[AccessCheck] = None):
+        """Декоратор: обработчик для callback_data, начинающихся с prefix"""
+        def register(handler: RouteHandler) -> RouteHandler:
+            node = self._prefixes
+            for char in prefix:
+                node = node.children.setdefault(char, _TrieNode())
+            if node.route is not None:
+                raise ValueError(f"Маршрут {prefix!r}* уже зарегистрирован")
+            node.route = Route(prefix + "*", handler, role, access)
+            return handler
+        return register
+
+    def resolve(self, data: str) -> Optional[Tuple[Route, str]]:
+        """Найти маршрут для callback_data: (маршрут, часть после префикса) или None"""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, ""
+        node = self._prefixes
+        best: Optional[Tuple[Route, str]] = None
+        for idx, char in enumerate(data):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.route is not None:
+                best = (node.route, data[idx + 1:])
+        return best
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        if not query:
+            return
+        data = query.data
+        user_id = query.from_user.id
+        if not data:
+            logger.error("пустой callback_data")
+            try:
+                await query.answer("❌ Ошибка: пустой callback_data")
+            except Exception:
+                pass
+            return
+
+        match = self.resolve(data)
+        if match is None:
+            set_route("неизвестная кнопка")
+            logger.warning(f"Неизвестный callback_data: {data}")
+            try:
+                await query.answer(UNKNOWN_COMMAND_TEXT)
+            except Exception:
+                pass
+            return
+        route, arg = match
+        set_route(route.name)
+
+        role = await self._role_loader(user_id) or self._default_role
+        if not route.allows(user_id, role):
+            logger.info(f"Отказано в доступе: user_id={user_id}, role={role}, маршрут {route.name}")
+            try:
+                await query.answer(ACCESS_DENIED_TEXT, show_alert=True)
+            except Exception:
+                pass
+            return
+
+        # Отвечаем на callback сразу, чтобы у пользователя пропали «часики» на кнопке
+        try:
+            await query.answer()
+        except Exception as e:
+            logger.error(f"Не удалось ответить на callback: {e}")
+
+        call = CallbackCall(query, user_id, query.from_user.username or "Пользователь", data, role, arg)
+        stats = self._stats.setdefault(route.name, RouteStats())
+        started = time.perf_counter()
+        try:
+            await route.handler(update, context, call)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.calls += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            if elapsed >= SLOW_ROUTE_SECONDS:
+                logger.warning(f"Медленная обработка кнопки {route.name}: {elapsed:.2f} с (callback_data={data})")
+            else:
+                logger.debug(f"Кнопка {route.name} обработана за {elapsed * 1000:.1f} мс")
+
+    def stats(self) -> Dict[str, Dict]:
+        """Статистика времени обработки по маршрутам"""
+        return {name: s.as_dict() for name, s in self._stats.items()}
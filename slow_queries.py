@@ -0,0 +1,138 @@
+"""Журнал медленных SQL-запросов.
+
+CountingCursor в database.py замеряет каждый запрос (выполнение и чтение строк) и передаёт сюда
+те, что дольше SLOW_QUERY_THRESHOLD_MS. Для них записываются метод Database, текст запроса, форма
+параметров (типы, без значений) и план EXPLAIN QUERY PLAN; полный просмотр tasks, users или
+task_photos помечается отдельно. Записи идут в ротируемый файл и в сводку для команды /slowlog.
+"""
+import logging
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+from config import SLOW_QUERY_LOG, SLOW_QUERY_LOG_BACKUPS, SLOW_QUERY_LOG_MAX_BYTES
+
+logger = logging.getLogger("slow_queries")
+
+# Таблицы, полный просмотр которых растёт вместе с историей
+WATCHED_TABLES = ("tasks", "users", "task_photos")
+# «SCAN tasks» (SQLite 3.36+) или «SCAN TABLE tasks», в том числе в порядке индекса (USING INDEX):
+# читается вся таблица или весь индекс, в отличие от SEARCH
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)\b")
+# Сколько разных запросов хранить в сводке для /slowlog и сколько планов держать в кэше
+MAX_ENTRIES = 100
+MAX_PLANS = 500
+# Сводка для /slowlog должна поместиться в одно сообщение Telegram (4096 символов)
+MAX_SUMMARY_LENGTH = 4000
+SQL_PREVIEW = 200
+SHAPE_PREVIEW = 100
+
+_plans: Dict[str, List[str]] = {}
+_entries: "OrderedDict[str, Dict]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def configure(path: str = SLOW_QUERY_LOG):
+    """Писать медленные запросы в отдельный ротируемый файл (не в общий журнал)"""
+    handler = RotatingFileHandler(path, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS,
+                                  encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def params_shape(parameters: Any, many: bool = False) -> str:
+    """Типы параметров без значений: (int, str, None); для executemany — число наборов"""
+    if many:
+        rows = list(parameters) if not isinstance(parameters, list) else parameters
+        return f"{len(rows)} × {params_shape(rows[0])}" if rows else "0 наборов"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    return "(" + ", ".join("None" if value is None else type(value).__name__ for value in parameters) + ")"
+
+
+def _explain(conn: sqlite3.Connection, sql: str, parameters: Any) -> List[str]:
+    plan = _plans.get(sql)
+    if plan is None:
+        try:
+            # Обычный курсор: EXPLAIN не должен попадать в счётчики и замеры CountingCursor
+            rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+            plan = [row[3] for row in rows]
+        except sqlite3.Error:
+            # BEGIN, COMMIT, PRAGMA и DDL плана не имеют
+            plan = []
+        if len(_plans) >= MAX_PLANS:
+            _plans.clear()
+        _plans[sql] = plan
+    return plan
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """Таблицы из WATCHED_TABLES, которые план читает целиком"""
+    scans = []
+    for detail in plan:
+        match = FULL_SCAN.match(detail)
+        if match and match.group(1) in WATCHED_TABLES:
+            scans.append(match.group(1))
+    return list(dict.fromkeys(scans))
+
+
+def record(conn: sqlite3.Connection, method: str, sql: str, parameters: Any, many: bool, elapsed: float):
+    """Записать медленный запрос: строка в журнал и обновление сводки"""
+    sample = (next(iter(parameters), ()) if many else parameters) if parameters else ()
+    plan = _explain(conn, sql, sample)
+    scans = full_scans(plan)
+    text = " ".join(sql.split())
+    with _lock:
+        entry = _entries.pop(text, None) or {'sql': text, 'method': method, 'count': 0, 'max': 0.0, 'total': 0.0,
+                                             'scans': scans, 'plan': plan}
+        entry['count'] += 1
+        entry['total'] += elapsed
+        entry['max'] = max(entry['max'], elapsed)
+        entry['method'] = method
+        entry['shape'] = params_shape(parameters, many)
+        entry['last'] = datetime.now()
+        _entries[text] = entry
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+    flag = f" ПОЛНЫЙ ПРОСМОТР {', '.join(scans)}" if scans else ""
+    logger.info(f"{elapsed * 1000:.1f} мс {method}{flag}\n  SQL: {text}\n  Параметры: {entry['shape']}"
+                + "".join(f"\n  План: {detail}" for detail in plan))
+
+
+def summary(limit: int = 10) -> List[Dict]:
+    """Самые медленные запросы с момента запуска (по максимальному времени)"""
+    with _lock:
+        entries = [dict(entry) for entry in _entries.values()]
+    return sorted(entries, key=lambda entry: -entry['max'])[:limit]
+
+
+def _shorten(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def format_summary(limit: int = 10, threshold_ms: Optional[float] = None,
+                   max_length: int = MAX_SUMMARY_LENGTH) -> str:
+    """Текст для /slowlog: не длиннее max_length, лишние запросы отбрасываются с пометкой"""
+    entries = summary(limit)
+    header = "🐢 Медленные запросы" + (f" (дольше {threshold_ms:g} мс)" if threshold_ms is not None else "")
+    if not entries:
+        return header + ": пока не было."
+    text = header + ":"
+    for idx, entry in enumerate(entries):
+        flag = f" ⚠️ полный просмотр {', '.join(entry['scans'])}" if entry['scans'] else ""
+        block = (f"\n\n{entry['method']}: {entry['count']} раз, макс. {entry['max'] * 1000:.0f} мс, "
+                 f"в среднем {entry['total'] / entry['count'] * 1000:.0f} мс{flag}\n"
+                 f"{_shorten(entry['sql'], SQL_PREVIEW)}\n"
+                 f"Параметры: {_shorten(entry['shape'], SHAPE_PREVIEW)}")
+        rest = f"\n\n… и ещё {len(entries) - idx} (полностью — в {SLOW_QUERY_LOG})"
+        # Место под пометку об оставшихся нужно, только если этот запрос не последний
+        reserve = len(rest) if idx < len(entries) - 1 else 0
+        if len(text) + len(block) + reserve > max_length:
+            return text + rest
+        text += block
+    return text
@@ -0,0 +1,13 @@
+"""Общая настройка тестов: бот работает во временном каталоге.
+
+handlers при импорте открывает restaurant_cleaner.db и photos/ относительно рабочего каталога,
+поэтому каталог меняется до того, как тесты импортируют модули бота.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness.runtime import enter_workdir  # noqa: E402
+
+WORKDIR = enter_workdir()
@@ -0,0 +1,111 @@
+"""Медленный запрос в одном потоке БД не задерживает обработку других обновлений.
+
+Проверяется порядок, а не время: медленный запрос держит поток, пока тест его не отпустит,
+и быстрые вызовы должны закончиться раньше. Таймаут только защищает от зависания,
+если фасад всё-таки поставит их в очередь за медленным.
+"""
+import asyncio
+import threading
+import pytest
+from async_database import AsyncDatabase
+from database import Database
+
+# Сколько ждать вызов, прежде чем считать, что он стоит в очереди за медленным запросом
+DEADLOCK_TIMEOUT = 10.0
+
+
+class Gate:
+    """Точка, на которой медленный запрос ждёт, пока тест его не отпустит"""
+
+    def __init__(self):
+        self.entered = threading.Event()
+        self.released = threading.Event()
+
+    def hold(self, *args):
+        self.entered.set()
+        if not self.released.wait(DEADLOCK_TIMEOUT):
+            raise RuntimeError("медленный запрос так и не отпустили")
+
+
+class SlowDatabase(Database):
+    def get_slow_report(self, gate: Gate) -> int:
+        """Запрос чтения, который держит поток чтения, пока gate не отпустят"""
+        with self.transaction(readonly=True) as cursor:
+            cursor.connection.create_function("pause", 0, gate.hold)
+            cursor.execute("SELECT pause()")
+            cursor.fetchall()
+            cursor.execute("SELECT COUNT(*) FROM tasks")
+            return cursor.fetchone()[0]
+
+    def hold_writer(self, gate: Gate) -> int:
+        """Запись, которая держит поток записи и блокировку записи, пока gate не отпустят"""
+        with self.transaction() as cursor:
+            cursor.execute("UPDATE tasks SET comment = comment")
+            gate.hold()
+            return cursor.rowcount
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = AsyncDatabase(SlowDatabase(str(tmp_path / "bot.db")))
+    database.sync.set_user_role(1, "manager1", "manager", None)
+    database.sync.set_user_role(2, "executor2", "executor", "Зал")
+    database.sync.create_task(1, "file", "photos/a.jpg", "Протереть столы", "Зал")
+    yield database
+    database.close()
+
+
+async def _while_blocked(block, check):
+    """Занять поток БД вызовом block(gate) и выполнить check, пока он не отпущен"""
+    gate = Gate()
+    blocked = asyncio.ensure_future(block(gate))
+    try:
+        assert await asyncio.to_thread(gate.entered.wait, DEADLOCK_TIMEOUT), "медленный запрос не начался"
+        result = await asyncio.wait_for(check(), DEADLOCK_TIMEOUT)
+        assert not blocked.done(), "медленный запрос закончился раньше проверки"
+    finally:
+        gate.released.set()
+    assert await blocked == 1
+    return result
+
+
+def test_slow_query_does_not_delay_user_lookup(db):
+    async def check():
+        # Без кэша: get_user_role идёт в базу через другой поток чтения
+        db.sync.users.clear()
+        return await db.get_user_role(1)
+
+    assert asyncio.run(_while_blocked(db.get_slow_report, check)) == "manager"
+
+
+def test_slow_query_does_not_delay_category_keyboard(db, monkeypatch):
+    import handlers
+    monkeypatch.setattr(handlers, "db", db)
+
+    async def check():
+        db.sync._task_counters_changed()
+        return await handlers.build_category_keyboard()
+
+    keyboard = asyncio.run(_while_blocked(db.get_slow_report, check))
+    assert any("Зал - 1 задача" in row[0].text for row in keyboard)
+
+
+def test_slow_write_does_not_delay_reads(db):
+    async def check():
+        # Поток записи занят открытой транзакцией; чтение (WAL) идёт в своём потоке
+        db.sync.users.clear()
+        return await db.get_user_role(2), await db.count_open_tasks_by_category()
+
+    role, counts = asyncio.run(_while_blocked(db.hold_writer, check))
+    assert role == "executor"
+    assert counts == {"Зал": 1}
+
+
+def test_slow_query_does_not_block_event_loop(db):
+    async def check():
+        # Пока поток чтения занят, цикл событий продолжает обслуживать другие задачи
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+        return True
+
+    assert asyncio.run(_while_blocked(db.get_slow_report, check))
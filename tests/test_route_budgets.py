@@ -0,0 +1,24 @@
+"""Бюджеты SQL-запросов и вызовов Bot API на одно обновление (harness/budgets.py).
+
+Смена прогоняется один раз поверх архива утверждённых задач; каждый маршрут проверяется
+отдельно, чтобы при превышении было видно, какой обработчик вернул лишние запросы.
+"""
+import asyncio
+import pytest
+from harness import budgets
+
+
+@pytest.fixture(scope="module")
+def worst():
+    return asyncio.run(budgets.run(budgets.parse_args([])))
+
+
+def test_every_route_has_budget(worst):
+    assert sorted(set(worst) - set(budgets.BUDGETS)) == []
+
+
+@pytest.mark.parametrize("route", sorted(budgets.BUDGETS))
+def test_route_within_budget(worst, route):
+    assert route in worst, f"смена не открыла маршрут {route}"
+    over = budgets.check({route: worst[route]}).get(route)
+    assert not over, f"{route}: превышен бюджет (поле, факт, бюджет): {over}"
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from instrumentation import track
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений может ждать своей очереди (на каждое место обработки)
+PENDING_PER_SLOT = 8
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    Обновления разных пользователей обрабатываются одновременно (не больше max_concurrent_updates),
+    а обновления одного пользователя — строго по очереди: состояние в context.user_data
+    (creating_task, completing_task, album_id, ...) не меняется двумя обработчиками сразу.
+    Работа каждого обновления (запросы к БД, вызовы Bot API) считается через instrumentation.track.
+    """
+
+    __slots__ = ("_locks", "_waiters", "_running")
+
+    def __init__(self, max_concurrent_updates: int):
+        # Семафор базового класса ограничивает число принятых обновлений, а не выполняемых:
+        # иначе обновления одного занятого пользователя, ждущие своей очереди, заняли бы все места
+        super().__init__(max_concurrent_updates * PENDING_PER_SLOT)
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # Сколько обновлений пользователя сейчас обрабатывается или ждёт: lock удаляется, когда их нет
+        self._waiters: Dict[int, int] = {}
+
+    @staticmethod
+    def _key(update: object) -> Optional[int]:
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._key(update)
+        if key is None:
+            async with self._running:
+                with track(update):
+                    await coroutine
+            return
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock, self._running:
+                with track(update):
+                    await coroutine
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    @property
+    def pending_updates(self) -> int:
+        """Сколько обновлений сейчас обрабатывается или ждёт очереди своего пользователя"""
+        return sum(self._waiters.values())
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._locks:
+            logger.info(f"Остановка обработки обновлений: ещё заняты {len(self._locks)} пользователей")
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+# Ограничения кэша по умолчанию
+DEFAULT_MAX_SIZE = 2048
+DEFAULT_TTL = 300  # секунд
+
+
+class UserInfo(NamedTuple):
+    username: Optional[str]
+    role: Optional[str]
+    category: Optional[str]
+
+
+class UserDirectory:
+    """Кэш user_id → (username, role, category) с ограничением размера (LRU) и временем жизни записей.
+
+    Промахи загружаются одним запросом через loader. Отсутствующие в БД пользователи тоже
+    кэшируются (как None), чтобы повторные обращения не ходили в базу.
+    """
+
+    def __init__(self, loader: Callable[[Iterable[int]], Dict[int, UserInfo]],
+                 max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL):
+        self._loader = loader
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Меняется при каждой инвалидации: загрузка, начатая раньше, не попадёт в кэш
+        self._generation = 0
+
+    def get(self, user_id: int) -> Optional[UserInfo]:
+        return self.get_many([user_id])[user_id]
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, Optional[UserInfo]]:
+        """Данные пользователей по списку id; промахи загружаются одним запросом"""
+        result: Dict[int, Optional[UserInfo]] = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            # Повторы в списке не должны попадать в запрос несколько раз
+            for user_id in dict.fromkeys(user_ids):
+                entry = self._entries.get(user_id)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(user_id)
+                    result[user_id] = entry[1]
+                else:
+                    missing.append(user_id)
+            generation = self._generation
+        if not missing:
+            return result
+
+        loaded = self._loader(missing)
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            cache = generation == self._generation
+            for user_id in missing:
+                info = loaded.get(user_id)
+                result[user_id] = info
+                if cache:
+                    self._entries[user_id] = (expires, info)
+                    self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, user_id: int):
+        """Сбросить запись пользователя (вызывается после изменения users)"""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()